@@ -1,7 +1,7 @@
 # /modular_store_backend/app.py
 import logging
 import os
-from datetime import datetime
+import sys
 from datetime import timedelta
 from typing import Any
 
@@ -13,11 +13,17 @@ from flask_login import current_user, logout_user
 from werkzeug.wrappers.response import Response
 
 from modular_store_backend.modules import init_modules
+from modular_store_backend.modules.catalog_index import build_catalog_index
+from modular_store_backend.modules.commands import register_commands
 from modular_store_backend.modules.db.database import db
-from modular_store_backend.modules.db.models import Cart, Notification
 from modular_store_backend.modules.error_handlers import create_error_handlers
 from modular_store_backend.modules.extensions import init_extensions
+from modular_store_backend.modules.header_context import get_header_context
 from modular_store_backend.modules.logger import DatabaseLogger
+from modular_store_backend.modules.presence import presence_tracker
+from modular_store_backend.modules.query_stats import query_instrumentation
+from modular_store_backend.modules.search_index import build_search_index
+from modular_store_backend.modules.startup_profiler import StartupProfiler, profiling_enabled
 
 
 def load_config(config_path: str) -> Any:
@@ -39,14 +45,17 @@ def load_config(config_path: str) -> Any:
 
 
 def create_app(config_path: str = './modular_store_backend/config.yaml', config: Any = None) -> Flask:
-    if config is None:
-        config = load_config(config_path)
+    profiler = StartupProfiler()
 
-    current_app = Flask(__name__,
-                        template_folder=os.path.abspath(config.get('TEMPLATE_FOLDER')),
-                        static_folder=os.path.abspath(config.get('STATIC_FOLDER')))
+    with profiler.stage('config'):
+        if config is None:
+            config = load_config(config_path)
 
-    current_app.config.update(config)
+        current_app = Flask(__name__,
+                            template_folder=os.path.abspath(config.get('TEMPLATE_FOLDER')),
+                            static_folder=os.path.abspath(config.get('STATIC_FOLDER')))
+
+        current_app.config.update(config)
 
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
@@ -54,12 +63,29 @@ def create_app(config_path: str = './modular_store_backend/config.yaml', config:
     db.init_app(current_app)
 
     with current_app.app_context():
-        db.init_db()
-        DatabaseLogger(current_app)
-        init_extensions(current_app)
-        create_error_handlers(current_app)
-        init_modules(current_app)
-        register_request_handlers(current_app)
+        with profiler.stage('db.init_db'):
+            db.init_db()
+        with profiler.stage('request logger'):
+            query_instrumentation.init_app(current_app)
+            DatabaseLogger(current_app)
+        with profiler.stage('extensions'):
+            init_extensions(current_app)
+        with profiler.stage('search index'):
+            build_search_index(current_app)
+        with profiler.stage('catalog index'):
+            build_catalog_index(current_app)
+        with profiler.stage('error handlers'):
+            create_error_handlers(current_app)
+        with profiler.stage('blueprints'):
+            init_modules(current_app)
+        with profiler.stage('request handlers'):
+            register_request_handlers(current_app)
+
+    current_app.extensions['startup_profile'] = profiler
+    register_commands(current_app)
+    if profiling_enabled():
+        # No logging handler is configured this early, write straight to stderr
+        print(profiler.format_report(), file=sys.stderr)
 
     return current_app
 
@@ -73,16 +99,13 @@ def register_request_handlers(current_app: Flask) -> None:
 
     @current_app.before_request
     def before_request() -> None:
-        g.total_items, g.total_amount, g.discount_percentage = Cart.cart_info()
+        header_context = get_header_context()
 
-        if current_user.is_authenticated:
-            g.mini_cart_items = db.session.query(Cart).filter_by(user_id=current_user.id).all()
-            g.unread_notifications_count = db.session.query(Notification).filter_by(
-                user_id=current_user.id, read=False
-            ).count()
-        else:
-            g.mini_cart_items = []
-            g.unread_notifications_count = 0
+        g.total_items = header_context['total_items']
+        g.total_amount = header_context['total_amount']
+        g.discount_percentage = header_context['discount_percentage']
+        g.mini_cart_items = header_context['mini_cart_items']
+        g.unread_notifications_count = header_context['unread_notifications_count']
 
     @current_app.context_processor
     def inject_cart_info() -> dict[str, Any]:
@@ -97,8 +120,7 @@ def register_request_handlers(current_app: Flask) -> None:
     @current_app.after_request
     def after_request(response: Response) -> ResponseValue:
         if current_user.is_authenticated:
-            current_user.last_seen = datetime.utcnow()
-            db.session.commit()
+            presence_tracker.touch(current_user.id)
             if current_user.is_session_expired(current_app.config['PERMANENT_SESSION_LIFETIME']):
                 logout_user()
                 db.session.remove()
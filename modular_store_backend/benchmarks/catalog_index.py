@@ -0,0 +1,103 @@
+# /modular_store_backend/benchmarks/catalog_index.py
+"""
+Latency of a product list page (count and one page of products) through the SQL query of filter_products against
+the catalog index, for the filter combinations of the /filter page. 'select ms' is the index lookup alone.
+
+Run with: python -m modular_store_backend.benchmarks.catalog_index [--products 100000 --repeat 20]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Any
+
+from modular_store_backend.app import create_app, load_config
+from modular_store_backend.benchmarks.product_search import seed_products
+from modular_store_backend.modules.catalog_index import build_catalog_index, catalog_index
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.filter.utils import filter_products, paginate_query, select_products
+
+CRITERIA = [
+    ('default listing', {}),
+    ('category', {'category_query': 2}),
+    ('category by price', {'category_query': 2, 'sort_by': 'price_asc'}),
+    ('tag by rating', {'tag_query': 'eco', 'sort_by': 'rating'}),
+    ('band on sale', {'price_band': '1000-2500', 'on_sale': True}),
+    ('all by price desc', {'in_stock': False, 'sort_by': 'price_desc'}),
+]
+
+
+def _median_ms(timings: list[float]) -> float:
+    return statistics.median(timings) * 1000
+
+
+def _time_page(criteria: dict[str, Any], repeat: int, indexed: bool) -> tuple[float, int]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        products = select_products(**criteria) if indexed else filter_products(**criteria)
+        _, total, _, _ = paginate_query(products, 1)
+        timings.append(time.perf_counter() - started)
+        db.session.rollback()
+    return _median_ms(timings), total
+
+
+def run_benchmark(products: int, repeat: int) -> list[dict[str, Any]]:
+    """
+    Seed a fresh database file, build the catalog index and time a page for every filter of CRITERIA.
+
+    :param products: Number of products to create
+    :param repeat: Runs per filter and path, the median is reported
+    :return: Per filter: SQL and indexed page latency, index lookup latency in ms, and the page totals
+    """
+    directory = tempfile.mkdtemp()
+    config = load_config(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.yaml'))
+    config.update({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'benchmark.db')}",
+        'REQUEST_LOG_ASYNC': False,
+        'SQL_INSTRUMENTATION_ENABLED': False,
+    })
+    app = create_app(config=config)
+
+    results = []
+    try:
+        with app.app_context():
+            seed_products(products)
+            started = time.perf_counter()
+            build_catalog_index(app)
+            print(f"Indexed {len(catalog_index)} products in {time.perf_counter() - started:.2f} s")
+            for label, criteria in CRITERIA:
+                sql_ms, sql_total = _time_page(criteria, repeat, indexed=False)
+                index_ms, index_total = _time_page(criteria, repeat, indexed=True)
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    select_products(**criteria)
+                    timings.append(time.perf_counter() - started)
+                results.append({'filter': label, 'sql ms': sql_ms, 'index ms': index_ms,
+                                'select ms': _median_ms(timings), 'sql total': sql_total, 'index total': index_total})
+            db.session.remove()
+        db.engine.dispose()
+    finally:
+        catalog_index.clear()
+        shutil.rmtree(directory)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'filter':<20} {'sql ms':>9} {'index ms':>9} {'select ms':>10} {'sql total':>10} {'index total':>12}")
+    for result in run_benchmark(args.products, args.repeat):
+        print(f"{result['filter']:<20} {result['sql ms']:9.2f} {result['index ms']:9.2f} {result['select ms']:10.3f} "
+              f"{result['sql total']:10d} {result['index total']:12d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# /modular_store_backend/benchmarks/order_persistence.py
+"""
+Latency, SQL statements and commits of save_purchase_history for orders of several items.
+
+Run with: python -m modular_store_backend.benchmarks.order_persistence [--orders 200 --items 5]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from typing import Any
+
+from flask_login import login_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from modular_store_backend.app import create_app, load_config
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Address, Cart, Product, ShippingMethod, User
+from modular_store_backend.modules.purchase_history import save_purchase_history
+
+
+class WriteCounter:
+    """Counts the statements and commits an engine runs while attached."""
+
+    def __init__(self, engine: Engine) -> None:
+        self.engine = engine
+        self.statements = 0
+        self.commits = 0
+
+    def __enter__(self) -> 'WriteCounter':
+        event.listen(self.engine, 'before_cursor_execute', self._count_statement)
+        event.listen(self.engine, 'commit', self._count_commit)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        event.remove(self.engine, 'before_cursor_execute', self._count_statement)
+        event.remove(self.engine, 'commit', self._count_commit)
+
+    def _count_statement(self, *args: Any) -> None:
+        self.statements += 1
+
+    def _count_commit(self, *args: Any) -> None:
+        self.commits += 1
+
+
+def run_benchmark(orders: int, items: int) -> dict[str, Any]:
+    """
+    Save orders through save_purchase_history against a fresh database file.
+
+    :param orders: Number of orders to save
+    :param items: Number of different products per order
+    :return: Mean and p95 latency in ms, statements and commits per order
+    """
+    directory = tempfile.mkdtemp()
+    config = load_config(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.yaml'))
+    config.update({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'benchmark.db')}",
+        'REQUEST_LOG_ASYNC': False,
+        'SQL_INSTRUMENTATION_ENABLED': False,
+    })
+    app = create_app(config=config)
+
+    latencies = []
+    with app.test_request_context():
+        user = User(username='benchmark', email='benchmark@example.com', password='-')
+        products = [Product(samplename=f'product {index}', price=1000, stock=orders * 10) for index in range(items)]
+        shipping_method = ShippingMethod(name='Standard', price=500)
+        db.session.add_all([user, shipping_method, *products])
+        db.session.flush()
+        address = Address(user_id=user.id, address_line1='1 Benchmark St', city='City', state='ST', zip_code='1',
+                          country='Country')
+        db.session.add(address)
+        db.session.commit()
+        login_user(user)
+
+        cart_items = [Cart(user_id=user.id, product_id=product.id, quantity=2, price=product.price)
+                      for product in products]
+        with WriteCounter(db.engine) as counter:
+            for _ in range(orders):
+                started = time.perf_counter()
+                save_purchase_history(db.session, cart_items, address.id, shipping_method.id, 'benchmark', 'b')
+                latencies.append(time.perf_counter() - started)
+        db.session.remove()
+
+    db.engine.dispose()
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+    return {
+        'mean ms': statistics.mean(latencies) * 1000,
+        'p95 ms': statistics.quantiles(latencies, n=20)[-1] * 1000,
+        'statements/order': counter.statements / orders,
+        'commits/order': counter.commits / orders,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=200)
+    parser.add_argument('--items', type=int, default=5)
+    args = parser.parse_args()
+
+    result = run_benchmark(args.orders, args.items)
+    print(f"{args.items} items per order: mean {result['mean ms']:.2f} ms  p95 {result['p95 ms']:.2f} ms  "
+          f"statements/order {result['statements/order']:.1f}  commits/order {result['commits/order']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# /modular_store_backend/benchmarks/product_search.py
+"""
+Search latency of the FTS5 index against the former lower(samplename) LIKE scan, for the count and first page
+the search page runs.
+
+Run with: python -m modular_store_backend.benchmarks.product_search [--products 100000 --repeat 20]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Any, Callable
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Query
+
+from modular_store_backend.app import create_app, load_config
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Category, Product, Tag, products_tags
+from modular_store_backend.modules.filter.utils import filter_products
+
+ADJECTIVES = ['light', 'heavy', 'compact', 'wireless', 'classic', 'premium', 'rugged', 'smart', 'vintage', 'mini',
+              'portable', 'ergonomic', 'waterproof', 'organic', 'steel', 'wooden', 'leather', 'cotton', 'digital']
+NOUNS = ['backpack', 'lamp', 'jacket', 'headphones', 'kettle', 'chair', 'desk', 'camera', 'speaker', 'mug', 'tent',
+         'blender', 'watch', 'keyboard', 'mouse', 'bottle', 'wallet', 'sneakers', 'blanket', 'grinder', 'router']
+FILLER = ['with', 'for', 'and', 'the', 'daily', 'use', 'travel', 'home', 'office', 'outdoor', 'quality', 'design',
+          'durable', 'easy', 'clean', 'gift', 'set', 'edition', 'warranty', 'battery', 'charging', 'fabric']
+QUERIES = ['lamp', 'wireless headphones', 'waterproof', 'grind', 'travel', 'zzzz']
+VOCABULARY_SIZE = 5000
+
+
+def _vocabulary(rng: random.Random) -> tuple[list[str], list[float]]:
+    # Description words follow Zipf's law like real text: the filler words are common, most words are rare
+    words = FILLER + NOUNS + ADJECTIVES
+    while len(words) < VOCABULARY_SIZE:
+        words.append(''.join(rng.choice('bcdfgklmnprstvz') + rng.choice('aeiou') for _ in range(rng.randint(2, 4))))
+    return words, [1 / rank for rank in range(1, len(words) + 1)]
+
+
+def seed_products(products: int) -> None:
+    rng = random.Random(42)
+    categories = [Category(name=name) for name in ('Electronics', 'Home', 'Outdoor', 'Office', 'Fashion')]
+    tags = [Tag(name=name) for name in ('sale', 'new', 'eco', 'bestseller', 'gift')]
+    db.session.add_all(categories + tags)
+    db.session.commit()
+
+    words, weights = _vocabulary(rng)
+    batch = []
+    for index in range(1, products + 1):
+        name = f"{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS).title()} {index}"
+        description = ' '.join(rng.choices(words, weights, k=30))
+        batch.append({'id': index, 'samplename': name, 'description': description, 'price': rng.randint(500, 50000),
+                      'stock': rng.randint(0, 50), 'category_id': rng.choice(categories).id})
+        if len(batch) == 5000:
+            db.session.execute(insert(Product), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Product), batch)
+    db.session.execute(insert(products_tags), [{'product_id': index, 'tag_id': rng.choice(tags).id}
+                                               for index in range(1, products + 1, 3)])
+    db.session.commit()
+
+
+def _like_query(name_query: str) -> Query[Product]:
+    return (db.session.query(Product).filter(Product.stock > 0)
+            .filter(func.lower(Product.samplename).contains(name_query.lower())))
+
+
+def _measure(build: Callable[[str], Query[Product]], name_query: str, repeat: int, per_page: int) -> dict[str, Any]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        query = build(name_query)
+        total = query.order_by(None).count()
+        query.limit(per_page).all()
+        timings.append(time.perf_counter() - started)
+        db.session.rollback()
+    return {'ms': statistics.median(timings) * 1000, 'total': total}
+
+
+def run_benchmark(products: int, repeat: int) -> list[dict[str, Any]]:
+    """
+    Seed a fresh database file and time every query of QUERIES through both search paths.
+
+    :param products: Number of products to create
+    :param repeat: Runs per query, the median is reported
+    :return: Per query: LIKE and FTS5 median latency in ms and result counts
+    """
+    directory = tempfile.mkdtemp()
+    config = load_config(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.yaml'))
+    config.update({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'benchmark.db')}",
+        'REQUEST_LOG_ASYNC': False,
+        'SQL_INSTRUMENTATION_ENABLED': False,
+        'PRODUCT_SEARCH_BACKEND': 'fts5',
+    })
+    app = create_app(config=config)
+
+    results = []
+    try:
+        with app.app_context():
+            started = time.perf_counter()
+            seed_products(products)
+            print(f"Seeded {products} products, FTS5 index maintained by triggers, in "
+                  f"{time.perf_counter() - started:.1f} s")
+            per_page = app.config['PER_PAGE']
+            for name_query in QUERIES:
+                like = _measure(_like_query, name_query, repeat, per_page)
+                fts = _measure(lambda search: filter_products(name_query=search), name_query, repeat, per_page)
+                results.append({'query': name_query, 'like ms': like['ms'], 'like total': like['total'],
+                                'fts ms': fts['ms'], 'fts total': fts['total']})
+            db.session.remove()
+        db.engine.dispose()
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'query':<22} {'LIKE ms':>9} {'hits':>7} {'FTS5 ms':>9} {'hits':>7}")
+    for result in run_benchmark(args.products, args.repeat):
+        print(f"{result['query']:<22} {result['like ms']:9.2f} {result['like total']:7d} "
+              f"{result['fts ms']:9.2f} {result['fts total']:7d}")
+
+
+if __name__ == '__main__':
+    main()
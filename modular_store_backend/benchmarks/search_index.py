@@ -0,0 +1,132 @@
+# /modular_store_backend/benchmarks/search_index.py
+"""
+Latency of the in-memory search index, alone and through a product list page (count and first page of /search),
+for correctly spelled and misspelled queries. The first run after the build ranks the postings of every matched
+term, uncached runs expand and score the query again on top of those rankings, cached runs hit the result cache.
+'complete' is an uncached run ranking every match, as the list pages do before filtering and sorting; 'page ms'
+goes through the catalog index (select_products), 'sql ms' through the SQL query of filter_products.
+
+Run with: python -m modular_store_backend.benchmarks.search_index [--products 100000 --repeat 50]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Any
+
+from modular_store_backend.app import create_app, load_config
+from modular_store_backend.benchmarks.product_search import seed_products
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.catalog_index import build_catalog_index
+from modular_store_backend.modules.filter.utils import filter_products, paginate_query, select_products
+from modular_store_backend.modules.search_index import build_search_index, product_search_index
+
+QUERIES = ['lamp', 'lmap', 'wireless headphones', 'wirless hedphones', 'waterproof', 'watreproof', 'travel', 'zzzz']
+
+
+def _median_ms(timings: list[float]) -> float:
+    return statistics.median(timings) * 1000
+
+
+def _measure(name_query: str, repeat: int, per_page: int) -> dict[str, Any]:
+    started = time.perf_counter()
+    product_search_index.search(name_query)
+    first = time.perf_counter() - started
+
+    uncached = []
+    for _ in range(repeat):
+        product_search_index._invalidate(vocabulary_changed=True)  # drop the cached expansions and results
+        started = time.perf_counter()
+        product_search_index.search(name_query)
+        uncached.append(time.perf_counter() - started)
+
+    complete = []
+    for _ in range(repeat):
+        product_search_index._invalidate(vocabulary_changed=True)
+        started = time.perf_counter()
+        product_search_index.search(name_query, complete=True)
+        complete.append(time.perf_counter() - started)
+
+    cached = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hits = product_search_index.search(name_query)
+        cached.append(time.perf_counter() - started)
+
+    page = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, total, _, _ = paginate_query(select_products(name_query=name_query), 1)
+        page.append(time.perf_counter() - started)
+        db.session.rollback()
+
+    sql = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        query = filter_products(name_query=name_query)
+        query.order_by(None).count()
+        query.limit(per_page).all()
+        sql.append(time.perf_counter() - started)
+        db.session.rollback()
+
+    return {'query': name_query, 'first ms': first * 1000, 'uncached ms': _median_ms(uncached),
+            'complete ms': _median_ms(complete), 'cached ms': _median_ms(cached), 'page ms': _median_ms(page),
+            'sql ms': _median_ms(sql), 'hits': len(hits), 'total': total}
+
+
+def run_benchmark(products: int, repeat: int) -> list[dict[str, Any]]:
+    """
+    Seed a fresh database file, build the index and time every query of QUERIES.
+
+    :param products: Number of products to create
+    :param repeat: Runs per query and measurement, the median is reported
+    :return: Per query: index latency (first, uncached, complete and cached run) and list page latency in ms,
+        index hits and page total
+    """
+    directory = tempfile.mkdtemp()
+    config = load_config(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.yaml'))
+    config.update({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'benchmark.db')}",
+        'REQUEST_LOG_ASYNC': False,
+        'SQL_INSTRUMENTATION_ENABLED': False,
+        'PRODUCT_SEARCH_BACKEND': 'index',
+    })
+    app = create_app(config=config)
+
+    results = []
+    try:
+        with app.app_context():
+            seed_products(products)
+            started = time.perf_counter()
+            build_search_index(app)
+            print(f"Indexed {len(product_search_index)} products in {time.perf_counter() - started:.1f} s")
+            build_catalog_index(app)
+            for name_query in QUERIES:
+                results.append(_measure(name_query, repeat, app.config['PER_PAGE']))
+            db.session.remove()
+        db.engine.dispose()
+    finally:
+        product_search_index.clear()
+        shutil.rmtree(directory)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'query':<22} {'first ms':>9} {'uncached':>9} {'complete':>9} {'cached':>9} {'hits':>6} "
+          f"{'page ms':>9} {'sql ms':>9} {'total':>6}")
+    for result in run_benchmark(args.products, args.repeat):
+        print(f"{result['query']:<22} {result['first ms']:9.3f} {result['uncached ms']:9.3f} "
+              f"{result['complete ms']:9.3f} {result['cached ms']:9.3f} {result['hits']:6d} "
+              f"{result['page ms']:9.2f} {result['sql ms']:9.2f} {result['total']:6d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+# /modular_store_backend/benchmarks/stock_concurrency.py
+"""
+Parallel checkouts of a few scarce products: read-modify-write stock updates against the guarded UPDATEs of
+modules/stock.py. Counts the units sold beyond the available stock.
+
+Run with: python -m modular_store_backend.benchmarks.stock_concurrency [--threads 16 --products 5 --stock 200]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Callable
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+
+from modular_store_backend.modules.db.database import Base
+from modular_store_backend.modules.db.models import Product
+from modular_store_backend.modules.db.sqlite_tuning import apply_sqlite_pragmas
+from modular_store_backend.modules.stock import reserve_stock
+
+Order = list[tuple[int, int]]
+
+
+def checkout_read_modify_write(session: Session, order: Order) -> bool:
+    # What Purchase.update_stock did before: load each product, check and decrement in Python
+    for product_id, quantity in order:
+        product = session.get(Product, product_id)
+        if product is None or product.stock < quantity:
+            session.rollback()
+            return False
+        product.stock -= quantity
+    session.commit()
+    return True
+
+
+def checkout_guarded_update(session: Session, order: Order) -> bool:
+    reserved = reserve_stock(order, session=session).ok
+    session.commit()
+    return reserved
+
+
+STRATEGIES: dict[str, Callable[[Session, Order], bool]] = {
+    'read-modify-write': checkout_read_modify_write,
+    'guarded UPDATE': checkout_guarded_update,
+}
+
+
+def create_benchmark_engine(path: str, pool_size: int) -> Engine:
+    engine = create_engine(f'sqlite:///{path}', pool_size=pool_size)
+    apply_sqlite_pragmas(engine)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def run_worker(factory: sessionmaker[Session], checkout: Callable[[Session, Order], bool], product_ids: list[int],
+               deadline: float, sold: dict[int, int], counters: dict[str, int], failures: list[Exception],
+               lock: threading.Lock) -> None:
+    rng = random.Random()
+    try:
+        while time.perf_counter() < deadline:
+            order = [(product_id, rng.randint(1, 3))
+                     for product_id in rng.sample(product_ids, min(rng.randint(1, 3), len(product_ids)))]
+            with factory() as session:
+                try:
+                    succeeded = checkout(session, order)
+                except OperationalError:  # database is locked
+                    session.rollback()
+                    with lock:
+                        counters['errors'] += 1
+                    continue
+            with lock:
+                counters['checkouts' if succeeded else 'rejected'] += 1
+                if succeeded:
+                    for product_id, quantity in order:
+                        sold[product_id] += quantity
+    except Exception as error:  # a dead worker would leave the checks below with nothing to check
+        with lock:
+            failures.append(error)
+
+
+def run_benchmark(strategy: str, threads: int, products: int, stock: int, duration: float) -> dict[str, Any]:
+    """
+    Run checkouts from many threads until the products sell out or the time is up.
+
+    :param strategy: Key of STRATEGIES
+    :param threads: Number of parallel checkouts
+    :param products: Number of products every order picks from
+    :param stock: Initial stock of each product
+    :param duration: Maximum seconds to run
+    :return: Checkouts attempted per second, successful and rejected checkouts, lock errors, exceptions of the
+        workers that died, oversold units and products with negative stock
+    """
+    directory = tempfile.mkdtemp()
+    engine = create_benchmark_engine(os.path.join(directory, 'benchmark.db'), pool_size=threads)
+    factory = sessionmaker(bind=engine, expire_on_commit=False)
+    with factory() as session:
+        session.add_all([Product(samplename=f'product {index}', price=1000, stock=stock) for index in range(products)])
+        session.commit()
+        product_ids = list(session.scalars(select(Product.id)))
+
+    sold = {product_id: 0 for product_id in product_ids}
+    counters = {'checkouts': 0, 'rejected': 0, 'errors': 0}
+    failures: list[Exception] = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    workers = [threading.Thread(target=run_worker, args=(factory, STRATEGIES[strategy], product_ids,
+                                                         started + duration, sold, counters, failures, lock))
+               for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    with factory() as session:
+        final_stock = dict(session.execute(select(Product.id, Product.stock)).tuples().all())
+    engine.dispose()
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+    return {
+        'attempts/s': (counters['checkouts'] + counters['rejected']) / elapsed,
+        'checkouts': counters['checkouts'],
+        'rejected': counters['rejected'],
+        'locked errors': counters['errors'],
+        'worker failures': failures,
+        # Units confirmed to customers beyond what was in stock
+        'oversold units': sum(max(0, units - stock) for units in sold.values()),
+        # Units confirmed but not taken from the stock (lost updates)
+        'lost updates': sum(units - (stock - final_stock[product_id]) for product_id, units in sold.items()),
+        'negative stock': sum(1 for value in final_stock.values() if value < 0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--products', type=int, default=5)
+    parser.add_argument('--stock', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    for strategy in STRATEGIES:
+        result = run_benchmark(strategy, args.threads, args.products, args.stock, args.duration)
+        print(f"{strategy:<18} attempts/s: {result['attempts/s']:8.1f}  checkouts: {result['checkouts']:6}  "
+              f"rejected: {result['rejected']:6}  "
+              f"locked errors: {result['locked errors']:4}  oversold units: {result['oversold units']:5}  "
+              f"lost updates: {result['lost updates']:5}  negative stock: {result['negative stock']}")
+        for failure in result['worker failures']:
+            print(f"{strategy:<18} worker failed: {failure!r}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# /modular_store_backend/migrations/env.py
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine
+
+from modular_store_backend.app import load_config
+from modular_store_backend.modules.db import models  # noqa: F401  registers the tables on Base.metadata
+from modular_store_backend.modules.db.database import Base
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def get_url() -> str:
+    x_arguments = context.get_x_argument(as_dictionary=True)
+    url = x_arguments.get('url') or config.get_main_option('sqlalchemy.url')
+    if url:
+        return url
+    return load_config(x_arguments.get('config', './modular_store_backend/config.yaml'))['SQLALCHEMY_DATABASE_URI']
+
+
+def run_migrations_offline() -> None:
+    context.configure(url=get_url(), target_metadata=target_metadata, literal_binds=True, render_as_batch=True,
+                      dialect_opts={'paramstyle': 'named'})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    engine = create_engine(get_url())
+    with engine.connect() as connection:
+        # SQLite cannot ALTER most column properties, batch mode recreates the table instead
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+        with context.begin_transaction():
+            context.run_migrations()
+    engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
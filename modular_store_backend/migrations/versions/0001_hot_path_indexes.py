@@ -0,0 +1,47 @@
+"""Add composite indexes for hot query paths
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_notifications_user_id_read', 'notifications', ['user_id', 'read']),
+    ('ix_reviews_product_id_date', 'reviews', ['product_id', 'date']),
+    ('ix_reviews_user_id_product_id', 'reviews', ['user_id', 'product_id']),
+    ('ix_wishlists_user_id_product_id', 'wishlists', ['user_id', 'product_id']),
+    ('ix_purchase_items_product_id_purchase_id', 'purchase_items', ['product_id', 'purchase_id']),
+    ('ix_purchases_user_id_date', 'purchases', ['user_id', 'date']),
+    ('ix_request_logs_timestamp', 'request_logs', ['timestamp']),
+    ('ix_product_promotions_start_date_end_date', 'product_promotions', ['start_date', 'end_date']),
+    ('ix_product_promotions_product_id', 'product_promotions', ['product_id']),
+    ('ix_recently_viewed_products_user_id_timestamp', 'recently_viewed_products', ['user_id', 'timestamp']),
+    ('ix_product_selection_option_product_id', 'product_selection_option', ['product_id']),
+    ('ix_tickets_user_id', 'tickets', ['user_id']),
+]
+
+
+def upgrade() -> None:
+    # Tables that do not exist yet get their indexes from create_all on first start
+    existing_tables = set(sa.inspect(op.get_bind()).get_table_names())
+    for name, table, columns in INDEXES:
+        if table in existing_tables:
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    existing_tables = set(sa.inspect(op.get_bind()).get_table_names())
+    for name, table, _ in reversed(INDEXES):
+        if table in existing_tables:
+            op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,40 @@
+"""Store per-request SQL statistics with request logs
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = [
+    ('query_count', sa.Integer),
+    ('db_time', sa.Float),
+    ('repeated_queries', sa.Text),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'request_logs' not in inspector.get_table_names():
+        return  # created with these columns by create_all on first start
+    existing = {column['name'] for column in inspector.get_columns('request_logs')}
+    with op.batch_alter_table('request_logs') as batch_op:
+        for name, column_type in COLUMNS:
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, column_type(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('request_logs') as batch_op:
+        for name, _ in reversed(COLUMNS):
+            batch_op.drop_column(name)
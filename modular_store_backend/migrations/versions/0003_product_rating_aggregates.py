@@ -0,0 +1,50 @@
+"""Denormalize review count and rating average onto products
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = [
+    ('review_count', sa.Integer),
+    ('rating_sum', sa.Integer),
+    ('rating_avg', sa.Float),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'products' not in inspector.get_table_names():
+        return  # created with these columns by create_all on first start
+    existing = {column['name'] for column in inspector.get_columns('products')}
+    with op.batch_alter_table('products') as batch_op:
+        for name, column_type in COLUMNS:
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, column_type(), nullable=False, server_default='0'))
+    op.create_index('ix_products_rating_avg', 'products', ['rating_avg'], if_not_exists=True)
+
+    if 'reviews' in inspector.get_table_names():
+        op.execute("""
+            UPDATE products SET
+                review_count = (SELECT count(*) FROM reviews WHERE reviews.product_id = products.id),
+                rating_sum = (SELECT coalesce(sum(rating), 0) FROM reviews WHERE reviews.product_id = products.id),
+                rating_avg = coalesce((SELECT avg(rating) FROM reviews WHERE reviews.product_id = products.id), 0)
+        """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_rating_avg', table_name='products', if_exists=True)
+    with op.batch_alter_table('products') as batch_op:
+        for name, _ in reversed(COLUMNS):
+            batch_op.drop_column(name)
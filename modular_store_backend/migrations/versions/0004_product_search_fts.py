@@ -0,0 +1,34 @@
+"""FTS5 product search index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from modular_store_backend.modules.db.product_search import create_product_search, drop_product_search
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+REQUIRED_TABLES = {'products', 'products_tags', 'tags', 'categories'}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite' or not REQUIRED_TABLES <= set(sa.inspect(bind).get_table_names()):
+        return  # created together with the tables by init_db on first start
+    create_product_search(bind)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        drop_product_search(bind)
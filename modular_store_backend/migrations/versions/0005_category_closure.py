@@ -0,0 +1,47 @@
+"""Category closure table
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from modular_store_backend.modules.db.category_tree import CLOSURE_TABLE, create_category_tree, drop_category_tree
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    tables = set(sa.inspect(bind).get_table_names())
+    if 'categories' not in tables:
+        return  # created together with the tables by init_db on first start
+    if CLOSURE_TABLE not in tables:
+        op.create_table(
+            CLOSURE_TABLE,
+            sa.Column('ancestor_id', sa.Integer(), sa.ForeignKey('categories.id', ondelete='CASCADE'),
+                      primary_key=True),
+            sa.Column('descendant_id', sa.Integer(), sa.ForeignKey('categories.id', ondelete='CASCADE'),
+                      primary_key=True),
+            sa.Column('depth', sa.Integer(), nullable=False),
+        )
+        op.create_index('ix_category_closure_descendant_id', CLOSURE_TABLE, ['descendant_id'])
+    if bind.dialect.name == 'sqlite':
+        create_category_tree(bind)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        drop_category_tree(bind)
+    if CLOSURE_TABLE in sa.inspect(bind).get_table_names():
+        op.drop_index('ix_category_closure_descendant_id', table_name=CLOSURE_TABLE, if_exists=True)
+        op.drop_table(CLOSURE_TABLE)
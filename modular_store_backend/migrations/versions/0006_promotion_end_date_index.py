@@ -0,0 +1,28 @@
+"""Index promotion end dates for the promotion schedule
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A new database gets the index from create_all on first start
+    if 'product_promotions' in sa.inspect(op.get_bind()).get_table_names():
+        op.create_index('ix_product_promotions_end_date', 'product_promotions', ['end_date'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    if 'product_promotions' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_index('ix_product_promotions_end_date', table_name='product_promotions', if_exists=True)
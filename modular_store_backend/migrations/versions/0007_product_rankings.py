@@ -0,0 +1,53 @@
+"""Popularity scores of the products for the best selling, most viewed and trending sort options
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ['sales_score', 'view_score', 'trending_score']
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+    if 'products' not in tables:
+        return  # created with these columns by create_all on first start
+    existing = {column['name'] for column in inspector.get_columns('products')}
+    with op.batch_alter_table('products') as batch_op:
+        for name in COLUMNS:
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, sa.Float(), nullable=False, server_default='0'))
+    for name in COLUMNS:
+        op.create_index(f'ix_products_{name}', 'products', [name], if_not_exists=True)
+
+    # The first fold of the ranking job fills the scores from the purchase history, see modules/rankings.py
+    if 'ranking_epochs' not in tables:
+        op.create_table(
+            'ranking_epochs',
+            sa.Column('name', sa.String(50), primary_key=True),
+            sa.Column('epoch', sa.DateTime(), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'ranking_epochs' in inspector.get_table_names():
+        op.drop_table('ranking_epochs')
+    for name in reversed(COLUMNS):
+        op.drop_index(f'ix_products_{name}', table_name='products', if_exists=True)
+    # A batch operation would copy products into a new table, which the triggers of the search index and the
+    # category tree on it do not allow; SQLite drops unindexed columns in place since 3.35
+    for name in reversed(COLUMNS):
+        op.execute(f'ALTER TABLE products DROP COLUMN {name}')
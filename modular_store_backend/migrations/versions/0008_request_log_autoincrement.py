@@ -0,0 +1,52 @@
+"""Never reuse request log IDs, the request metric rollup watermark is one
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _request_logs_on_sqlite() -> bool:
+    bind = op.get_bind()
+    # Other databases never reuse IDs; create_all builds the table with AUTOINCREMENT
+    return bind.dialect.name == 'sqlite' and 'request_logs' in sa.inspect(bind).get_table_names()
+
+
+def _recreate_request_logs(autoincrement: bool) -> None:
+    with op.batch_alter_table('request_logs', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}) as batch_op:
+        batch_op.alter_column('id', existing_type=sa.Integer(), autoincrement=True)
+
+
+def upgrade() -> None:
+    if not _request_logs_on_sqlite():
+        return
+    _recreate_request_logs(True)
+
+    # The copied rows set the sequence to the largest ID left, which is below the watermark once retention deleted
+    # the newest rolled up logs; new IDs start after both
+    last_id = 0
+    if 'rollup_watermarks' in sa.inspect(op.get_bind()).get_table_names():
+        last_id = op.get_bind().execute(sa.text(
+            "SELECT coalesce(max(last_id), 0) FROM rollup_watermarks WHERE name = 'request_metrics'")).scalar()
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'request_logs'")
+    op.execute(sa.text(
+        "INSERT INTO sqlite_sequence (name, seq) "
+        "SELECT 'request_logs', max(coalesce((SELECT max(id) FROM request_logs), 0), :last_id)"
+    ).bindparams(last_id=last_id))
+
+
+def downgrade() -> None:
+    if _request_logs_on_sqlite():
+        _recreate_request_logs(False)
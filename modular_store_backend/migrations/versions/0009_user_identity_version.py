@@ -0,0 +1,31 @@
+"""Version of each user row, checked by the identity cache of every worker
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if 'users' not in inspector.get_table_names():
+        return  # created with this column by create_all on first start
+    if 'identity_version' not in {column['name'] for column in inspector.get_columns('users')}:
+        with op.batch_alter_table('users') as batch_op:
+            batch_op.add_column(sa.Column('identity_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    # Tables referencing users make a batch copy fragile; SQLite drops unindexed columns in place since 3.35
+    op.execute('ALTER TABLE users DROP COLUMN identity_version')
@@ -0,0 +1,32 @@
+"""Versions of the cached data shared by every worker, starting with the catalog metadata
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The first catalog write creates the row of its version, see modules/filter/catalog_metadata.py
+    if 'cache_versions' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'cache_versions',
+            sa.Column('name', sa.String(50), primary_key=True),
+            sa.Column('version', sa.Integer(), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    if 'cache_versions' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_table('cache_versions')
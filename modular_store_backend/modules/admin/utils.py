@@ -5,7 +5,6 @@ from io import StringIO, BytesIO
 
 from flask import send_file, current_app
 from flask.typing import ResponseValue
-from openpyxl import Workbook
 
 
 def generate_csv(data: dict[str, list[dict[str, any]]]) -> ResponseValue:
@@ -30,6 +29,9 @@ def generate_csv(data: dict[str, list[dict[str, any]]]) -> ResponseValue:
 
 
 def generate_excel(data: dict[str, list[dict[str, any]]]) -> ResponseValue:
+    # openpyxl is only needed for Excel exports, keep it out of app startup
+    from openpyxl import Workbook
+
     try:
         wb = Workbook()
         wb.remove(wb.active)  # type: ignore
@@ -3,11 +3,10 @@ import io
 import os
 import tempfile
 import zipfile
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 from pathlib import Path
 from typing import Union
 
-import pandas as pd
 from flask import Blueprint, Flask
 from flask import current_app, request, flash, redirect, url_for
 from flask import send_file
@@ -23,7 +22,6 @@ from sqlalchemy import func, Integer
 from sqlalchemy import inspect, select, Table
 from sqlalchemy.orm import aliased
 from werkzeug.utils import secure_filename
-from ydata_profiling import ProfileReport  # type: ignore
 
 from modular_store_backend.forms.forms import EmailForm
 from modular_store_backend.modules.admin.utils import generate_csv, generate_json, generate_excel
@@ -33,6 +31,9 @@ from modular_store_backend.modules.db.models import RequestLog, Ticket, User, Pr
     ProductPromotion, Discount, ShippingMethod, ReportedReview, TicketMessage
 from modular_store_backend.modules.decorators import login_required_with_message, admin_required
 from modular_store_backend.modules.email import send_email
+from modular_store_backend.modules.identity_cache import get_identity_cache_stats
+from modular_store_backend.modules.query_stats import get_worst_endpoints, query_instrumentation
+from modular_store_backend.modules.request_metrics import get_request_metrics, update_request_metric_rollups
 
 # Create Blueprint
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -138,6 +139,10 @@ class StatisticsView(BaseView):  # type: ignore
             tables = request.form.getlist('tables')
             data_percentage = int(request.form.get('data_percentage', 100))
 
+            # pandas and ydata_profiling take seconds to import, load them only when a report is requested
+            import pandas as pd
+            from ydata_profiling import ProfileReport  # type: ignore
+
             memory_file = io.BytesIO()
             try:
                 with zipfile.ZipFile(memory_file, 'w') as zf:
@@ -235,7 +240,8 @@ class ProductsViews(AdminView):
     column_searchable_list = ['samplename', 'description']
     column_filters = ['onSale', 'category']
     column_editable_list = ['price', 'onSale', 'onSalePrice', 'stock']
-    form_excluded_columns = ['purchase_items', 'reviews', 'wishlist_items', 'cart_items', 'recently_viewed_by']
+    form_excluded_columns = ['purchase_items', 'reviews', 'wishlist_items', 'cart_items', 'recently_viewed_by',
+                             'sales_score', 'view_score', 'trending_score']
     form_widget_args = {
         'description': {'rows': 10},
     }
@@ -298,42 +304,61 @@ class AnalyticsView(BaseView):  # type: ignore
             start_datetime: datetime = datetime.combine(start_date, time.min)
             end_datetime: datetime = datetime.combine(end_date, time.max)
 
-            # Retrieve request logs within the specified date range
-            request_logs_query = db.session.query(RequestLog).filter(
+            # Fold one batch of the request logs written since the last scheduled run, then read the hourly rollups;
+            # a larger backlog (first run after deploy) is left to the scheduler job instead of this request
+            update_request_metric_rollups(current_app.config.get('REQUEST_METRICS_ROLLUP_BATCH_SIZE', 10000),
+                                          max_batches=1)
+            metrics = get_request_metrics(start_datetime, end_datetime)
+
+            total_requests: int = metrics['total_requests']
+            request_logs: list[RequestLog] = db.session.query(RequestLog).filter(
                 RequestLog.timestamp >= start_datetime,
                 RequestLog.timestamp <= end_datetime
-            )
+            ).limit(10).all()
 
-            total_requests: int = request_logs_query.count()
-            request_logs: list[RequestLog] = request_logs_query.limit(10).all()
-
-            # Calculate analytics metrics for all logs in the selected range
             average_execution_time: Union[int, str] = 0
-            status_code_counts: dict[int, int] = {}
+            latency_percentiles: dict[int, str] = {}
+            status_code_counts: dict[int, int] = metrics['status_code_counts']
 
             if total_requests > 0:
-                # Calculate average execution time
-                avg_execution_time: float = request_logs_query.with_entities(
-                    func.avg(RequestLog.execution_time)).scalar() or 0.0
-                average_execution_time = f"{round(avg_execution_time, 3)} s"
-
-                # Calculate status code counts using grouping
-                status_code_counts = dict(
-                    (row[0], row[1]) for row in request_logs_query.with_entities(
-                        RequestLog.status_code, func.count(RequestLog.status_code)
-                    )
-                    .group_by(RequestLog.status_code)
-                    .all()
-                )
+                average_execution_time = f"{round(metrics['average_execution_time'], 3)} s"
+                latency_percentiles = {percentile: f"{round(value, 3)} s"
+                                       for percentile, value in metrics['percentiles'].items()}
 
             # Render the template with the analytics data
             return self.render('admin/analytics.html',  # type: ignore[no-any-return]
                                request_logs=request_logs,
                                total_requests=total_requests,
                                average_execution_time=average_execution_time,
-                               status_code_counts=status_code_counts)
+                               status_code_counts=status_code_counts,
+                               latency_percentiles=latency_percentiles,
+                               **self.get_runtime_metrics())
+
+        return self.render('admin/analytics.html', **self.get_runtime_metrics())  # type: ignore
+
+    @staticmethod
+    def get_runtime_metrics() -> dict[str, dict[str, int]]:
+        writer = current_app.extensions.get('request_log_writer')
+        return {
+            'request_log_metrics': writer.get_metrics() if writer else {},
+            'identity_cache_stats': get_identity_cache_stats(),
+        }
+
+
+class QueryStatsView(BaseView):  # type: ignore
+    @expose('/')  # type: ignore
+    @login_required_with_message()
+    @admin_required()
+    def index(self) -> ResponseValue:
+        hours: int = request.args.get('hours', type=int, default=24)
+        since: datetime = datetime.utcnow() - timedelta(hours=hours)
 
-        return self.render('admin/analytics.html')  # type: ignore
+        return self.render('admin/query_stats.html',  # type: ignore[no-any-return]
+                           hours=hours,
+                           worst_endpoints=get_worst_endpoints(since),
+                           slow_queries=query_instrumentation.slow_query_log.entries(),
+                           slow_query_threshold=query_instrumentation.slow_query_threshold,
+                           n_plus_one_threshold=query_instrumentation.n_plus_one_threshold)
 
 
 class PurchaseView(AdminView):
@@ -493,4 +518,5 @@ def init_admin_views(admin: Admin, database: Database) -> None:
     admin.add_view(StatisticsView(name='Statistics', endpoint='statistics', category='Statistics'))
     admin.add_view(ReportsView(name='Reports', endpoint='reports', category='Reports'))
     admin.add_view(AnalyticsView(name='Analytics', endpoint='analytics', category='Reports'))
+    admin.add_view(QueryStatsView(name='SQL Performance', endpoint='query_stats', category='Reports'))
     admin.add_view(EmailView(name='Send Emails', endpoint='send_emails', category='Marketing'))
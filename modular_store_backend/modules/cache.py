@@ -1,4 +1,5 @@
 # /modular_store_backend/modules/cache.py
 from flask_caching import Cache
 
-cache = Cache(config={'CACHE_TYPE': 'simple'})
+# Backend set by CACHE_TYPE (and the other CACHE_* settings) of the app config, see init_extensions
+cache = Cache()
@@ -1,5 +1,6 @@
 # /modular_store_backend/modules/carts/__init__.py
 import json
+import logging
 import random
 from datetime import datetime
 from typing import Optional, Tuple
@@ -14,7 +15,10 @@ from modular_store_backend.modules.db.database import db
 from modular_store_backend.modules.db.models import Product, Cart, Discount, UserDiscount, ShippingMethod, Purchase
 from modular_store_backend.modules.db.models import User
 from modular_store_backend.modules.email import send_order_confirmation_email
+from modular_store_backend.modules.header_context import invalidate_header_context
 from modular_store_backend.modules.purchase_history import save_purchase_history
+from modular_store_backend.modules.rankings import ranking_recorder
+from modular_store_backend.modules.stock import OutOfStockError, release_stock, reserve_stock
 
 
 def process_payment(cart_items: list[Cart]) -> ResponseValue:
@@ -50,14 +54,18 @@ def get_shipping_info() -> Optional[Tuple[int, ShippingMethod]]:
 
 
 def process_test_payment(cart_items: list[Cart], shipping_address_id: int, shipping_method_id: int) -> ResponseValue:
-    order = save_purchase_history(
-        db_session=db.session,
-        cart_items=cart_items,
-        shipping_address_id=shipping_address_id,
-        shipping_method_id=shipping_method_id,
-        payment_method="test_payment",
-        payment_id="test_" + str(random.randint(10000, 99999))
-    )
+    try:
+        order = save_purchase_history(
+            db_session=db.session,
+            cart_items=cart_items,
+            shipping_address_id=shipping_address_id,
+            shipping_method_id=shipping_method_id,
+            payment_method="test_payment",
+            payment_id="test_" + str(random.randint(10000, 99999))
+        )
+    except OutOfStockError:
+        flash(_("Some items in your cart are no longer in stock."), "danger")
+        return redirect(url_for('carts.cart'))
 
     clear_cart()
     current_user.discount = 0
@@ -154,6 +162,7 @@ def create_line_items_for_payment(cart_items: list[Cart], shipping_method: Shipp
 def clear_cart() -> None:
     db.session.query(Cart).filter_by(user_id=current_user.id).delete()
     db.session.commit()
+    invalidate_header_context(current_user.id)
 
 
 def update_cart(cart_item_id: int, quantity: int) -> bool:
@@ -161,23 +170,23 @@ def update_cart(cart_item_id: int, quantity: int) -> bool:
     if not (cart_item and cart_item.user_id == current_user.id):
         return False
 
-    if product := db.session.get(Product, cart_item.product_id):
-        stock_difference: int = quantity - cart_item.quantity
-
-        if product.stock >= stock_difference:
-            if quantity > 0:
-                cart_item.quantity = quantity
-                product.stock -= stock_difference
-            else:
-                remove_from_cart(cart_item_id)
-                product.stock += cart_item.quantity
+    if quantity <= 0:
+        release_stock([(cart_item.product_id, cart_item.quantity)])
+        remove_from_cart(cart_item_id)
+        return True
 
-            db.session.commit()
-            return True
-        else:
+    stock_difference: int = quantity - cart_item.quantity
+    if stock_difference > 0:
+        if not reserve_stock([(cart_item.product_id, stock_difference)]).ok:
             flash(_("Not enough stock available for this product."), "danger")
+            return False
+    elif stock_difference < 0:
+        release_stock([(cart_item.product_id, -stock_difference)])
 
-    return False
+    cart_item.quantity = quantity
+    db.session.commit()
+    invalidate_header_context(current_user.id)
+    return True
 
 
 def remove_from_cart(cart_item_id: int) -> bool:
@@ -187,6 +196,7 @@ def remove_from_cart(cart_item_id: int) -> bool:
 
     db.session.delete(cart_item)
     db.session.commit()
+    invalidate_header_context(current_user.id)
     return True
 
 
@@ -232,6 +242,8 @@ def add_to_cart(product: Product, quantity: int, variant_options: dict[str, str]
 
     # product.stock -= quantity
     db.session.commit()
+    ranking_recorder.record(product.id, 'cart', quantity)
+    invalidate_header_context(current_user.id)
     flash(_("Item added to cart."), "success")
     return True
 
@@ -269,13 +281,21 @@ def apply_discount_code(discount_code: str) -> str:
         new_user_discount = UserDiscount(user_id=current_user.id, discount_id=discount.id)
         db.session.add(new_user_discount)
         db.session.commit()
+        invalidate_header_context(current_user.id)
         return "success"
     return "invalid"
 
 
-def process_successful_payment(session: stripe.checkout.Session) -> str:
+def process_successful_payment(session: stripe.checkout.Session) -> str | ResponseValue:
     cart_items = db.session.query(Cart).filter_by(user_id=current_user.id).all()
-    order = create_order(session, cart_items)
+    try:
+        order = create_order(session, cart_items)
+    except OutOfStockError as e:
+        # Paid, but the stock sold out in the meantime: nothing was saved, the payment has to be refunded
+        logging.error(f"Order of user {current_user.id} with payment {session.payment_intent} not saved: {str(e)}")
+        flash(_("Some items in your cart sold out while you were paying. "
+                "Please contact support for a refund."), "danger")
+        return redirect(url_for('carts.cart'))
     finalize_order()
     return render_success_page(order)
 
@@ -0,0 +1,461 @@
+# /modular_store_backend/modules/catalog_index.py
+"""
+In-memory attribute index of the catalog for the product list pages.
+
+Every product has a position in dense NumPy arrays. Categories, tags, the on-sale flag and the in-stock flag are
+bitsets over these positions (packed, one bit per product), current price, rating and the popularity scores
+(modules/rankings.py) are float arrays, and the sort orders of the sort options are position arrays computed on
+first use. Filtering ANDs the bitsets, sorting keeps the precomputed order of the matching positions, and only the
+products of the requested page are loaded from the database.
+
+The index is built at startup and patched at commit: the products changed through the ORM, and those whose stock,
+rating or scores were updated with plain UPDATE statements (marked with mark_products_changed), are re-read before
+the transaction commits and applied after it did. Writes of other processes are picked up by the periodic rebuild
+(CATALOG_INDEX_REFRESH_INTERVAL).
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import numpy as np
+from flask import Flask
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, scoped_session
+
+from modular_store_backend.modules.db.category_tree import read_subtrees
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Category, Product, Tag, products_tags
+
+# Sort option key -> (array, descending), NULLs always last like SortOption.apply
+SORT_COLUMNS = {
+    'price_asc': ('price', False),
+    'price_desc': ('price', True),
+    'rating': ('rating', True),
+    'best_selling': ('sales', True),
+    'most_viewed': ('views', True),
+    'trending': ('trending', True),
+}
+
+CHANGED_PRODUCTS_KEY = 'catalog_changed_products'
+CHANGED_TAXONOMY_KEY = 'catalog_changed_taxonomy'
+PENDING_ROWS_KEY = 'catalog_pending_rows'
+
+# (category ID, price, onSale, onSalePrice, stock, rating average, sales score, view score, trending score, tag IDs)
+ProductRow = tuple[Optional[int], Optional[int], Optional[int], Optional[int], int, Optional[float], Optional[float],
+                   Optional[float], Optional[float], frozenset[int]]
+# Category ID mapped to the IDs of the categories it holds, itself included, and tag ID mapped to its name
+Taxonomy = tuple[dict[int, list[int]], dict[int, str]]
+
+
+def _bitset(capacity: int) -> np.ndarray:
+    return np.zeros(capacity // 8, dtype=np.uint8)
+
+
+def _set_bit(bits: np.ndarray, position: int, value: bool) -> None:
+    mask = np.uint8(1 << (position & 7))
+    if value:
+        bits[position >> 3] |= mask
+    else:
+        bits[position >> 3] &= ~mask
+
+
+class ProductSelection:
+    """
+    Ordered IDs of the products matching a filter, resolved by the catalog index.
+    """
+
+    def __init__(self, product_ids: np.ndarray) -> None:
+        self.product_ids = product_ids
+        self._members: Optional[set[int]] = None
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    def __contains__(self, product_id: int) -> bool:
+        if self._members is None:
+            self._members = set(self.product_ids.tolist())
+        return product_id in self._members
+
+    def page(self, offset: int, limit: int) -> list[int]:
+        """
+        :param offset: Number of products to skip
+        :param limit: Number of products to return
+        :return: IDs of the products of a page, in order
+        """
+        return self.product_ids[offset:offset + limit].tolist()
+
+    def index_of(self, product_id: int) -> Optional[int]:
+        """:return: Position of the product in the selection, None when it is not selected"""
+        positions = np.flatnonzero(self.product_ids == product_id)
+        return int(positions[0]) if len(positions) else None
+
+
+class CatalogIndex:
+    """
+    Bitsets and sort orders over the products, safe to query and update from several threads.
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+        self._lock = threading.RLock()
+        self._replay: Optional[list[tuple[int, Optional[ProductRow]]]] = None
+        self._replay_taxonomy: Optional[Taxonomy] = None
+        self._reset(0)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def _reset(self, capacity: int) -> None:
+        capacity = max(64, -(-capacity // 64) * 64)  # whole bytes, room to append
+        self._capacity = capacity
+        self._size = 0
+        self._positions: dict[int, int] = {}
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._alive = _bitset(capacity)
+        self._in_stock = _bitset(capacity)
+        self._on_sale = _bitset(capacity)
+        self._categories: dict[int, np.ndarray] = {}
+        self._tags: dict[int, np.ndarray] = {}
+        self._columns = {name: np.full(capacity, np.nan) for name in ('price', 'rating', 'sales', 'views', 'trending')}
+        self._rows: dict[int, ProductRow] = {}
+        self._orders: dict[str, np.ndarray] = {}
+        self._id_lookup: Optional[tuple[np.ndarray, np.ndarray]] = None  # IDs in ascending order, their positions
+        self._subtrees: dict[int, list[int]] = {}
+        self._tag_names: dict[int, str] = {}
+
+    def build(self, rows: Iterable[tuple[int, ProductRow]], taxonomy: Callable[[], Taxonomy]) -> int:
+        """
+        Replace the whole index. Updates applied while the rows and the taxonomy are read are replayed on top of it,
+        so both are read from within: the rows lazily by iterating them, the taxonomy by calling taxonomy.
+
+        :param rows: (product ID, product row) of every product
+        :param taxonomy: Reads the category subtrees and the tag names
+        :return: Number of indexed products
+        """
+        with self._lock:
+            self._replay, self._replay_taxonomy = [], None
+        try:
+            rows = list(rows)
+            subtrees, tag_names = taxonomy()
+        except Exception:
+            with self._lock:
+                self._replay, self._replay_taxonomy = None, None
+            raise
+        with self._lock:
+            replay, self._replay = self._replay or [], None
+            replayed_taxonomy, self._replay_taxonomy = self._replay_taxonomy, None
+            self._reset(len(rows) + len(rows) // 8)
+            for product_id, row in rows:
+                self._apply(product_id, row)
+            for product_id, row in replay:
+                self._apply(product_id, row)
+            self.set_taxonomy(*(replayed_taxonomy or (subtrees, tag_names)))
+            self.ready = True
+            return len(self._rows)
+
+    def update(self, product_id: int, row: Optional[ProductRow]) -> None:
+        """
+        Patch the attributes of a product.
+
+        :param product_id: ID of the product
+        :param row: Current attributes, None when the product was deleted
+        """
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((product_id, row))
+            self._apply(product_id, row)
+
+    def set_taxonomy(self, subtrees: dict[int, list[int]], tag_names: dict[int, str]) -> None:
+        """
+        :param subtrees: Category ID mapped to the IDs of the categories it holds, itself included
+        :param tag_names: Tag ID mapped to its name
+        """
+        with self._lock:
+            if self._replay is not None:
+                self._replay_taxonomy = (subtrees, tag_names)
+            self._subtrees = dict(subtrees)
+            self._tag_names = {tag_id: (name or '').lower() for tag_id, name in tag_names.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset(0)
+
+    def _position(self, product_id: int) -> int:
+        position = self._positions.get(product_id)
+        if position is not None:
+            return position
+        if self._size == self._capacity:
+            self._grow()
+        position = self._positions[product_id] = self._size
+        self._ids[position] = product_id
+        self._size += 1
+        self._id_lookup = None
+        return position
+
+    def _grow(self) -> None:
+        extra = self._capacity
+        self._capacity += extra
+        self._ids = np.concatenate([self._ids, np.zeros(extra, dtype=np.int64)])
+        self._alive, self._in_stock, self._on_sale = (np.concatenate([bits, _bitset(extra)])
+                                                      for bits in (self._alive, self._in_stock, self._on_sale))
+        for bitsets in (self._categories, self._tags):
+            for key, bits in bitsets.items():
+                bitsets[key] = np.concatenate([bits, _bitset(extra)])
+        for name, values in self._columns.items():
+            self._columns[name] = np.concatenate([values, np.full(extra, np.nan)])
+
+    def _member_bitset(self, bitsets: dict[int, np.ndarray], key: int) -> np.ndarray:
+        bits = bitsets.get(key)
+        if bits is None:
+            bits = bitsets[key] = _bitset(self._capacity)
+        return bits
+
+    def _set_memberships(self, position: int, row: ProductRow, value: bool) -> None:
+        category_id, tag_ids = row[0], row[-1]
+        if category_id is not None:
+            _set_bit(self._member_bitset(self._categories, category_id), position, value)
+        for tag_id in tag_ids:
+            _set_bit(self._member_bitset(self._tags, tag_id), position, value)
+
+    def _set_column(self, name: str, position: int, value: Optional[float]) -> None:
+        column = self._columns[name]
+        value = np.nan if value is None else value
+        if column[position] == value or (np.isnan(column[position]) and np.isnan(value)):
+            return
+        column[position] = value
+        for sort_by, (column_name, _) in SORT_COLUMNS.items():
+            if column_name == name:
+                self._orders.pop(sort_by, None)
+
+    def _apply(self, product_id: int, row: Optional[ProductRow]) -> None:
+        old = self._rows.pop(product_id, None)
+        if row is None and old is None:
+            return
+        if old is None:
+            self._orders.clear()  # a new position enters every order
+        position = self._position(product_id)
+        if old is not None:
+            self._set_memberships(position, old, False)
+
+        _set_bit(self._alive, position, row is not None)
+        if row is None:
+            _set_bit(self._in_stock, position, False)
+            _set_bit(self._on_sale, position, False)
+            return
+
+        _, price, on_sale, on_sale_price, stock, rating, sales, views, trending, _ = row
+        self._rows[product_id] = row
+        self._set_memberships(position, row, True)
+        _set_bit(self._in_stock, position, stock > 0)
+        _set_bit(self._on_sale, position, on_sale == 1)
+        self._set_column('price', position, on_sale_price if on_sale == 1 else price)
+        self._set_column('rating', position, rating)
+        self._set_column('sales', position, sales)
+        self._set_column('views', position, views)
+        self._set_column('trending', position, trending)
+
+    def _sorted(self, sort_by: str, positions: np.ndarray) -> np.ndarray:
+        """Positions ordered by a sort option, NULLs last and ties kept in the given order."""
+        name, descending = SORT_COLUMNS[sort_by]
+        values = self._columns[name][positions]
+        return positions[np.argsort(-values if descending else values, kind='stable')]
+
+    def _order(self, sort_by: str) -> np.ndarray:
+        order = self._orders.get(sort_by)
+        if order is None:
+            order = self._orders[sort_by] = self._sorted(sort_by, np.arange(self._size))
+        return order
+
+    def _any(self, bitsets: dict[int, np.ndarray], keys: Iterable[int]) -> np.ndarray:
+        combined = _bitset(self._capacity)
+        for key in keys:
+            if key in bitsets:
+                combined |= bitsets[key]
+        return combined
+
+    def _ranked_positions(self, ranked_ids: list[int]) -> np.ndarray:
+        """Positions of the indexed products among ranked_ids, in their order, looked up in one binary search."""
+        if self._id_lookup is None:
+            order = np.argsort(self._ids[:self._size], kind='stable')
+            self._id_lookup = self._ids[order], order
+        sorted_ids, order = self._id_lookup
+        ranked = np.array(ranked_ids, dtype=np.int64)
+        if not len(sorted_ids) or not len(ranked):
+            return np.zeros(0, dtype=np.int64)
+        found = np.minimum(np.searchsorted(sorted_ids, ranked), len(sorted_ids) - 1)
+        return order[found[sorted_ids[found] == ranked]]
+
+    def _mask(self, category_id: Optional[int], tag_query: Optional[str],
+              price_range: Optional[tuple[int, Optional[int]]], on_sale: bool, in_stock: bool) -> np.ndarray:
+        """One boolean per position, whether the product matches the filters."""
+        bits = self._alive.copy()
+        if in_stock:
+            bits &= self._in_stock
+        if on_sale:
+            bits &= self._on_sale
+        if category_id is not None:
+            bits &= self._any(self._categories, self._subtrees.get(category_id, [category_id]))
+        if tag_query:
+            needle = tag_query.lower()
+            bits &= self._any(self._tags, [tag_id for tag_id, name in self._tag_names.items() if needle in name])
+        mask = np.unpackbits(bits, count=self._size, bitorder='little').view(bool)
+        if price_range is not None:
+            # Like the price band filter, products without a price count as free
+            price = np.nan_to_num(self._columns['price'][:self._size], nan=0.0)
+            low, high = price_range
+            mask &= price >= low
+            if high is not None:
+                mask &= price < high
+        return mask
+
+    def select(self, category_id: Optional[int] = None, tag_query: Optional[str] = None,
+               price_range: Optional[tuple[int, Optional[int]]] = None, on_sale: bool = False, in_stock: bool = True,
+               sort_by: Optional[str] = None, ranked_ids: Optional[list[int]] = None) -> Optional[ProductSelection]:
+        """
+        Resolve the criteria of filter_products.
+
+        :param category_id: Category whose products and those of the categories below it match
+        :param tag_query: Text the name of one of the product's tags must contain
+        :param price_range: Lower and upper (exclusive, None for open) limit of the current price in cents
+        :param on_sale: Only products on sale
+        :param in_stock: Only products in stock
+        :param sort_by: Key of a sort option
+        :param ranked_ids: Matches of a name search, best first; the order when not sorting
+        :return: The selection, None when the sort option is not indexed
+        """
+        if sort_by and sort_by not in SORT_COLUMNS:
+            return None
+        with self._lock:
+            mask = self._mask(category_id, tag_query, price_range, on_sale, in_stock)
+            if ranked_ids is not None:
+                positions = self._ranked_positions(ranked_ids)
+                positions = positions[mask[positions]]
+                if sort_by:
+                    positions = self._sorted(sort_by, positions)
+            elif sort_by:
+                order = self._order(sort_by)
+                positions = order[mask[order]]
+            else:
+                positions = np.flatnonzero(mask)
+            return ProductSelection(self._ids[positions])
+
+
+catalog_index = CatalogIndex()
+
+
+def mark_products_changed(session: Session | scoped_session[Session], product_ids: Iterable[int]) -> None:
+    """
+    Have the catalog index re-read products written without the ORM (e.g. stock UPDATEs) when the session commits.
+
+    :param session: Session whose transaction made the change
+    :param product_ids: IDs of the changed products
+    """
+    if catalog_index.ready:
+        session.info.setdefault(CHANGED_PRODUCTS_KEY, set()).update(product_ids)
+
+
+def read_product_rows(connection: Any, product_ids: Optional[list[int]] = None,
+                      batch_size: int = 500) -> dict[int, ProductRow]:
+    """
+    :param connection: Connection or session to read with
+    :param product_ids: Products to read, all of them when None
+    :param batch_size: Product IDs bound per statement
+    :return: Product ID mapped to the attributes the index holds, deleted products missing
+    """
+    columns = select(Product.id, Product.category_id, Product.price, Product.onSale, Product.onSalePrice,
+                     Product.stock, Product.rating_avg, Product.sales_score, Product.view_score,
+                     Product.trending_score).order_by(Product.id)
+    links = select(products_tags.c.product_id, products_tags.c.tag_id)
+    batches = [None] if product_ids is None else [product_ids[start:start + batch_size]
+                                                  for start in range(0, len(product_ids), batch_size)]
+    rows: dict[int, list[Any]] = {}
+    tags: dict[int, set[int]] = {}
+    for batch in batches:
+        product_query = columns if batch is None else columns.where(Product.id.in_(batch))
+        link_query = links if batch is None else links.where(products_tags.c.product_id.in_(batch))
+        for product_id, *values in connection.execute(product_query):
+            rows[product_id] = values
+        for product_id, tag_id in connection.execute(link_query):
+            tags.setdefault(product_id, set()).add(tag_id)
+    return {product_id: (*values, frozenset(tags.get(product_id, ()))) for product_id, values in rows.items()}
+
+
+def iter_product_rows(connection: Any) -> Iterator[tuple[int, ProductRow]]:
+    """
+    :param connection: Connection to read with, once iterated
+    :return: (product ID, product row) of every product
+    """
+    yield from read_product_rows(connection).items()
+
+
+def read_taxonomy(connection: Any) -> Taxonomy:
+    """:return: Category ID mapped to the IDs of the categories it holds, and tag ID mapped to its name"""
+    return read_subtrees(connection), dict(connection.execute(select(Tag.id, Tag.name)).all())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_products(session: Session, flush_context: Any) -> None:
+    if not catalog_index.ready:
+        return
+    changed = session.info.setdefault(CHANGED_PRODUCTS_KEY, set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, Product):
+            changed.add(instance.id)
+        elif isinstance(instance, (Category, Tag)):
+            session.info[CHANGED_TAXONOMY_KEY] = True
+
+
+@event.listens_for(Session, 'before_commit')
+def _read_changed_products(session: Session) -> None:
+    # No SQL can run once the transaction committed, so the rows are read now. before_commit runs ahead of the
+    # final flush, which is done here to collect its changes too
+    if not catalog_index.ready:
+        return
+    session.flush()
+    if not (session.info.get(CHANGED_PRODUCTS_KEY) or session.info.get(CHANGED_TAXONOMY_KEY)):
+        return
+    product_ids = sorted(session.info.pop(CHANGED_PRODUCTS_KEY, set()))
+    rows = read_product_rows(session, product_ids) if product_ids else {}
+    pending = {product_id: rows.get(product_id) for product_id in product_ids}
+    taxonomy = read_taxonomy(session) if session.info.pop(CHANGED_TAXONOMY_KEY, False) else None
+    session.info[PENDING_ROWS_KEY] = (pending, taxonomy)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changed_products(session: Session) -> None:
+    pending, taxonomy = session.info.pop(PENDING_ROWS_KEY, ({}, None))
+    for product_id, row in pending.items():
+        catalog_index.update(product_id, row)
+    if taxonomy is not None:
+        catalog_index.set_taxonomy(*taxonomy)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_products(session: Session) -> None:
+    for key in (CHANGED_PRODUCTS_KEY, CHANGED_TAXONOMY_KEY, PENDING_ROWS_KEY):
+        session.info.pop(key, None)
+
+
+def catalog_index_enabled(app: Flask) -> bool:
+    return bool(app.config.get('CATALOG_INDEX_ENABLED', True))
+
+
+def build_catalog_index(app: Flask) -> None:
+    """
+    (Re)build the catalog index from the database, when CATALOG_INDEX_ENABLED.
+
+    :param app: Flask application instance
+    """
+    if not catalog_index_enabled(app):
+        return
+    with app.app_context():
+        try:
+            started = time.perf_counter()
+            with db.engine.connect() as connection:
+                # Both read inside the build, which replays the commits landing meanwhile
+                indexed = catalog_index.build(iter_product_rows(connection), lambda: read_taxonomy(connection))
+            logging.info(f"Catalog index built for {indexed} product(s) in {time.perf_counter() - started:.2f} s")
+        except Exception as e:
+            logging.error(f"Error building the catalog index: {str(e)}")
@@ -0,0 +1,109 @@
+# /modular_store_backend/modules/commands.py
+import os
+from datetime import datetime
+from typing import Optional
+
+import click
+from flask import Flask, current_app
+
+from modular_store_backend.modules.db.backup import backup_database
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.index_advisor import advise_indexes
+from modular_store_backend.modules.db.product_search import rebuild_product_search
+from modular_store_backend.modules.db.wal_archive import restore_to_time, run_wal_archive
+from modular_store_backend.modules.rankings import half_lives, rebuild_rankings
+from modular_store_backend.modules.retention import enable_incremental_vacuum, run_retention
+from modular_store_backend.modules.reviews.ratings import recalculate_rating_aggregates
+from modular_store_backend.modules.startup_profiler import profile_imports
+
+
+def _check_restore_target(output: str) -> None:
+    if os.path.abspath(output) == os.path.abspath(current_app.config['DB_PATH']):
+        raise click.BadParameter('restore into a new file, not over the live database', param_hint='--output')
+
+
+def register_commands(app: Flask) -> None:
+    """
+    Register the maintenance commands available through the `flask` CLI.
+
+    :param app: Flask application instance
+    """
+
+    @app.cli.command('profile-startup')
+    @click.option('--top', default=15, show_default=True, help='Number of packages to list by import time.')
+    def profile_startup_command(top: int) -> None:
+        """Break down the time spent creating the application."""
+        imports = profile_imports()
+        click.echo(f"Imports of modular_store_backend.app: {sum(imports.values()) * 1000:.1f} ms")
+        for package, duration in sorted(imports.items(), key=lambda item: item[1], reverse=True)[:top]:
+            click.echo(f"  {package:<24} {duration * 1000:9.1f} ms")
+        click.echo(current_app.extensions['startup_profile'].format_report())
+
+    @app.cli.command('advise-indexes')
+    @click.option('--user-id', type=int, default=None, help='Log in as this user to include pages behind login.')
+    @click.option('--min-rows', default=100, show_default=True, help='Ignore scans of smaller tables.')
+    def advise_indexes_command(user_id: int, min_rows: int) -> None:
+        """Report full table scans in the queries of the hot pages (run it against a copy of the database)."""
+        findings = advise_indexes(current_app, user_id, min_rows)
+        if not findings:
+            click.echo(f"No full scans of tables with {min_rows} or more rows on the hot paths.")
+        for finding in findings:
+            click.echo(f"{finding['endpoint']}: full scan of {finding['table']} ({finding['rows']} rows)")
+            click.echo(f"  plan: {' | '.join(finding['plan'])}")
+            click.echo(f"  sql:  {' '.join(finding['statement'].split())[:300]}")
+
+    @app.cli.command('repair-ratings')
+    def repair_ratings_command() -> None:
+        """Recompute the review count and average rating stored on every product."""
+        repaired = recalculate_rating_aggregates()
+        click.echo(f"Repaired the rating aggregates of {repaired} product(s).")
+
+    _register_database_commands(app)
+
+
+def _register_database_commands(app: Flask) -> None:
+    @app.cli.command('backup-db')
+    def backup_db_command() -> None:
+        """Take an online backup of the database now, with the BACKUP_* settings."""
+        result = backup_database(current_app)
+        click.echo(result.summary() if result else "Backup failed, see the log.")
+
+    @app.cli.command('archive-wal')
+    def archive_wal_command() -> None:
+        """Archive the WAL frames committed since the last run, with the WAL_ARCHIVE_* settings."""
+        result = run_wal_archive(current_app)
+        click.echo(result.summary() if result else "WAL archiving failed or another run holds the archive lock, "
+                                                   "see the log.")
+
+    @app.cli.command('restore-db')
+    @click.option('--until', type=click.DateTime(formats=['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']),
+                  default=None, help='Point in time to restore, the latest archived state by default.')
+    @click.option('--output', required=True, type=click.Path(dir_okay=False), help='Database file to create.')
+    def restore_db_command(until: Optional[datetime], output: str) -> None:
+        """Rebuild the database from the WAL archive as of a point in time into a new file."""
+        _check_restore_target(output)
+        result = restore_to_time(current_app.config['WAL_ARCHIVE_DIR'], output, until)
+        click.echo(result.summary())
+
+    @app.cli.command('apply-retention')
+    @click.option('--enable-vacuum', is_flag=True,
+                  help='First switch the database to auto_vacuum=INCREMENTAL (a full VACUUM, blocks writers).')
+    def apply_retention_command(enable_vacuum: bool) -> None:
+        """Delete the expired rows of the RETENTION_POLICIES tables now and vacuum the freed pages."""
+        if enable_vacuum:
+            enable_incremental_vacuum(db.engine)
+        report = run_retention(current_app)
+        click.echo(report.summary() if report else "Retention failed, see the log.")
+
+    @app.cli.command('rebuild-rankings')
+    def rebuild_rankings_command() -> None:
+        """Recompute the best selling, most viewed and trending scores from the stored purchases and visits."""
+        ranked = rebuild_rankings(half_lives(current_app.config))
+        click.echo(f"Ranked {ranked} product(s).")
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command() -> None:
+        """Rewrite the full-text product search index from the products, tags and categories."""
+        with db.engine.begin() as connection:
+            indexed = rebuild_product_search(connection)
+        click.echo(f"Indexed {indexed} product(s).")
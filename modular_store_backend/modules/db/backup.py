@@ -1,33 +1,344 @@
 # /modular_store_backend/modules/db/backup.py
+import gzip
+import importlib
 import logging
 import os
-import shutil
+import re
+import sqlite3
+import time
 from datetime import datetime
+from typing import Any, BinaryIO, Iterable, Optional
 
 from flask import Flask
 
+BACKUP_PREFIX = 'database_backup_'
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+EXTENSIONS = {'zstd': '.db.zst', 'gzip': '.db.gz', 'none': '.db'}
+BACKUP_PATTERN = re.compile(rf'^{BACKUP_PREFIX}(\d{{8}}_\d{{6}})(\.db(?:\.zst|\.gz)?)$')
+CHUNK_SIZE = 1024 * 1024
 
-def backup_database(app: Flask) -> None:
-    # if not exists - create folder
-    if not os.path.exists(app.config['BACKUP_DIR']):
-        os.makedirs(app.config['BACKUP_DIR'])
+DEFAULT_RETENTION = {'hourly': 24, 'daily': 7, 'weekly': 4}
 
-    # Create a timestamp for the backup filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    # Create the backup filename
-    backup_file = f"database_backup_{timestamp}.db"
+class BackupResult:
+    """Outcome, timings (in seconds) and sizes (in bytes) of one backup run."""
 
-    # Create the backup file path
-    backup_path = os.path.join(app.config['BACKUP_DIR'], backup_file)
+    def __init__(self, path: str, compression: str) -> None:
+        self.path = path
+        self.compression = compression
+        self.database_size = 0
+        self.backup_size = 0
+        self.snapshot_time = 0.0
+        self.compress_time = 0.0
+        self.verify_time = 0.0
+        self.verified: Optional[bool] = None  # None when verification is disabled
+        self.pruned: list[str] = []
 
+    @property
+    def total_time(self) -> float:
+        return self.snapshot_time + self.compress_time + self.verify_time
+
+    def summary(self) -> str:
+        ratio = self.backup_size / self.database_size if self.database_size else 0
+        return (f"{os.path.normpath(self.path)}: {self.database_size / 1024:.0f} KiB -> "
+                f"{self.backup_size / 1024:.0f} KiB ({ratio:.0%}, {self.compression}); "
+                f"snapshot {self.snapshot_time:.2f} s, compress {self.compress_time:.2f} s, "
+                f"verify {self.verify_time:.2f} s, verified: {self.verified}, pruned: {len(self.pruned)}")
+
+
+def _zstandard() -> Any:
+    try:
+        return importlib.import_module('zstandard')
+    except ImportError:
+        return None
+
+
+def resolve_compression(requested: str) -> str:
+    """
+    Pick the compression to use, falling back to gzip when zstd is requested but zstandard is not installed.
+
+    :param requested: 'zstd', 'gzip' or 'none'
+    :return: Compression that will be used
+    """
+    if requested not in EXTENSIONS:
+        raise ValueError(f"Unknown backup compression: {requested}")
+    if requested == 'zstd' and _zstandard() is None:
+        logging.warning("zstandard is not installed, compressing backups with gzip")
+        return 'gzip'
+    return requested
+
+
+def compression_of(path: str) -> str:
+    if path.endswith('.zst'):
+        return 'zstd'
+    if path.endswith('.gz'):
+        return 'gzip'
+    return 'none'
+
+
+def open_compressed(path: str, mode: str, compression: str) -> BinaryIO:
+    """
+    Open a file for streaming binary reads ('rb') or writes ('wb') through a compression.
+
+    :param path: File to open
+    :param mode: 'rb' or 'wb'
+    :param compression: 'zstd', 'gzip' or 'none'
+    :return: File-like object, closing it closes the file
+    """
+    if compression == 'zstd':
+        zstandard = _zstandard()
+        raw = open(path, mode)
+        if mode == 'wb':
+            return zstandard.ZstdCompressor(level=3).stream_writer(raw)
+        return zstandard.ZstdDecompressor().stream_reader(raw)
+    if compression == 'gzip':
+        return gzip.open(path, mode, compresslevel=6)  # type: ignore[return-value]
+    return open(path, mode)  # type: ignore[return-value]
+
+
+def copy_stream(source: BinaryIO, target: BinaryIO) -> None:
+    while chunk := source.read(CHUNK_SIZE):
+        target.write(chunk)
+
+
+def compress_file(source_path: str, target_path: str, compression: str) -> None:
+    """
+    Stream a file into a compressed file chunk by chunk.
+
+    :param source_path: File to compress
+    :param target_path: Compressed file to write
+    :param compression: 'zstd', 'gzip' or 'none'
+    """
+    with open(source_path, 'rb') as source, open_compressed(target_path, 'wb', compression) as target:
+        copy_stream(source, target)
+
+
+def restore_backup(backup_path: str, target_path: str) -> None:
+    """
+    Decompress a backup into a database file.
+
+    :param backup_path: Backup written by backup_database
+    :param target_path: Database file to create, overwritten if it exists
+    """
+    with open_compressed(backup_path, 'rb', compression_of(backup_path)) as source, open(target_path, 'wb') as target:
+        copy_stream(source, target)
+
+
+def copy_snapshot(source: sqlite3.Connection, target_path: str, pages_per_step: int = 1024,
+                  step_sleep: float = 0.01) -> None:
+    """
+    Copy the database of a connection with the SQLite online backup API, `pages_per_step` pages at a time.
+
+    :param source: Connection to copy, a read transaction open on it fixes the copied snapshot
+    :param target_path: Database file to create
+    :param pages_per_step: Pages copied per step
+    :param step_sleep: Seconds to yield to other connections between steps
+    """
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages_per_step, sleep=step_sleep)
+        # A snapshot of a WAL database is a self-contained rollback journal file
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+
+
+def begin_read_snapshot(connection: sqlite3.Connection) -> None:
+    connection.execute("BEGIN")
+    connection.execute("SELECT count(*) FROM sqlite_master").fetchall()  # starts the read transaction
+
+
+def snapshot_database(database_path: str, target_path: str, pages_per_step: int = 1024,
+                      step_sleep: float = 0.01) -> None:
+    """
+    Copy a live database with the SQLite online backup API.
+
+    The copy proceeds `pages_per_step` pages at a time and yields between steps. In WAL mode the source
+    keeps a read transaction open for the whole copy: writers are never blocked, and the copy reads a fixed
+    snapshot instead of restarting after every concurrent commit.
+
+    :param database_path: Database to copy
+    :param target_path: Database file to create
+    :param pages_per_step: Pages copied per step
+    :param step_sleep: Seconds to yield to other connections between steps
+    """
+    source = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
     try:
-        # Copy the database file to the backup directory with the specified backup filename
-        shutil.copyfile(app.config['DB_PATH'], backup_path)
-        logging.info(f"Database backup created: {os.path.normpath(backup_path)}")
+        begin_read_snapshot(source)
+        copy_snapshot(source, target_path, pages_per_step, step_sleep)
+        source.rollback()
+    finally:
+        source.close()
+
+
+def check_integrity(database_path: str) -> bool:
+    connection = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
+    try:
+        result = connection.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        connection.close()
+    if result != [('ok',)]:
+        logging.error(f"Integrity check of {database_path} failed: {result[:10]}")
+        return False
+    return True
+
+
+def verify_backup(backup_path: str) -> bool:
+    """
+    Restore a backup into a temporary file and run PRAGMA integrity_check on it.
+
+    :param backup_path: Backup to verify
+    :return: Whether the restored database is intact
+    """
+    restored_path = f'{backup_path}.verify'
+    try:
+        restore_backup(backup_path, restored_path)
+        return check_integrity(restored_path)
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        logging.error(f"Could not restore {backup_path} for verification: {str(e)}")
+        return False
+    finally:
+        if os.path.exists(restored_path):
+            os.remove(restored_path)
+
+
+def list_backups(backup_dir: str) -> list[tuple[datetime, str]]:
+    """
+    Backups in a directory, newest first.
+
+    :param backup_dir: Directory written by backup_database
+    :return: (timestamp, path) pairs
+    """
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for name in os.listdir(backup_dir):
+        if match := BACKUP_PATTERN.match(name):
+            backups.append((datetime.strptime(match.group(1), TIMESTAMP_FORMAT), os.path.join(backup_dir, name)))
+    return sorted(backups, reverse=True)
+
+
+def select_backups_to_keep(timestamps: Iterable[datetime], retention: dict[str, int]) -> set[datetime]:
+    """
+    Apply a grandfather-father-son policy: keep the newest backup of each of the last `hourly` hours,
+    `daily` days and `weekly` ISO weeks that have a backup. The newest backup is always kept.
+
+    :param timestamps: Timestamps of the existing backups
+    :param retention: Number of hours, days and weeks to keep
+    :return: Timestamps to keep
+    """
+    ordered = sorted(timestamps, reverse=True)
+    buckets = {
+        'hourly': lambda moment: (moment.date(), moment.hour),
+        'daily': lambda moment: moment.date(),
+        'weekly': lambda moment: moment.isocalendar()[:2],
+    }
+    keep = set(ordered[:1])
+    for period, bucket_of in buckets.items():
+        seen = set()
+        for moment in ordered:
+            bucket = bucket_of(moment)
+            if bucket in seen:
+                continue
+            if len(seen) >= retention.get(period, 0):
+                break
+            seen.add(bucket)
+            keep.add(moment)
+    return keep
+
+
+def prune_backups(backup_dir: str, retention: dict[str, int]) -> list[str]:
+    """
+    Delete the backups the retention policy does not keep.
+
+    :param backup_dir: Directory written by backup_database
+    :param retention: Number of hours, days and weeks to keep
+    :return: Paths of the deleted backups
+    """
+    backups = list_backups(backup_dir)
+    keep = select_backups_to_keep((timestamp for timestamp, _ in backups), retention)
+    pruned = []
+    for timestamp, path in backups:
+        if timestamp not in keep:
+            os.remove(path)
+            pruned.append(path)
+    return pruned
+
+
+def create_backup(database_path: str, backup_dir: str, compression: str = 'zstd', verify: bool = True,
+                  retention: Optional[dict[str, int]] = None, pages_per_step: int = 1024,
+                  step_sleep: float = 0.01, now: Optional[datetime] = None) -> BackupResult:
+    """
+    Snapshot a live database, compress the snapshot, verify it and apply the retention policy.
+
+    :param database_path: SQLite database file
+    :param backup_dir: Directory for the backups, created if missing
+    :param compression: 'zstd', 'gzip' or 'none'
+    :param verify: Restore the backup and check its integrity, a backup failing the check is deleted
+    :param retention: Hours, days and weeks to keep, DEFAULT_RETENTION if None
+    :param pages_per_step: Pages copied per step of the online backup
+    :param step_sleep: Seconds to yield between steps
+    :param now: Timestamp of the backup
+    :return: Timings and sizes of the run
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    compression = resolve_compression(compression)
+    timestamp = (now or datetime.now()).strftime(TIMESTAMP_FORMAT)
+    result = BackupResult(os.path.join(backup_dir, f'{BACKUP_PREFIX}{timestamp}{EXTENSIONS[compression]}'),
+                          compression)
+    snapshot_path = os.path.join(backup_dir, f'.{BACKUP_PREFIX}{timestamp}.snapshot')
+
+    try:
+        started = time.perf_counter()
+        snapshot_database(database_path, snapshot_path, pages_per_step, step_sleep)
+        result.snapshot_time = time.perf_counter() - started
+        result.database_size = os.path.getsize(snapshot_path)
+
+        started = time.perf_counter()
+        if compression == 'none':
+            os.replace(snapshot_path, result.path)
+        else:
+            compress_file(snapshot_path, result.path, compression)
+        result.compress_time = time.perf_counter() - started
+        result.backup_size = os.path.getsize(result.path)
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+    if verify:
+        started = time.perf_counter()
+        result.verified = verify_backup(result.path)
+        result.verify_time = time.perf_counter() - started
+        if not result.verified:
+            os.remove(result.path)  # never let a broken backup push an intact one out of the retention window
+            return result
+
+    result.pruned = prune_backups(backup_dir, retention or DEFAULT_RETENTION)
+    return result
+
+
+def backup_database(app: Flask) -> Optional[BackupResult]:
+    """
+    Scheduled job: back up DB_PATH into BACKUP_DIR with the BACKUP_* settings.
+
+    :param app: Flask application instance
+    :return: The result of the run, None if it failed with an error
+    """
+    try:
+        result = create_backup(
+            app.config['DB_PATH'],
+            app.config['BACKUP_DIR'],
+            compression=app.config.get('BACKUP_COMPRESSION', 'zstd'),
+            verify=app.config.get('BACKUP_VERIFY', True),
+            retention=app.config.get('BACKUP_RETENTION', DEFAULT_RETENTION),
+            pages_per_step=app.config.get('BACKUP_PAGES_PER_STEP', 1024),
+            step_sleep=app.config.get('BACKUP_STEP_SLEEP', 0.01),
+        )
+        if result.verified is False:
+            logging.error(f"Database backup failed verification and was deleted: {result.summary()}")
+        else:
+            logging.info(f"Database backup created: {result.summary()}")
+        return result
     except Exception as e:
         logging.error(f"Error creating database backup: {str(e)}")
-
-# Run the backup function
-# backup_database()
-# print('backup turned off in backup.py')
+        return None
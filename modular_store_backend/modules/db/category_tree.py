@@ -0,0 +1,119 @@
+# /modular_store_backend/modules/db/category_tree.py
+"""
+Closure table of the category tree: one (ancestor, descendant, depth) row per pair of categories on the same path,
+so the categories below a category at any depth are one indexed lookup (ancestor_id is the leading primary key
+column) and its breadcrumb trail is another (the index on descendant_id).
+
+SQLite triggers on categories keep the table in sync with every writer (admin edits, ORM, bulk SQL): an insert adds
+the paths to the new category, moving a category (changing parent_id) rewrites the paths from outside its subtree
+into it, and deleting one detaches its subcategories. Moving a category below itself is rejected.
+"""
+from typing import Any
+
+from sqlalchemy import MetaData, Select, column, event, select, table, text
+from sqlalchemy.engine import Connection
+
+CLOSURE_TABLE = 'category_closure'
+MAX_DEPTH = 64  # stops the rebuild on parent_id cycles of data written before the triggers existed
+
+_SUBTREE = f"SELECT descendant_id FROM {CLOSURE_TABLE} WHERE ancestor_id = {{id}}"
+
+TRIGGERS = {
+    'category_tree_insert': (
+        "AFTER INSERT ON categories BEGIN "
+        f"INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth) VALUES (new.id, new.id, 0); "
+        f"INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth) "
+        f"SELECT ancestor_id, new.id, depth + 1 FROM {CLOSURE_TABLE} WHERE descendant_id = new.parent_id; END"),
+    'category_tree_cycle': (
+        "BEFORE UPDATE OF parent_id ON categories WHEN new.parent_id IS NOT NULL AND EXISTS ("
+        f"SELECT 1 FROM {CLOSURE_TABLE} WHERE ancestor_id = new.id AND descendant_id = new.parent_id) "
+        "BEGIN SELECT RAISE(ABORT, 'A category cannot be moved below itself'); END"),
+    'category_tree_move': (
+        "AFTER UPDATE OF parent_id ON categories WHEN new.parent_id IS NOT old.parent_id BEGIN "
+        f"DELETE FROM {CLOSURE_TABLE} WHERE descendant_id IN ({_SUBTREE.format(id='new.id')}) "
+        f"AND ancestor_id NOT IN ({_SUBTREE.format(id='new.id')}); "
+        f"INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth) "
+        "SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1 "
+        f"FROM {CLOSURE_TABLE} above, {CLOSURE_TABLE} below "
+        "WHERE above.descendant_id = new.parent_id AND below.ancestor_id = new.id; END"),
+    'category_tree_delete': (
+        "AFTER DELETE ON categories BEGIN "
+        f"DELETE FROM {CLOSURE_TABLE} WHERE descendant_id IN ({_SUBTREE.format(id='old.id')}) "
+        f"AND ancestor_id NOT IN ({_SUBTREE.format(id='old.id')} AND descendant_id != old.id); END"),
+}
+
+
+def rebuild_category_tree(connection: Connection) -> int:
+    """
+    Rewrite the closure table from categories.parent_id.
+
+    :return: Number of paths written
+    """
+    connection.exec_driver_sql(f"DELETE FROM {CLOSURE_TABLE}")
+    result = connection.exec_driver_sql(f"""
+        INSERT INTO {CLOSURE_TABLE} (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE paths(ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM categories
+            UNION ALL
+            SELECT paths.ancestor_id, categories.id, paths.depth + 1
+            FROM paths JOIN categories ON categories.parent_id = paths.descendant_id
+            WHERE paths.depth < {MAX_DEPTH}
+        )
+        SELECT ancestor_id, descendant_id, min(depth) FROM paths GROUP BY ancestor_id, descendant_id""")
+    return result.rowcount
+
+
+def create_category_tree(connection: Connection) -> bool:
+    """
+    Create the triggers if missing, and fill the closure table when it is empty but categories exist (a database
+    from before the table).
+
+    :param connection: Connection to a SQLite database with the categories and category_closure tables
+    :return: Whether the table was filled
+    """
+    for name, definition in TRIGGERS.items():
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {definition}")
+    missing = connection.execute(text(
+        f"SELECT 1 FROM categories WHERE NOT EXISTS (SELECT 1 FROM {CLOSURE_TABLE}) LIMIT 1")).first() is not None
+    if missing:
+        rebuild_category_tree(connection)
+    return missing
+
+
+def drop_category_tree(connection: Connection) -> None:
+    for name in TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+
+
+_closure = table(CLOSURE_TABLE, column('ancestor_id'), column('descendant_id'), column('depth'))
+
+
+def subtree_ids(category_id: int) -> Select:
+    """:return: Query of the IDs of a category and of every category below it"""
+    return select(_closure.c.descendant_id).where(_closure.c.ancestor_id == category_id)
+
+
+def read_subtrees(connection: Any) -> dict[int, list[int]]:
+    """
+    :param connection: Connection or session to read with
+    :return: Category ID mapped to its own ID and the IDs of every category below it
+    """
+    subtrees: dict[int, list[int]] = {}
+    for ancestor_id, descendant_id in connection.execute(select(_closure.c.ancestor_id, _closure.c.descendant_id)):
+        subtrees.setdefault(ancestor_id, []).append(descendant_id)
+    return subtrees
+
+
+def _create_after_tables(target: MetaData, connection: Connection, **kwargs: Any) -> None:
+    if connection.dialect.name == 'sqlite' and CLOSURE_TABLE in target.tables:
+        create_category_tree(connection)
+
+
+def register_category_tree(metadata: MetaData) -> None:
+    """
+    Create the triggers with every create_all of the metadata (existing databases get them on the next start). They
+    go with their table on drop_all.
+
+    :param metadata: Metadata holding the categories and category_closure tables
+    """
+    event.listen(metadata, 'after_create', _create_after_tables)
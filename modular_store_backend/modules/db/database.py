@@ -1,19 +1,83 @@
 # /modular_store_backend/modules/db/database.py
-from typing import Optional
+import os
+import random
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Any, Iterator, Sequence
 
-from flask import Flask
-from sqlalchemy import create_engine
+from flask import Flask, has_request_context, request
+from sqlalchemy import create_engine, event, Select
 from sqlalchemy.engine import Engine
-from sqlalchemy.orm import DeclarativeBase, scoped_session, sessionmaker, Session
+from sqlalchemy.orm import DeclarativeBase, scoped_session, sessionmaker, Session, SessionTransaction
+
+from modular_store_backend.modules.db.category_tree import register_category_tree
+from modular_store_backend.modules.db.product_search import register_product_search
+from modular_store_backend.modules.db.sqlite_tuning import apply_sqlite_pragmas, get_sqlite_pragmas, is_sqlite, \
+    is_in_memory, pragmas_from_config
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Keys in Session.info
+READ_ONLY_KEY = 'read_only'
+WROTE_KEY = 'wrote'
 
 
 class Base(DeclarativeBase):
     pass
 
 
+register_product_search(Base.metadata)
+register_category_tree(Base.metadata)
+
+
+class RoutingSession(Session):
+    """
+    Session that runs plain SELECTs of read-only requests on a read engine.
+
+    Everything else goes to the primary engine: flushes, DML, SELECT ... FOR UPDATE, raw SQL, and every statement
+    after the current transaction has written, so a transaction reads its own writes.
+    """
+
+    def __init__(self, *args: Any, read_engines: Sequence[Engine] = (), **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.read_engines = list(read_engines)
+
+    def get_bind(self, mapper: Any = None, *, clause: Any = None, **kw: Any) -> Any:
+        if self.read_engines and self._is_replica_read(clause):
+            return random.choice(self.read_engines)
+        return super().get_bind(mapper, clause=clause, **kw)
+
+    def _is_replica_read(self, clause: Any) -> bool:
+        if self._flushing or self.info.get(WROTE_KEY):
+            return False
+        if not isinstance(clause, Select) or clause._for_update_arg is not None:
+            return False
+        if READ_ONLY_KEY in self.info:
+            return bool(self.info[READ_ONLY_KEY])
+        return has_request_context() and request.method in READ_ONLY_METHODS
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_dml_as_write(orm_execute_state: Any) -> None:
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info[WROTE_KEY] = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_flush_as_write(session: Session, flush_context: Any) -> None:
+    session.info[WROTE_KEY] = True
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_write_flag(session: Session, transaction: SessionTransaction) -> None:
+    if transaction.parent is None:
+        session.info.pop(WROTE_KEY, None)
+
+
 class Database:
     def __init__(self) -> None:  # lazy initialization
         self._engine: Optional[Engine] = None
+        self._read_engines: Optional[list[Engine]] = None
         self._session: Optional[scoped_session[Session]] = None
         self._app: Optional[Flask] = None
         self.metadata = Base.metadata
@@ -32,22 +96,82 @@ class Database:
                 echo=self._app.config.get('SQLALCHEMY_ECHO', False),
                 pool_size=self._app.config.get('SQLALCHEMY_POOL_SIZE', 5),
             )
+            if is_sqlite(self._engine):
+                apply_sqlite_pragmas(self._engine, pragmas_from_config(self._app.config))
         return self._engine
 
+    @property
+    def read_engines(self) -> list[Engine]:
+        """
+        Engines that serve reads routed away from the primary, empty when reads stay on the primary.
+
+        SQLALCHEMY_READ_REPLICA_URIS lists replicas explicitly. Without them, a SQLite database file in WAL mode
+        gets a second pool of read-only (mode=ro, query_only) connections to the same file.
+        """
+        if self._read_engines is None:
+            if self._app is None:
+                raise RuntimeError("Application not initialized. Call init_app() first.")
+            config = self._app.config
+            pool_size = config.get('SQLALCHEMY_READ_POOL_SIZE', config.get('SQLALCHEMY_POOL_SIZE', 5))
+            uris = list(config.get('SQLALCHEMY_READ_REPLICA_URIS') or [])
+            if not uris and config.get('SQLALCHEMY_READ_ONLY_ENGINE', False):
+                uris = self._sqlite_read_only_uris()
+
+            self._read_engines = []
+            for uri in uris:
+                engine = create_engine(uri, echo=config.get('SQLALCHEMY_ECHO', False), pool_size=pool_size)
+                if is_sqlite(engine):
+                    # journal_mode writes to the database header, query_only rejects writes on these connections
+                    apply_sqlite_pragmas(engine, {**pragmas_from_config(config),
+                                                  'journal_mode': None, 'query_only': 'ON'})
+                self._read_engines.append(engine)
+        return self._read_engines
+
+    def _sqlite_read_only_uris(self) -> list[str]:
+        assert self._app is not None
+        engine = self.engine
+        if not is_sqlite(engine) or is_in_memory(engine):
+            return []
+        # Without WAL a reader would block the primary from committing
+        pragmas = get_sqlite_pragmas(engine, pragmas_from_config(self._app.config))
+        if str(pragmas.get('journal_mode', '')).upper() != 'WAL':
+            return []
+        path = Path(os.path.abspath(str(engine.url.database)))
+        return [f"sqlite:///{path.as_uri()}?mode=ro&uri=true"]
+
     @property
     def session(self) -> scoped_session[Session]:
         if self._session is None:
             if self._app is None:
                 raise RuntimeError("Application not initialized. Call init_app() first.")
-            self._session = self.create_session(self.engine)
+            self._session = self.create_session(self.engine, self.read_engines)
         return self._session
 
+    @contextmanager
+    def read_session(self) -> Iterator[Session]:
+        """
+        Route the SELECTs of the block to a read engine, whatever the request method.
+
+        Statements still go to the primary once the current transaction has written.
+        """
+        session = self.session()
+        previous = session.info.get(READ_ONLY_KEY)
+        session.info[READ_ONLY_KEY] = True
+        try:
+            yield session
+        finally:
+            if previous is None:
+                session.info.pop(READ_ONLY_KEY, None)
+            else:
+                session.info[READ_ONLY_KEY] = previous
+
     def close(self, exception: Optional[Exception] = None) -> None:
         if self._session is not None:
             self._session.remove()
 
-    def create_session(self, engine: Engine) -> scoped_session[Session]:
-        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def create_session(self, engine: Engine, read_engines: Sequence[Engine] = ()) -> scoped_session[Session]:
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine,
+                                       class_=RoutingSession, read_engines=read_engines)
         return scoped_session(session_factory)
 
     def init_db(self) -> None:
@@ -0,0 +1,156 @@
+# /modular_store_backend/modules/db/index_advisor.py
+import re
+from typing import Any, Optional
+
+from flask import Flask, has_request_context, request, url_for
+from sqlalchemy import event, func, select, text
+from sqlalchemy.engine import Engine
+
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Product, Purchase
+
+# GET endpoints on the hot path, None values are filled with an existing row id
+HOT_ENDPOINTS: list[tuple[str, dict[str, Any]]] = [
+    ('main.index', {}),
+    ('main.index', {'page': 2}),
+    ('main.search_route', {'query': 'a'}),
+    ('filter.filter_route', {}),
+    ('main.product_page', {'product_id': None}),
+    ('main.recommendations', {}),
+    ('carts.cart', {}),
+    ('compare.compare_products', {}),
+    ('purchase_history.purchase_history', {}),
+    ('purchase_history.purchase_details', {'purchase_id': None}),
+    ('profile.notifications', {}),
+    ('tickets.list_tickets', {}),
+]
+
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+ALIAS_PATTERN = re.compile(r'\b(\w+) AS (\w+)\b')
+
+
+class StatementRecorder:
+    """Collects the distinct SQL statements executed while it is attached, with the endpoint that issued them."""
+
+    def __init__(self) -> None:
+        self.statements: dict[str, dict[str, Any]] = {}
+
+    def __enter__(self) -> 'StatementRecorder':
+        event.listen(Engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        event.remove(Engine, 'before_cursor_execute', self._record)
+
+    def _record(self, connection: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                executemany: bool) -> None:
+        if executemany or not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return
+        endpoint = request.endpoint if has_request_context() else None
+        self.statements.setdefault(statement, {'parameters': parameters, 'endpoint': endpoint})
+
+
+def find_full_scans(plan: list[str], statement: str, tables: set[str]) -> list[str]:
+    """
+    Pick the tables a query plan reads row by row without an index.
+
+    :param plan: Detail column of EXPLAIN QUERY PLAN
+    :param statement: The explained statement, used to resolve table aliases
+    :param tables: Names of the application tables
+    :return: Names of the scanned tables
+    """
+    aliases = {alias: table for table, alias in ALIAS_PATTERN.findall(statement) if table in tables}
+    scanned = []
+    for detail in plan:
+        if not detail.startswith('SCAN ') or ' USING ' in detail:
+            continue  # SEARCH, index scans and covering index scans
+        name = detail.split()[1]
+        table = aliases.get(name, name)
+        if table in tables:
+            scanned.append(table)
+    return scanned
+
+
+def explain(engine: Engine, statement: str, parameters: Any) -> list[str]:
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[3] for row in rows]
+
+
+def _fill_ids(values: dict[str, Any]) -> Optional[dict[str, Any]]:
+    sample_ids = {
+        'product_id': lambda: db.session.scalar(select(func.min(Product.id))),
+        'purchase_id': lambda: db.session.scalar(select(func.min(Purchase.id))),
+    }
+    filled = dict(values)
+    for name, value in values.items():
+        if value is None:
+            filled[name] = sample_ids[name]()
+            if filled[name] is None:
+                return None
+    return filled
+
+
+def record_hot_path_statements(app: Flask, user_id: Optional[int] = None) -> StatementRecorder:
+    """
+    Request every hot endpoint through the test client and record the SQL it runs.
+
+    Handlers run for real, so point the app at a copy of the production database: they may write
+    (recently viewed products, request logs).
+
+    :param app: Flask application instance
+    :param user_id: User to log in as, so pages behind login are requested too
+    :return: Recorder with the executed statements
+    """
+    client = app.test_client()
+    if user_id is not None:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+
+    urls = []
+    with app.test_request_context():
+        for endpoint, values in HOT_ENDPOINTS:
+            filled = _fill_ids(values)
+            if filled is not None:  # no row to show yet
+                urls.append(url_for(endpoint, **filled))
+        db.session.remove()
+
+    with StatementRecorder() as recorder:
+        for url in urls:
+            client.get(url)
+    return recorder
+
+
+def advise_indexes(app: Flask, user_id: Optional[int] = None, min_rows: int = 0) -> list[dict[str, Any]]:
+    """
+    Report the full table scans in the query plans of the statements issued by the hot endpoints.
+
+    :param app: Flask application instance
+    :param user_id: User to log in as while requesting the endpoints
+    :param min_rows: Ignore scans of tables with fewer rows, where a scan is as cheap as an index lookup
+    :return: Scans, largest table first, with the endpoint, table, row count, plan and statement
+    """
+    recorder = record_hot_path_statements(app, user_id)
+    tables = set(db.metadata.tables)
+    row_counts: dict[str, int] = {}
+    findings = []
+
+    with app.app_context():
+        for statement, details in recorder.statements.items():
+            plan = explain(db.engine, statement, details['parameters'])
+            for table in find_full_scans(plan, statement, tables):
+                if table not in row_counts:
+                    with db.engine.connect() as connection:
+                        row_counts[table] = connection.execute(text(f'SELECT count(*) FROM "{table}"')).scalar_one()
+                if row_counts[table] < min_rows:
+                    continue
+                findings.append({
+                    'endpoint': details['endpoint'],
+                    'table': table,
+                    'rows': row_counts[table],
+                    'plan': plan,
+                    'statement': statement,
+                })
+
+    return sorted(findings, key=lambda finding: finding['rows'], reverse=True)
@@ -1,4 +1,5 @@
 # /modular_store_backend/modules/db/models.py
+import logging
 import os
 from datetime import datetime, date, timedelta
 from typing import List, Optional
@@ -6,7 +7,7 @@ from typing import Tuple
 
 from flask import current_app
 from flask_login import current_user, UserMixin
-from sqlalchemy import ForeignKey, Table, Column, CheckConstraint, UniqueConstraint
+from sqlalchemy import ForeignKey, Table, Column, CheckConstraint, UniqueConstraint, Index
 from sqlalchemy import String, Text, Integer, Boolean, DateTime, Date, Float
 from sqlalchemy import func, case
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -14,6 +15,7 @@ from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.orm import backref, joinedload
 
 from modular_store_backend.modules.db.database import Base, db
+from modular_store_backend.modules.presence import presence_tracker
 
 
 class User(Base, UserMixin):  # type: ignore
@@ -38,6 +40,8 @@ class User(Base, UserMixin):  # type: ignore
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     last_seen: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow,
                                                 onupdate=datetime.utcnow)
+    # Raised by every ORM update of the row, cached identities of an older version are reloaded (identity_cache.py)
+    identity_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
 
     addresses: Mapped[List["Address"]] = relationship('Address', backref='user', lazy='select')
     cart_items: Mapped[List["Cart"]] = relationship('Cart', backref='user', lazy='select')
@@ -59,14 +63,25 @@ class User(Base, UserMixin):  # type: ignore
     def __str__(self) -> str:
         return self.username
 
+    @property
+    def last_active(self) -> Optional[datetime]:
+        """
+        Latest activity of the user, including timestamps the presence tracker has not flushed yet.
+        """
+        tracked: Optional[datetime] = presence_tracker.last_seen(self.id)
+        if tracked and (self.last_seen is None or tracked > self.last_seen):
+            return tracked
+        return self.last_seen
+
     def is_session_expired(self, expiration_time: timedelta) -> bool:
-        if self.last_seen is None:
+        last_active = self.last_active
+        if last_active is None:
             return True
-        return datetime.utcnow() - self.last_seen > expiration_time
+        return datetime.utcnow() - last_active > expiration_time
 
     def is_online(self, timout_in_minutes: int = 5) -> bool:
-        if self.last_seen:
-            return datetime.utcnow() - self.last_seen < timedelta(minutes=timout_in_minutes)
+        if last_active := self.last_active:
+            return datetime.utcnow() - last_active < timedelta(minutes=timout_in_minutes)
         return False
 
     @hybrid_property
@@ -119,6 +134,10 @@ class RecentlyViewedProduct(Base):
 
     product: Mapped["Product"] = relationship('Product', backref='recently_viewed_by', lazy='select')
 
+    __table_args__ = (
+        Index('ix_recently_viewed_products_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
     def __str__(self) -> str:
         return f'RecentlyViewedProduct {self.id}'
 
@@ -153,15 +172,17 @@ class Cart(Base):
         return f'Cart {self.id}'
 
     @staticmethod
-    def update_stock(product_id: int, quantity: int) -> None:
+    def update_stock(product_id: int, quantity: int) -> bool:
         """
         Update the stock of a product item after a purchase.
+
+        :return: False if there was not enough stock, which is then left unchanged
         """
+        from modular_store_backend.modules.stock import reserve_stock  # the stock service imports the models
 
-        product: Optional[Product] = db.session.get(Product, product_id)
-        if product:
-            product.stock -= quantity
-            db.session.commit()
+        reservation = reserve_stock([(product_id, quantity)])
+        db.session.commit()
+        return reservation.ok
 
     @staticmethod
     def total_quantity() -> int:
@@ -250,6 +271,14 @@ class Product(Base):
     description: Mapped[Optional[str]] = mapped_column(Text)
     category_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey('categories.id'), index=True)
     stock: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Kept in step with the reviews table by modules/reviews/ratings.py
+    review_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    rating_sum: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')
+    rating_avg: Mapped[float] = mapped_column(Float, nullable=False, default=0.0, server_default='0', index=True)
+    # Forward-decayed popularity, folded in by modules/rankings.py
+    sales_score: Mapped[float] = mapped_column(Float, nullable=False, default=0.0, server_default='0', index=True)
+    view_score: Mapped[float] = mapped_column(Float, nullable=False, default=0.0, server_default='0', index=True)
+    trending_score: Mapped[float] = mapped_column(Float, nullable=False, default=0.0, server_default='0', index=True)
 
     category: Mapped["Category"] = relationship('Category', backref='products', lazy='select')
     purchase_items: Mapped[List["PurchaseItem"]] = relationship('PurchaseItem', lazy='select', passive_deletes=True)
@@ -284,20 +313,12 @@ class Product(Base):
         return f'{self.samplename}: {sample_description}'
 
     @hybrid_property
-    def avg_rating(self) -> Optional[float]:
-        if self.reviews:
-            return db.session.query(func.avg(Review.rating)).filter_by(product_id=self.id).scalar() or 0
-        return 0
+    def avg_rating(self) -> float:
+        return self.rating_avg or 0
 
     @avg_rating.expression  # type: ignore[no-redef]
-    def avg_rating(cls) -> Optional[float]:
-        return func.coalesce(
-            db.session.query(func.avg(Review.rating))
-            .filter(Review.product_id == cls.id)
-            .correlate(cls)
-            .scalar_subquery(),
-            0
-        )
+    def avg_rating(cls) -> float:
+        return cls.rating_avg
 
     @hybrid_property
     def current_price(self):
@@ -383,6 +404,10 @@ class Purchase(Base):
     items: Mapped[List["PurchaseItem"]] = relationship('PurchaseItem', lazy='joined')
     shipping_address: Mapped[Optional["ShippingAddress"]] = relationship('ShippingAddress', uselist=False)
 
+    __table_args__ = (
+        Index('ix_purchases_user_id_date', 'user_id', 'date'),
+    )
+
     @hybrid_property
     def items_subtotal(self) -> int:
         return sum(item.quantity * item.price for item in self.items)
@@ -396,15 +421,25 @@ class Purchase(Base):
         )
 
     @staticmethod
-    def update_stock(purchase: 'Purchase', reverse: bool = False) -> None:
-        for item in purchase.items:
-            product = db.session.get(Product, item.product_id)
-            if product:
-                if reverse:
-                    product.stock += item.quantity  # order cancelled, returning stock
-                else:
-                    product.stock -= item.quantity  # order placed, reducing stock
+    def update_stock(purchase: 'Purchase', reverse: bool = False) -> bool:
+        """
+        Take the stock of an order, or return it when the order is cancelled.
+
+        :return: False if a product did not have enough stock, no stock is taken then
+        """
+        from modular_store_backend.modules.stock import release_stock, reserve_stock
+
+        items = [(item.product_id, item.quantity) for item in purchase.items]
+        if reverse:
+            release_stock(items)  # order cancelled, returning stock
+            reserved = True
+        else:
+            reservation = reserve_stock(items)  # order placed, reducing stock
+            reserved = reservation.ok
+            if not reserved:
+                logging.warning(f"Not enough stock for purchase {purchase.id}: {reservation.failed}")
         db.session.commit()
+        return reserved
 
 
 class ShippingMethod(Base):
@@ -427,6 +462,10 @@ class PurchaseItem(Base):
     purchase: Mapped["Purchase"] = relationship("Purchase", back_populates="items")
     product: Mapped["Product"] = relationship("Product", back_populates="purchase_items", lazy="joined")
 
+    __table_args__ = (
+        Index('ix_purchase_items_product_id_purchase_id', 'product_id', 'purchase_id'),
+    )
+
     def __str__(self) -> str:
         return f'PurchaseItem {self.id}: {self.quantity} x {self.product.samplename if self.product else "Unknown"}'
 
@@ -452,8 +491,10 @@ class Review(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=False, index=True)
-    product_id: Mapped[int] = mapped_column(Integer, ForeignKey('products.id'), nullable=False, index=True)
-    rating: Mapped[int] = mapped_column(Integer, nullable=False)
+    # active_history loads the previous value on change, needed to adjust the product rating aggregates
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey('products.id'), nullable=False, index=True,
+                                            active_history=True)
+    rating: Mapped[int] = mapped_column(Integer, nullable=False, active_history=True)
     review: Mapped[Optional[str]] = mapped_column(Text)
     title: Mapped[Optional[str]] = mapped_column(Text)
     pros: Mapped[Optional[str]] = mapped_column(Text)
@@ -466,6 +507,8 @@ class Review(Base):
 
     __table_args__ = (
         CheckConstraint('rating >= 1 AND rating <= 5'),
+        Index('ix_reviews_product_id_date', 'product_id', 'date'),
+        Index('ix_reviews_user_id_product_id', 'user_id', 'product_id'),
     )
 
     def __str__(self) -> str:
@@ -554,6 +597,10 @@ class Wishlist(Base):
 
     product: Mapped["Product"] = relationship("Product", back_populates="wishlist_items")
 
+    __table_args__ = (
+        Index('ix_wishlists_user_id_product_id', 'user_id', 'product_id'),
+    )
+
     def __str__(self) -> str:
         return f'Wishlist {self.id}'
 
@@ -562,7 +609,7 @@ class ProductSelectionOption(Base):
     __tablename__ = 'product_selection_option'
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    product_id: Mapped[int] = mapped_column(Integer, ForeignKey('products.id'), nullable=False)
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey('products.id'), nullable=False, index=True)
     name: Mapped[str] = mapped_column(Text, nullable=False)
     value: Mapped[str] = mapped_column(Text, nullable=False)
 
@@ -607,6 +654,10 @@ class Notification(Base):
     read: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
     created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.current_timestamp())
 
+    __table_args__ = (
+        Index('ix_notifications_user_id_read', 'user_id', 'read'),
+    )
+
     def __str__(self) -> str:
         return f'{self.message[:20]}..' if len(self.message) > 22 else self.message
 
@@ -627,6 +678,15 @@ products_tags = Table(
     Column('tag_id', Integer, ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True)
 )
 
+# Every (ancestor, descendant) pair of the category tree, each category its own ancestor at depth 0. Maintained by
+# the triggers of modules/db/category_tree.py
+category_closure = Table(
+    'category_closure', Base.metadata,
+    Column('ancestor_id', Integer, ForeignKey('categories.id', ondelete='CASCADE'), primary_key=True),
+    Column('descendant_id', Integer, ForeignKey('categories.id', ondelete='CASCADE'), primary_key=True, index=True),
+    Column('depth', Integer, nullable=False)
+)
+
 
 class RequestLog(Base):
     __tablename__ = 'request_logs'
@@ -639,9 +699,76 @@ class RequestLog(Base):
     status_code: Mapped[int] = mapped_column(Integer, nullable=False)
     execution_time: Mapped[float] = mapped_column(Float, nullable=False)
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    query_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    db_time: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # in seconds
+    repeated_queries: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON {statement shape: count}
 
     user: Mapped[Optional["User"]] = relationship('User', backref='request_logs', lazy='joined')
 
+    __table_args__ = (
+        Index('ix_request_logs_timestamp', 'timestamp'),
+        # The rollup watermark is a request log ID: without AUTOINCREMENT SQLite hands out the IDs of deleted rows
+        # again once retention empties the table, and those rows would never be rolled up
+        {'sqlite_autoincrement': True},
+    )
+
+
+class RequestMetricRollup(Base):
+    """
+    Request logs folded into per-minute or per-hour buckets for each endpoint, method and status code.
+    """
+    __tablename__ = 'request_metric_rollups'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    granularity: Mapped[str] = mapped_column(String(10), nullable=False)  # 'minute' or 'hour'
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    endpoint: Mapped[str] = mapped_column(String(255), nullable=False)
+    method: Mapped[str] = mapped_column(String(10), nullable=False)
+    status_code: Mapped[int] = mapped_column(Integer, nullable=False)
+    request_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total_execution_time: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    max_execution_time: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    latency_histogram: Mapped[str] = mapped_column(Text, nullable=False)  # JSON list of counts
+
+    __table_args__ = (
+        UniqueConstraint('granularity', 'bucket_start', 'endpoint', 'method', 'status_code',
+                         name='unique_request_metric_bucket'),
+    )
+
+    def __str__(self) -> str:
+        return f'RequestMetricRollup {self.granularity} {self.bucket_start} {self.endpoint}'
+
+
+class RollupWatermark(Base):
+    """
+    Last source row folded into a rollup, so the next run only reads newer rows.
+    """
+    __tablename__ = 'rollup_watermarks'
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    last_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class RankingEpoch(Base):
+    """
+    Time origin of the forward-decayed popularity scores of the products, see modules/rankings.py.
+    """
+    __tablename__ = 'ranking_epochs'
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    epoch: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class CacheVersion(Base):
+    """
+    Version of a group of cached data shared by every worker, raised in the transaction that changes the data, see
+    modules/filter/catalog_metadata.py.
+    """
+    __tablename__ = 'cache_versions'
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
 
 class ProductPromotion(Base):
     __tablename__ = 'product_promotions'
@@ -654,6 +781,12 @@ class ProductPromotion(Base):
 
     product: Mapped["Product"] = relationship('Product', back_populates='promotions')
 
+    __table_args__ = (
+        Index('ix_product_promotions_start_date_end_date', 'start_date', 'end_date'),
+        Index('ix_product_promotions_end_date', 'end_date'),  # next end of a promotion, see filter/promotions.py
+        Index('ix_product_promotions_product_id', 'product_id'),
+    )
+
     def __str__(self) -> str:
         return f'{self.description[:20]}..' if len(self.description) > 22 else self.description
 
@@ -662,7 +795,7 @@ class Ticket(Base):
     __tablename__ = 'tickets'
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     admin_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey('users.id'), nullable=True)
     title: Mapped[str] = mapped_column(Text, nullable=False)
     description: Mapped[str] = mapped_column(Text, nullable=False)
@@ -0,0 +1,184 @@
+# /modular_store_backend/modules/db/product_search.py
+"""
+SQLite FTS5 index over product name, description, tag names and category name.
+
+The index is a regular FTS5 table whose rowid is the product id. Triggers on products, products_tags, tags and
+categories rewrite a product's row whenever a searched field changes, so every writer (ORM, bulk SQL, migrations)
+keeps it in sync. Stock and price updates do not touch the index.
+"""
+import re
+from typing import Any, Iterable, Iterator, Optional
+
+from sqlalchemy import MetaData, Subquery, TextClause, bindparam, event, literal_column, select, text
+from sqlalchemy.engine import Connection, Row
+
+SEARCH_TABLE = 'product_search'
+# BM25 weight of each column, in the order of the FTS5 table: a name match ranks far above a description match
+COLUMN_WEIGHTS = {'name': 10.0, 'description': 1.0, 'tags': 4.0, 'category': 3.0}
+TOKEN_PATTERN = re.compile(r'\w+')
+
+_DOCUMENT = """
+    SELECT p.id, coalesce(p.samplename, ''), coalesce(p.description, ''),
+           coalesce((SELECT group_concat(t.name, ' ') FROM products_tags pt JOIN tags t ON t.id = pt.tag_id
+                     WHERE pt.product_id = p.id), ''),
+           coalesce((SELECT c.name FROM categories c WHERE c.id = p.category_id), '')
+    FROM products p WHERE {where}"""
+
+
+def _refresh(where: str) -> str:
+    return (f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT p.id FROM products p WHERE {where}); "
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(COLUMN_WEIGHTS)}) {_DOCUMENT.format(where=where)};")
+
+
+TRIGGERS = {
+    'product_search_product_insert': f"AFTER INSERT ON products BEGIN {_refresh('p.id = new.id')} END",
+    'product_search_product_update': ("AFTER UPDATE OF samplename, description, category_id ON products "
+                                      f"BEGIN {_refresh('p.id = new.id')} END"),
+    'product_search_product_delete': f"AFTER DELETE ON products BEGIN "
+                                     f"DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id; END",
+    'product_search_tag_link': f"AFTER INSERT ON products_tags BEGIN {_refresh('p.id = new.product_id')} END",
+    'product_search_tag_unlink': f"AFTER DELETE ON products_tags BEGIN {_refresh('p.id = old.product_id')} END",
+    'product_search_tag_rename': (
+        "AFTER UPDATE OF name ON tags BEGIN "
+        f"{_refresh('p.id IN (SELECT product_id FROM products_tags WHERE tag_id = new.id)')} END"),
+    'product_search_tag_delete': (
+        "AFTER DELETE ON tags BEGIN "
+        f"{_refresh('p.id IN (SELECT product_id FROM products_tags WHERE tag_id = old.id)')} END"),
+    'product_search_category_rename': ("AFTER UPDATE OF name ON categories "
+                                       f"BEGIN {_refresh('p.category_id = new.id')} END"),
+    'product_search_category_delete': f"AFTER DELETE ON categories BEGIN {_refresh('p.category_id = old.id')} END",
+}
+
+
+def create_product_search(connection: Connection) -> bool:
+    """
+    Create the FTS5 table and its triggers if missing, and fill a new table from the products.
+
+    :param connection: Connection to a SQLite database that has the products, tags and categories tables
+    :return: Whether the table was created
+    """
+    created = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                 {'name': SEARCH_TABLE}).first() is None
+    if created:
+        # prefix='2 3' indexes the 2 and 3 character prefixes so "lap"* does not scan every term
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5({', '.join(COLUMN_WEIGHTS)}, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    for name, definition in TRIGGERS.items():
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {definition}")
+    if created:
+        rebuild_product_search(connection)
+    return created
+
+
+def drop_product_search(connection: Connection) -> None:
+    for name in TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+def _create_after_tables(target: MetaData, connection: Connection, **kwargs: Any) -> None:
+    if connection.dialect.name == 'sqlite' and 'products' in target.tables:
+        create_product_search(connection)
+
+
+def _drop_before_tables(target: MetaData, connection: Connection, **kwargs: Any) -> None:
+    if connection.dialect.name == 'sqlite':
+        drop_product_search(connection)
+
+
+def register_product_search(metadata: MetaData) -> None:
+    """
+    Create the index with every create_all of the metadata (existing databases get it on the next start) and
+    drop it with drop_all, as it is not a table of the metadata.
+
+    :param metadata: Metadata holding the products, tags and categories tables
+    """
+    event.listen(metadata, 'after_create', _create_after_tables)
+    event.listen(metadata, 'before_drop', _drop_before_tables)
+
+
+def rebuild_product_search(connection: Connection) -> int:
+    """
+    Rewrite the whole index from the products and merge its segments.
+
+    :return: Number of indexed products
+    """
+    connection.exec_driver_sql(f"DELETE FROM {SEARCH_TABLE}")
+    result = connection.exec_driver_sql(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(COLUMN_WEIGHTS)}) {_DOCUMENT.format(where='1')}")
+    connection.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return result.rowcount
+
+
+def product_documents(connection: Connection, product_ids: Optional[Iterable[int]] = None,
+                      batch_size: int = 500) -> Iterator[Row]:
+    """
+    Read the searched fields of products the way the index stores them.
+
+    :param connection: Connection to read with, e.g. the session's inside a flush to see its changes
+    :param product_ids: Products to read, all of them when None
+    :param batch_size: Product IDs bound per statement
+    :return: Rows of (id, name, description, space separated tag names, category name)
+    """
+    if product_ids is None:
+        yield from connection.execute(text(_DOCUMENT.format(where='1')))
+        return
+    statement = text(_DOCUMENT.format(where='p.id IN :product_ids')).bindparams(
+        bindparam('product_ids', expanding=True))
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), batch_size):
+        yield from connection.execute(statement, {'product_ids': product_ids[start:start + batch_size]})
+
+
+def match_expression(search: str) -> Optional[str]:
+    """
+    Turn user input into an FTS5 query: every word becomes a quoted prefix term and all of them must match.
+    Quotes, operators and column filters in the input are never interpreted.
+
+    :param search: Text typed into the search box
+    :return: The MATCH expression, None if the input has no words
+    """
+    tokens = TOKEN_PATTERN.findall(search.lower())
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_subquery(expression: str) -> Subquery:
+    """
+    :param expression: MATCH expression from match_expression
+    :return: Subquery of the matching product ids with their BM25 rank (lower ranks are better matches)
+    """
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS.values())
+    return (
+        select(literal_column('rowid').label('product_id'),
+               literal_column(f'bm25({SEARCH_TABLE}, {weights})').label('rank'))
+        .select_from(text(SEARCH_TABLE))
+        .where(text(f'{SEARCH_TABLE} MATCH :search_expression').bindparams(search_expression=expression))
+        .subquery('product_search_matches')
+    )
+
+
+def any_term_expression(terms: Iterable[str]) -> Optional[str]:
+    """
+    :param terms: Whole words, e.g. the spelling corrections of a search
+    :return: MATCH expression matching any of them, None without terms
+    """
+    quoted = [f'"{term}"' for term in terms if TOKEN_PATTERN.fullmatch(term)]
+    return ' OR '.join(quoted) or None
+
+
+def snippet_query(tokens: int = 16) -> TextClause:
+    """
+    Select (product id, description snippet) of the matching products in :product_ids, with :start and :end
+    inserted around every matched term.
+
+    :param tokens: Maximum number of tokens in a snippet
+    :return: Statement taking the search_expression, product_ids, start and end parameters
+    """
+    description = list(COLUMN_WEIGHTS).index('description')
+    return text(
+        f"SELECT rowid, snippet({SEARCH_TABLE}, {description}, :start, :end, '…', {int(tokens)}) FROM {SEARCH_TABLE} "
+        f"WHERE {SEARCH_TABLE} MATCH :search_expression AND rowid IN :product_ids"
+    ).bindparams(bindparam('product_ids', expanding=True))
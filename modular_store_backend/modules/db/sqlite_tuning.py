@@ -0,0 +1,103 @@
+# /modular_store_backend/modules/db/sqlite_tuning.py
+import logging
+from typing import Any, Optional
+
+from flask import Flask
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+# Applied to every new SQLite connection, the SQLITE_PRAGMAS config entries override these
+DEFAULT_SQLITE_PRAGMAS: dict[str, Any] = {
+    'journal_mode': 'WAL',  # readers no longer block the writer and vice versa
+    'synchronous': 'NORMAL',  # safe with WAL, fsync only on checkpoints
+    'busy_timeout': 5000,  # in ms, wait for a lock instead of raising "database is locked"
+    'foreign_keys': 'OFF',  # existing rows may reference deleted users, enable after cleaning them up
+    'cache_size': -64000,  # negative values are KiB, so 64 MB of page cache per connection
+    'mmap_size': 268435456,  # 256 MB of the database file read through memory mapping
+    'temp_store': 'MEMORY',
+    # Only takes effect on a new database file, existing files are switched with flask apply-retention --enable-vacuum
+    'auto_vacuum': 'INCREMENTAL',
+}
+
+# Per database file, not per connection, and meaningless for in-memory databases
+FILE_ONLY_PRAGMAS = ('journal_mode', 'mmap_size')
+
+
+def is_sqlite(engine: Engine) -> bool:
+    return engine.dialect.name == 'sqlite'
+
+
+def is_in_memory(engine: Engine) -> bool:
+    return engine.url.database in (None, '', ':memory:')
+
+
+def pragmas_from_config(config: dict[str, Any]) -> dict[str, Any]:
+    """
+    Pragma overrides of an app config: SQLITE_PRAGMAS, plus no automatic checkpoints while the WAL is archived,
+    as a checkpoint lets the next writer overwrite frames the archiver has not copied yet.
+
+    :param config: Flask app config
+    :return: Overrides for get_sqlite_pragmas
+    """
+    overrides = dict(config.get('SQLITE_PRAGMAS') or {})
+    if config.get('WAL_ARCHIVE_ENABLED', False):
+        overrides['wal_autocheckpoint'] = 0
+    return overrides
+
+
+def get_sqlite_pragmas(engine: Engine, overrides: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+    """
+    Resolve the pragmas to apply to connections of an engine.
+
+    :param engine: SQLite engine
+    :param overrides: Pragmas from the app config, a None value disables a default pragma
+    :return: Pragma names mapped to their values
+    """
+    pragmas = {**DEFAULT_SQLITE_PRAGMAS, **(overrides or {})}
+    if is_in_memory(engine):
+        pragmas = {name: value for name, value in pragmas.items() if name not in FILE_ONLY_PRAGMAS}
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def apply_sqlite_pragmas(engine: Engine, overrides: Optional[dict[str, Any]] = None) -> None:
+    """
+    Set the performance pragmas on every connection the engine opens.
+
+    :param engine: SQLite engine
+    :param overrides: Pragmas from the app config
+    """
+    pragmas = get_sqlite_pragmas(engine, overrides)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def optimize_sqlite(engine: Engine, checkpoint: bool = True) -> None:
+    """
+    Refresh the query planner statistics and fold the WAL back into the database file.
+
+    :param engine: SQLite engine
+    :param checkpoint: Whether to checkpoint the WAL, left to the archiver when WAL archiving is enabled
+    """
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA optimize"))
+        if checkpoint and connection.execute(text("PRAGMA journal_mode")).scalar() == 'wal':
+            busy, log_pages, checkpointed = connection.execute(text("PRAGMA wal_checkpoint(PASSIVE)")).one()
+            logging.info(f"SQLite WAL checkpoint: {checkpointed}/{log_pages} pages (busy: {busy})")
+
+
+def run_sqlite_maintenance(app: Flask) -> None:
+    from modular_store_backend.modules.db.database import db
+
+    with app.app_context():
+        try:
+            if is_sqlite(db.engine):
+                optimize_sqlite(db.engine, checkpoint=not app.config.get('WAL_ARCHIVE_ENABLED', False))
+        except Exception as e:
+            logging.error(f"Error running SQLite maintenance: {str(e)}")
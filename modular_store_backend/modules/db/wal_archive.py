@@ -0,0 +1,574 @@
+# /modular_store_backend/modules/db/wal_archive.py
+"""
+Continuous archiving of the SQLite write-ahead log for point-in-time recovery.
+
+A generation starts with a base snapshot taken with the online backup API. Every run then copies the WAL frames
+committed since the previous run into a compressed segment of the generation. Restoring replays the segments over
+the base snapshot, so the database can be rebuilt as it was at any archive run.
+
+Frames may only be overwritten after the archiver copied them: while archiving is enabled the application
+connections do not checkpoint (wal_autocheckpoint=0), the archiver checkpoints after copying the tail of the WAL
+under the write lock and keeps a connection open so the WAL file is not deleted when the last application
+connection closes. Any other checkpoint is detected from the salts of the WAL header and starts
+a new generation instead of leaving a gap in the archive.
+
+The scheduler job of every worker process and the archive-wal command archive into the same directory. A run holds
+an exclusive lock on its lock file from reading state.json to writing it back; a run finding the lock taken is
+skipped and leaves its frames to the next run.
+"""
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import BinaryIO, Iterator, Optional, TextIO
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt
+
+from flask import Flask
+
+from modular_store_backend.modules.db.backup import EXTENSIONS, begin_read_snapshot, check_integrity, \
+    compress_file, compression_of, copy_snapshot, open_compressed, resolve_compression, restore_backup
+
+WAL_HEADER_SIZE = 32
+FRAME_HEADER_SIZE = 24
+WAL_MAGIC = {0x377f0682: False, 0x377f0683: True}  # magic number -> checksums use big-endian words
+GENERATION_FORMAT = '%Y%m%d_%H%M%S_%f'
+STATE_FILE = 'state.json'
+LOCK_FILE = 'archive.lock'
+META_FILE = 'meta.json'
+BASE_NAME = 'base'
+SEGMENT_SUFFIXES = {'zstd': '.wal.zst', 'gzip': '.wal.gz', 'none': '.wal'}
+
+# One connection per archived database, open for the life of the process (see the module docstring)
+_keepalive: dict[str, sqlite3.Connection] = {}
+_keepalive_lock = threading.Lock()
+
+
+def wal_checksum(data: bytes, checksum: tuple[int, int], big_endian: bool) -> tuple[int, int]:
+    """
+    Continue the cumulative checksum SQLite stores in WAL headers and frame headers.
+
+    :param data: Bytes to add, a multiple of 8 bytes long
+    :param checksum: Checksum of the preceding data
+    :param big_endian: Whether the WAL sums big-endian words
+    :return: The new checksum
+    """
+    s0, s1 = checksum
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for index in range(0, len(words), 2):
+        s0 = (s0 + words[index] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[index + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+
+class WalHeader:
+    """The 32-byte header of a WAL file."""
+
+    def __init__(self, data: bytes) -> None:
+        magic, _, page_size, self.checkpoint_seq, self.salt1, self.salt2, checksum1, checksum2 = \
+            struct.unpack('>8I', data[:WAL_HEADER_SIZE])
+        self.big_endian = WAL_MAGIC[magic]
+        self.page_size = 65536 if page_size == 1 else page_size
+        self.checksum = (checksum1, checksum2)
+
+    @property
+    def salts(self) -> tuple[int, int]:
+        return self.salt1, self.salt2
+
+    @property
+    def frame_size(self) -> int:
+        return FRAME_HEADER_SIZE + self.page_size
+
+
+def read_wal_header(wal_path: str) -> Optional[WalHeader]:
+    """
+    :param wal_path: Path of the -wal file
+    :return: The header, None if the file is missing, empty or its header is not valid
+    """
+    try:
+        with open(wal_path, 'rb') as wal:
+            data = wal.read(WAL_HEADER_SIZE)
+    except FileNotFoundError:
+        return None
+    if len(data) < WAL_HEADER_SIZE or struct.unpack('>I', data[:4])[0] not in WAL_MAGIC:
+        return None
+    header = WalHeader(data)
+    if wal_checksum(data[:24], (0, 0), header.big_endian) != header.checksum:
+        return None
+    return header
+
+
+def read_committed_frames(wal_path: str, header: WalHeader, offset: int,
+                          checksum: tuple[int, int]) -> tuple[bytes, int, tuple[int, int], int]:
+    """
+    Read the frames of committed transactions from a position of the WAL on.
+
+    Frames are valid while their salts match the header and their checksums continue the chain; frames of an
+    earlier WAL generation, a frame being written and uncommitted frames after the last commit are left out.
+
+    :param wal_path: Path of the -wal file
+    :param header: Header of the WAL
+    :param offset: Byte position of the first frame to read
+    :param checksum: Checksum of the frame before it (the header checksum at the first frame)
+    :return: Frame bytes, position and checksum after the last commit frame, number of commits
+    """
+    with open(wal_path, 'rb') as wal:
+        wal.seek(offset)
+        data = wal.read()
+
+    frame_size = header.frame_size
+    position = committed_end = commits = 0
+    committed_checksum = checksum
+    while position + frame_size <= len(data):
+        frame = data[position:position + frame_size]
+        _, database_pages, salt1, salt2, checksum1, checksum2 = struct.unpack('>6I', frame[:FRAME_HEADER_SIZE])
+        if (salt1, salt2) != header.salts:
+            break
+        checksum = wal_checksum(frame[:8], checksum, header.big_endian)
+        checksum = wal_checksum(frame[FRAME_HEADER_SIZE:], checksum, header.big_endian)
+        if checksum != (checksum1, checksum2):
+            break
+        position += frame_size
+        if database_pages:  # commit frames carry the database size in pages
+            committed_end, committed_checksum = position, checksum
+            commits += 1
+    return data[:committed_end], offset + committed_end, committed_checksum, commits
+
+
+class ArchiveState:
+    """Position of the archiver in the WAL, persisted between runs."""
+
+    def __init__(self, generation: str, header: WalHeader, offset: int, checksum: tuple[int, int]) -> None:
+        self.generation = generation
+        self.sequence = 0
+        self.expect_reset = False  # set after a full checkpoint: the next writer may restart the WAL
+        self.enter_wal(header)
+        self.offset = offset
+        self.checksum = checksum
+
+    def enter_wal(self, header: WalHeader) -> None:
+        self.salt1, self.salt2 = header.salts
+        self.checkpoint_seq = header.checkpoint_seq
+        self.offset = WAL_HEADER_SIZE
+        self.checksum = header.checksum
+        self.expect_reset = False
+
+    def continues_with(self, header: WalHeader) -> bool:
+        """
+        Whether a WAL header with other salts is the restart that follows the archiver's own checkpoint.
+        """
+        # Every restart increments salt1 of the shared WAL index; the checkpoint sequence is a counter of the
+        # connection that restarts, which stays behind when another connection restarted before
+        return self.expect_reset and header.salt1 == (self.salt1 + 1) & 0xFFFFFFFF
+
+    @property
+    def started(self) -> datetime:
+        return datetime.strptime(self.generation, GENERATION_FORMAT)
+
+    def save(self, archive_dir: str) -> None:
+        path = os.path.join(archive_dir, STATE_FILE)
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump({key: value for key, value in vars(self).items()}, file)
+        os.replace(f'{path}.tmp', path)
+
+    @staticmethod
+    def load(archive_dir: str) -> Optional['ArchiveState']:
+        path = os.path.join(archive_dir, STATE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            values = json.load(file)
+        state = ArchiveState.__new__(ArchiveState)
+        state.__dict__.update(values, checksum=tuple(values['checksum']))
+        return state
+
+
+class ArchiveResult:
+    """What one archive run copied."""
+
+    def __init__(self, generation: str, new_generation: bool) -> None:
+        self.generation = generation
+        self.new_generation = new_generation
+        self.reason: Optional[str] = None
+        self.segments: list[str] = []
+        self.frames = 0
+        self.commits = 0
+        self.archived_bytes = 0
+        self.stored_bytes = 0
+        self.checkpointed = False
+        self.pruned: list[str] = []
+        self.duration = 0.0
+
+    def summary(self) -> str:
+        if self.new_generation:
+            return (f"generation {self.generation} started ({self.reason}), base snapshot "
+                    f"{self.stored_bytes / 1024:.0f} KiB in {self.duration:.2f} s, pruned {len(self.pruned)}")
+        return (f"generation {self.generation}: {self.commits} commits, {self.frames} frames, "
+                f"{self.archived_bytes / 1024:.0f} KiB -> {self.stored_bytes / 1024:.0f} KiB in "
+                f"{len(self.segments)} segment(s), checkpointed: {self.checkpointed}, {self.duration:.2f} s")
+
+
+def _keepalive_connection(database_path: str) -> sqlite3.Connection:
+    key = os.path.abspath(database_path)
+    with _keepalive_lock:
+        if key not in _keepalive:
+            _keepalive[key] = sqlite3.connect(database_path, timeout=30, isolation_level=None,
+                                              check_same_thread=False)
+        return _keepalive[key]
+
+
+def close_keepalive_connections() -> None:
+    with _keepalive_lock:
+        for connection in _keepalive.values():
+            connection.close()
+        _keepalive.clear()
+
+
+def _generation_break(state: Optional[ArchiveState], header: Optional[WalHeader], now: datetime,
+                      base_interval: float) -> Optional[str]:
+    """Why the archive cannot continue the current generation, None if it can."""
+    if state is None:
+        return 'no archive yet'
+    if header is None:
+        return 'the WAL file was deleted'
+    if (now - state.started).total_seconds() >= base_interval:
+        return 'base snapshot interval elapsed'
+    if header.salts != (state.salt1, state.salt2) and not state.continues_with(header):
+        return 'the WAL was restarted by a checkpoint the archiver did not run'
+    return None
+
+
+def _start_generation(connection: sqlite3.Connection, database_path: str, archive_dir: str, compression: str,
+                      now: datetime) -> tuple[ArchiveState, int]:
+    generation = now.strftime(GENERATION_FORMAT)
+    directory = os.path.join(archive_dir, generation)
+    os.makedirs(directory, exist_ok=True)
+    wal_path = f'{database_path}-wal'
+
+    # Rewriting user_version commits one frame, so the WAL exists and the snapshot maps to a position in it
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    connection.execute(f"PRAGMA user_version = {int(version)}")
+
+    source = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
+    snapshot_path = os.path.join(directory, f'{BASE_NAME}.db')
+    try:
+        # No commit can land between the read snapshot and the WAL position while the write lock is held
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            begin_read_snapshot(source)
+            header = read_wal_header(wal_path)
+            if header is None:
+                raise RuntimeError(f"{database_path} is not in WAL mode")
+            _, offset, checksum, _ = read_committed_frames(wal_path, header, WAL_HEADER_SIZE, header.checksum)
+        finally:
+            connection.execute("ROLLBACK")
+        copy_snapshot(source, snapshot_path)  # from the pinned read snapshot, writers carry on meanwhile
+        source.rollback()
+    finally:
+        source.close()
+
+    base_path = snapshot_path
+    if compression != 'none':
+        base_path = os.path.join(directory, f'{BASE_NAME}{EXTENSIONS[compression]}')
+        compress_file(snapshot_path, base_path, compression)
+        os.remove(snapshot_path)
+    with open(os.path.join(directory, META_FILE), 'w') as file:
+        json.dump({'page_size': header.page_size, 'started': generation}, file)
+
+    return ArchiveState(generation, header, offset, checksum), os.path.getsize(base_path)
+
+
+def _archive_frames(state: ArchiveState, header: WalHeader, database_path: str, archive_dir: str,
+                    compression: str, now: datetime, result: ArchiveResult) -> None:
+    data, offset, checksum, commits = read_committed_frames(f'{database_path}-wal', header, state.offset,
+                                                            state.checksum)
+    if not data:
+        return
+    path = os.path.join(archive_dir, state.generation,
+                        f'{state.sequence + 1:08d}_{now.strftime(GENERATION_FORMAT)}{SEGMENT_SUFFIXES[compression]}')
+    with open_compressed(f'{path}.partial', 'wb', compression) as segment:
+        segment.write(data)
+    os.replace(f'{path}.partial', path)
+
+    state.sequence += 1
+    state.offset, state.checksum = offset, checksum
+    result.segments.append(path)
+    result.frames += len(data) // header.frame_size
+    result.commits += commits
+    result.archived_bytes += len(data)
+    result.stored_bytes += os.path.getsize(path)
+
+
+def _checkpoint(connection: sqlite3.Connection, state: ArchiveState, database_path: str, archive_dir: str,
+                compression: str, now: datetime, result: ArchiveResult) -> bool:
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        # The tail committed since the last read, nothing can follow it while the write lock is held
+        header = read_wal_header(f'{database_path}-wal')
+        if header is not None and header.salts != (state.salt1, state.salt2) and state.continues_with(header):
+            state.enter_wal(header)  # a writer restarted the WAL after our last checkpoint since it was read
+        if header is None or header.salts != (state.salt1, state.salt2):
+            raise RuntimeError(f"The WAL of {database_path} was checkpointed by another connection")
+        _archive_frames(state, header, database_path, archive_dir, compression, now, result)
+
+        checkpointer = sqlite3.connect(database_path, timeout=30, isolation_level=None)
+        try:
+            busy, wal_frames, checkpointed = checkpointer.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        finally:
+            checkpointer.close()
+        # Only a fully copied WAL is restarted by the next writer; readers still using it delay that
+        state.expect_reset = state.expect_reset or (busy == 0 and wal_frames == checkpointed)
+        return state.expect_reset
+    finally:
+        connection.execute("ROLLBACK")
+
+
+def list_generations(archive_dir: str) -> list[tuple[datetime, str]]:
+    """
+    :param archive_dir: Directory written by archive_wal
+    :return: (start, directory) of every generation, oldest first
+    """
+    if not os.path.isdir(archive_dir):
+        return []
+    generations = []
+    for name in os.listdir(archive_dir):
+        if os.path.exists(os.path.join(archive_dir, name, META_FILE)):
+            generations.append((datetime.strptime(name, GENERATION_FORMAT), os.path.join(archive_dir, name)))
+    return sorted(generations)
+
+
+def prune_generations(archive_dir: str, keep: int) -> list[str]:
+    """
+    Delete all but the newest `keep` generations (at least the current one is kept).
+
+    :return: Deleted generation directories
+    """
+    generations = list_generations(archive_dir)
+    pruned = [directory for _, directory in generations[:-max(keep, 1)]]
+    for directory in pruned:
+        shutil.rmtree(directory)
+    return pruned
+
+
+class ArchiveLockedError(RuntimeError):
+    """Another run, of this process or another one, is archiving into the same directory."""
+
+
+def _lock_file(lock_file: TextIO) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock_file(lock_file: TextIO) -> None:
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def archive_lock(archive_dir: str) -> Iterator[None]:
+    """
+    Hold the exclusive lock of an archive directory, without waiting for it.
+
+    :param archive_dir: Directory of the archive, created if missing
+    :raises ArchiveLockedError: Another run holds the lock
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    # flock locks belong to the open file, so threads of one process exclude each other as well
+    with open(os.path.join(archive_dir, LOCK_FILE), 'a') as lock_file:
+        if not _lock_file(lock_file):
+            raise ArchiveLockedError(f"Another run is archiving into {archive_dir}")
+        try:
+            yield
+        finally:
+            _unlock_file(lock_file)
+
+
+def archive_wal(database_path: str, archive_dir: str, compression: str = 'zstd', checkpoint_pages: int = 1000,
+                base_interval: float = 86400, keep_generations: int = 7,
+                now: Optional[datetime] = None) -> ArchiveResult:
+    """
+    Copy the WAL frames committed since the last run into the archive, starting a new generation with a base
+    snapshot when needed.
+
+    :param database_path: SQLite database file in WAL mode
+    :param archive_dir: Directory of the archive, created if missing
+    :param compression: 'zstd', 'gzip' or 'none'
+    :param checkpoint_pages: Checkpoint once the WAL holds this many frames, so it does not grow forever
+    :param base_interval: Seconds after which a new generation starts, bounding the segments a restore replays
+    :param keep_generations: Generations to keep
+    :param now: Time of the run, names the segment
+    :return: What was archived
+    :raises ArchiveLockedError: Another run is archiving into archive_dir, this one did nothing
+    """
+    with archive_lock(archive_dir):
+        return _archive_wal(database_path, archive_dir, compression, checkpoint_pages, base_interval,
+                            keep_generations, now)
+
+
+def _archive_wal(database_path: str, archive_dir: str, compression: str, checkpoint_pages: int,
+                 base_interval: float, keep_generations: int, now: Optional[datetime]) -> ArchiveResult:
+    started = time.perf_counter()
+    compression = resolve_compression(compression)
+    now = now or datetime.now()
+    connection = _keepalive_connection(database_path)
+
+    state = ArchiveState.load(archive_dir)
+    header = read_wal_header(f'{database_path}-wal')
+    reason = _generation_break(state, header, now, base_interval)
+    if reason is not None:
+        state, base_size = _start_generation(connection, database_path, archive_dir, compression, now)
+        result = ArchiveResult(state.generation, new_generation=True)
+        result.reason, result.stored_bytes = reason, base_size
+    else:
+        assert state is not None and header is not None
+        result = ArchiveResult(state.generation, new_generation=False)
+        if header.salts != (state.salt1, state.salt2):
+            state.enter_wal(header)  # the restart that followed our checkpoint, the new WAL starts at its header
+        _archive_frames(state, header, database_path, archive_dir, compression, now, result)
+        if result.frames:
+            state.expect_reset = False  # writers appended instead of restarting, only our next checkpoint may
+        if (state.offset - WAL_HEADER_SIZE) // header.frame_size >= checkpoint_pages:
+            result.checkpointed = _checkpoint(connection, state, database_path, archive_dir, compression, now,
+                                              result)
+    state.save(archive_dir)
+
+    result.pruned = prune_generations(archive_dir, keep_generations)
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def apply_segment(database: BinaryIO, segment_path: str, page_size: int) -> int:
+    """
+    Replay the frames of a segment onto a database file, a transaction at a time.
+
+    :param database: Database file opened for binary read and write
+    :param segment_path: Segment written by archive_wal
+    :param page_size: Page size of the database
+    :return: Number of transactions applied
+    """
+    frame_size = FRAME_HEADER_SIZE + page_size
+    pending: list[tuple[int, bytes]] = []
+    commits = 0
+    with open_compressed(segment_path, 'rb', compression_of(segment_path)) as segment:
+        while len(frame := _read_exact(segment, frame_size)) == frame_size:
+            page_number, database_pages = struct.unpack('>II', frame[:8])
+            pending.append((page_number, frame[FRAME_HEADER_SIZE:]))
+            if database_pages:
+                for number, page in pending:
+                    database.seek((number - 1) * page_size)
+                    database.write(page)
+                database.truncate(database_pages * page_size)
+                pending = []
+                commits += 1
+    return commits
+
+
+class RestoreResult:
+    def __init__(self, generation: str, restored_to: datetime) -> None:
+        self.generation = generation
+        self.restored_to = restored_to  # time of the last replayed archive run
+        self.segments = 0
+        self.commits = 0
+        self.verified = False
+
+    def summary(self) -> str:
+        return (f"restored generation {self.generation} up to {self.restored_to:%Y-%m-%d %H:%M:%S}: "
+                f"{self.segments} segment(s), {self.commits} commits, integrity ok: {self.verified}")
+
+
+def restore_to_time(archive_dir: str, target_path: str, until: Optional[datetime] = None) -> RestoreResult:
+    """
+    Rebuild the database as of the last archive run at or before a time.
+
+    :param archive_dir: Directory written by archive_wal
+    :param target_path: Database file to create, it must not be the live database
+    :param until: Point in time to restore, the latest archived state if None
+    :return: The generation used, the time restored to, what was replayed and the integrity check outcome
+    """
+    until = until or datetime.max
+    generations = [(start, directory) for start, directory in list_generations(archive_dir) if start <= until]
+    if not generations:
+        raise ValueError(f"No base snapshot in {archive_dir} taken before {until}")
+    started, directory = generations[-1]
+
+    with open(os.path.join(directory, META_FILE)) as file:
+        page_size = json.load(file)['page_size']
+    base_path = next(os.path.join(directory, name) for name in os.listdir(directory)
+                     if name.startswith(f'{BASE_NAME}.db'))
+    restore_backup(base_path, target_path)
+
+    result = RestoreResult(os.path.basename(directory), started)
+    segments = sorted(name for name in os.listdir(directory) if '.wal' in name and not name.endswith('.partial'))
+    with open(target_path, 'r+b') as database:
+        for name in segments:
+            archived = datetime.strptime(name.split('_', 1)[1].split('.')[0], GENERATION_FORMAT)
+            if archived > until:
+                break
+            result.commits += apply_segment(database, os.path.join(directory, name), page_size)
+            result.segments += 1
+            result.restored_to = archived
+
+    # Replayed frames of page 1 mark the file as a WAL database, turn it back into a standalone file
+    connection = sqlite3.connect(target_path)
+    try:
+        connection.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        connection.close()
+    result.verified = check_integrity(target_path)
+    return result
+
+
+def run_wal_archive(app: Flask) -> Optional[ArchiveResult]:
+    """
+    Scheduled job: archive the WAL of DB_PATH into WAL_ARCHIVE_DIR.
+
+    :param app: Flask application instance
+    :return: The result of the run, None if it failed with an error
+    """
+    try:
+        result = archive_wal(
+            app.config['DB_PATH'],
+            app.config['WAL_ARCHIVE_DIR'],
+            compression=app.config.get('BACKUP_COMPRESSION', 'zstd'),
+            checkpoint_pages=app.config.get('WAL_ARCHIVE_CHECKPOINT_PAGES', 1000),
+            base_interval=app.config.get('WAL_ARCHIVE_BASE_INTERVAL', 86400),
+            keep_generations=app.config.get('WAL_ARCHIVE_GENERATIONS', 7),
+        )
+        if result.new_generation or result.segments:
+            logging.info(f"WAL archive: {result.summary()}")
+        return result
+    except ArchiveLockedError as e:
+        logging.info(f"WAL archive run skipped: {str(e)}")
+        return None
+    except Exception as e:
+        logging.error(f"Error archiving the WAL: {str(e)}")
+        return None
@@ -1,4 +1,6 @@
 # /modular_store_backend/modules/extensions/__init__.py
+import atexit
+
 from apscheduler.schedulers.background import BackgroundScheduler
 from flask import Flask
 from flask_babel import Babel
@@ -6,9 +8,17 @@ from flask_login import LoginManager
 from flask_mail import Mail
 
 from modular_store_backend.modules.cache import cache
+from modular_store_backend.modules.catalog_index import build_catalog_index, catalog_index_enabled
 from modular_store_backend.modules.db.backup import backup_database
+from modular_store_backend.modules.db.sqlite_tuning import run_sqlite_maintenance
+from modular_store_backend.modules.db.wal_archive import run_wal_archive
 from modular_store_backend.modules.extensions.utils import get_locale, load_user
 from modular_store_backend.modules.oauth_login import init_oauth
+from modular_store_backend.modules.presence import flush_presence
+from modular_store_backend.modules.rankings import flush_rankings
+from modular_store_backend.modules.request_metrics import rollup_request_metrics
+from modular_store_backend.modules.retention import run_retention
+from modular_store_backend.modules.search_index import build_search_index, search_index_enabled
 
 babel = Babel()
 login_manager = LoginManager()
@@ -25,10 +35,31 @@ def init_extensions(app: Flask) -> None:
     babel.init_app(app, locale_selector=get_locale)
     login_manager.init_app(app)
     mail.init_app(app)
+    # SimpleCache is per process, see CACHE_TYPE in config.yaml
+    app.config.setdefault('CACHE_TYPE', 'SimpleCache')
     cache.init_app(app)
 
     # Set up scheduler
     scheduler.add_job(backup_database, 'interval', seconds=app.config['BACKUP_INTERVAL'], args=[app])
+    scheduler.add_job(flush_presence, 'interval', seconds=app.config.get('PRESENCE_FLUSH_INTERVAL', 30), args=[app])
+    atexit.register(flush_presence, app)
+    scheduler.add_job(flush_rankings, 'interval', seconds=app.config.get('RANKING_FLUSH_INTERVAL', 60), args=[app])
+    atexit.register(flush_rankings, app)
+    scheduler.add_job(rollup_request_metrics, 'interval',
+                      seconds=app.config.get('REQUEST_METRICS_ROLLUP_INTERVAL', 60), args=[app])
+    scheduler.add_job(run_sqlite_maintenance, 'interval',
+                      seconds=app.config.get('SQLITE_MAINTENANCE_INTERVAL', 3600), args=[app])
+    if app.config.get('RETENTION_ENABLED', True):
+        scheduler.add_job(run_retention, 'interval', seconds=app.config.get('RETENTION_INTERVAL', 3600), args=[app])
+    if app.config.get('WAL_ARCHIVE_ENABLED', False):
+        scheduler.add_job(run_wal_archive, 'interval', seconds=app.config.get('WAL_ARCHIVE_INTERVAL', 60),
+                          args=[app])
+    if search_index_enabled(app):
+        scheduler.add_job(build_search_index, 'interval',
+                          seconds=app.config.get('PRODUCT_SEARCH_REFRESH_INTERVAL', 600), args=[app])
+    if catalog_index_enabled(app):
+        scheduler.add_job(build_catalog_index, 'interval',
+                          seconds=app.config.get('CATALOG_INDEX_REFRESH_INTERVAL', 600), args=[app])
     if not scheduler.running:
         scheduler.start()
 
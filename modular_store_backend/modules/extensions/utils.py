@@ -5,8 +5,8 @@ from flask import request, current_app
 from flask_login import current_user
 from werkzeug.datastructures import LanguageAccept
 
-from modular_store_backend.modules.db.database import db
 from modular_store_backend.modules.db.models import User
+from modular_store_backend.modules.identity_cache import load_cached_user
 
 
 def get_locale() -> str:
@@ -20,7 +20,4 @@ def get_locale() -> str:
 
 
 def load_user(user_id: int) -> Optional[User]:
-    user: Optional[User] = db.session.get(User, user_id)
-    if user:
-        db.session.refresh(user)
-    return user
+    return load_cached_user(user_id)
@@ -1,13 +1,19 @@
 # /modular_store_backend/modules/filter/__init__.py
 from flask import Flask
 
+from modular_store_backend.modules.filter.catalog_metadata import bump_catalog_version, get_catalog_version, \
+    get_filter_options
+from modular_store_backend.modules.filter.categories import get_breadcrumbs, get_category_tree
+from modular_store_backend.modules.filter.facets import FilterState, get_facet_counts
+from modular_store_backend.modules.filter.pagination import ListingPage, paginate_listing
 from modular_store_backend.modules.filter.utils import (
     filter_products,
-    get_filter_options,
     get_categories,
     get_all_tags,
     get_promoted_products,
-    paginate_query
+    paginate_query,
+    search_snippets,
+    select_products
 )
 from modular_store_backend.modules.filter.views import init_filter
 
@@ -24,5 +30,15 @@ __all__ = [
     'get_categories',
     'get_all_tags',
     'get_promoted_products',
-    'paginate_query'
+    'paginate_query',
+    'search_snippets',
+    'select_products',
+    'FilterState',
+    'get_facet_counts',
+    'ListingPage',
+    'paginate_listing',
+    'get_breadcrumbs',
+    'get_category_tree',
+    'get_catalog_version',
+    'bump_catalog_version'
 ]
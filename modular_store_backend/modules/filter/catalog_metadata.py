@@ -0,0 +1,108 @@
+# /modular_store_backend/modules/filter/catalog_metadata.py
+"""
+Catalog metadata shared by every visitor: the filter options (categories, tags, sort options) and the category
+navigation, cached under a global catalog version. Flushes that write a category, a tag, or the category or stock of
+a product (admin views, ORM code) raise the version stored in cache_versions in the same transaction, so the new
+version commits (or rolls back) together with the change and the next render of every worker computes the metadata
+again, whatever the cache backend. The entries of older versions expire on their own after CATALOG_METADATA_CACHE_TIMEOUT seconds.
+
+Bulk writes (query.update(), Core statements) skip the session events: those changing the catalog must call
+bump_catalog_version in their transaction.
+"""
+from itertools import chain
+from typing import Any, Callable, Optional
+
+from flask import current_app
+from sqlalchemy import Connection, event, insert, select, update
+from sqlalchemy.orm import Session, attributes
+
+from modular_store_backend.modules.cache import cache
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import CacheVersion, Category, Product, Tag
+from modular_store_backend.modules.filter.sort_options import SortOptions
+from modular_store_backend.modules.filter.utils import get_all_tags, get_categories
+
+CATALOG_VERSION_NAME = 'catalog'
+# Attributes the metadata is computed from: the categories and tags themselves, and the category and stock of the
+# products for the product counts of the navigation. Products added or deleted count too
+CATALOG_ATTRIBUTES = {
+    Category: ('name', 'parent_id', 'parent'),
+    Tag: ('name',),
+    Product: ('category_id', 'category', 'stock'),
+}
+
+
+def get_catalog_version() -> int:
+    # Read through the session like the metadata itself: a read replica vouches for the version it has data of
+    version: Optional[int] = db.session.scalar(
+        select(CacheVersion.version).where(CacheVersion.name == CATALOG_VERSION_NAME))
+    return version or 0
+
+
+def _raise_version(connection: Connection) -> None:
+    # A single UPDATE, atomic against concurrent commits; the row is created by the first bump
+    if not connection.execute(update(CacheVersion).where(CacheVersion.name == CATALOG_VERSION_NAME)
+                              .values(version=CacheVersion.version + 1)).rowcount:
+        connection.execute(insert(CacheVersion).values(name=CATALOG_VERSION_NAME, version=1))
+
+
+def bump_catalog_version() -> None:
+    """
+    Invalidate the cached catalog metadata after a bulk write to categories, tags or products, in the transaction
+    of the caller.
+    """
+    _raise_version(db.session.connection())
+
+
+def get_versioned(name: str, compute: Callable[[], Any], timeout: Optional[int] = None) -> Any:
+    """
+    Get a piece of catalog metadata of the current catalog version, computing and caching it on a miss.
+
+    :param name: Name of the metadata, part of its cache key
+    :param compute: Function computing the metadata from the database
+    :param timeout: Seconds to cache it, CATALOG_METADATA_CACHE_TIMEOUT by default
+    :return: The metadata
+    """
+    key = f'{name}:{get_catalog_version()}'
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        if timeout is None:
+            timeout = current_app.config.get('CATALOG_METADATA_CACHE_TIMEOUT', 3600)
+        cache.set(key, value, timeout=timeout)
+    return value
+
+
+def compute_filter_options() -> dict[str, Any]:
+    """
+    :return: dictionary containing the categories, tags and sort options
+    """
+    return {
+        'categories': get_categories(),
+        'tags': get_all_tags(),
+        'sort_options': [{'value': option.key, 'label': option.label} for option in SortOptions.get_all()],
+    }
+
+
+def get_filter_options() -> dict[str, Any]:
+    """
+    Get filter options for categories, tags, and sorting.
+
+    :return: dictionary containing filter options, see compute_filter_options
+    """
+    return get_versioned('filter_options', compute_filter_options)
+
+
+def _catalog_changed(session: Session) -> bool:
+    if any(type(instance) in CATALOG_ATTRIBUTES for instance in chain(session.new, session.deleted)):
+        return True
+    return any(attributes.get_history(instance, key).has_changes()
+               for instance in session.dirty for key in CATALOG_ATTRIBUTES.get(type(instance), ()))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_on_flush(session: Session, flush_context: Any) -> None:
+    # Other product writes (ratings, scores, descriptions) leave the version row alone: it is one row every
+    # writer would queue on
+    if _catalog_changed(session):
+        _raise_version(session.connection())
@@ -0,0 +1,81 @@
+# /modular_store_backend/modules/filter/categories.py
+"""
+The category tree of the navigation menu and the breadcrumb trails of the categories, read from the closure table
+(modules/db/category_tree.py) and cached together under the catalog version (see catalog_metadata.py), so commits
+that change a category or a product refresh them. Stock changes do not go through the ORM, so the product counts
+are kept at most CATEGORY_TREE_CACHE_TIMEOUT seconds.
+"""
+from typing import Any, Optional
+
+from flask import current_app
+from sqlalchemy import func
+
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Category, Product, category_closure
+from modular_store_backend.modules.filter.catalog_metadata import get_versioned
+
+
+def compute_category_navigation() -> dict[str, Any]:
+    """
+    :return: tree (categories depth first, each with its depth and the number of products in stock in it and the
+        categories below it) and breadcrumbs (category ID -> trail of id and name, from the top category down)
+    """
+    categories = {category_id: {'id': category_id, 'name': name, 'parent_id': parent_id, 'depth': 0,
+                                'product_count': 0}
+                  for category_id, name, parent_id in db.session.query(Category.id, Category.name, Category.parent_id)
+                  .order_by(Category.id)}
+
+    # One indexed join counts the products of every subtree
+    counts = (db.session.query(category_closure.c.ancestor_id, func.count(Product.id))
+              .join(Product, Product.category_id == category_closure.c.descendant_id)
+              .filter(Product.stock > 0)
+              .group_by(category_closure.c.ancestor_id))
+    for category_id, count in counts:
+        if category_id in categories:
+            categories[category_id]['product_count'] = count
+
+    breadcrumbs: dict[int, list[dict[str, Any]]] = {}
+    paths = (db.session.query(category_closure.c.descendant_id, category_closure.c.ancestor_id,
+                              category_closure.c.depth)
+             .order_by(category_closure.c.descendant_id, category_closure.c.depth.desc()))
+    for descendant_id, ancestor_id, depth in paths:
+        if descendant_id in categories and ancestor_id in categories:
+            categories[descendant_id]['depth'] = max(categories[descendant_id]['depth'], depth)
+            breadcrumbs.setdefault(descendant_id, []).append({'id': ancestor_id,
+                                                              'name': categories[ancestor_id]['name']})
+
+    children: dict[Optional[int], list[dict[str, Any]]] = {}
+    for category in categories.values():
+        parent_id = category['parent_id'] if category['parent_id'] in categories else None
+        children.setdefault(parent_id, []).append(category)
+    tree, stack = [], list(reversed(children.get(None, [])))
+    while stack:
+        category = stack.pop()
+        tree.append(category)
+        stack.extend(reversed(children.get(category['id'], [])))
+    return {'tree': tree, 'breadcrumbs': breadcrumbs}
+
+
+def get_category_navigation() -> dict[str, Any]:
+    """
+    Get the category tree and breadcrumbs, computing and caching them on a miss.
+
+    :return: See compute_category_navigation
+    """
+    return get_versioned('category_tree', compute_category_navigation,
+                         timeout=current_app.config.get('CATEGORY_TREE_CACHE_TIMEOUT', 300))
+
+
+def get_category_tree() -> list[dict[str, Any]]:
+    """
+    :return: Categories depth first with id, name, parent_id, depth and product_count
+    """
+    return get_category_navigation()['tree']
+
+
+def get_breadcrumbs(category_id: Optional[int]) -> list[dict[str, Any]]:
+    """
+    :param category_id: ID of a category
+    :return: id and name of the categories from the top category down to this one
+    """
+    return get_category_navigation()['breadcrumbs'].get(category_id, []) if category_id is not None else []
@@ -0,0 +1,183 @@
+# /modular_store_backend/modules/filter/facets.py
+"""
+Counts shown next to the filter sidebar options: products per category (with the categories below it), per tag,
+per price band, on sale and in stock, for the current filter criteria.
+
+Two grouped queries return the matching products bucketed by every facet dimension at once (category, price band,
+on sale, in stock, tag filter match; and per tag), so the counts for any combination of the selected filters are
+summed from a few hundred rows in Python. Each facet ignores its own selection, so the other values of the facet
+show what choosing them instead would return.
+"""
+import hashlib
+from collections import defaultdict
+from typing import Any, Mapping, Optional
+
+from flask import current_app
+from sqlalchemy import ColumnElement, case, exists, func, literal
+
+from modular_store_backend.modules.cache import cache
+from modular_store_backend.modules.db.category_tree import read_subtrees
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Product, Tag, products_tags
+from modular_store_backend.modules.filter.utils import price_band_condition, price_bands, search_products
+
+
+def _price_band_index(bands: list[dict[str, Any]]) -> ColumnElement:
+    price = func.coalesce(Product.current_price, 0)
+    return case(*[(price < band['max'], index) for index, band in enumerate(bands[:-1])], else_=len(bands) - 1)
+
+
+class FilterState:
+    """
+    Normalized filter criteria of the product list, so equivalent requests share their cached facet counts.
+    """
+
+    def __init__(self, category_id: Optional[int] = None, name_query: Optional[str] = None,
+                 tag_query: Optional[str] = None, price_band: Optional[str] = None, on_sale: bool = False,
+                 in_stock: bool = True) -> None:
+        self.category_id = category_id
+        self.name_query = ' '.join((name_query or '').lower().split()) or None
+        self.tag_query = (tag_query or '').strip().lower() or None
+        self.price_band = price_band if price_band and price_band_condition(price_band) is not None else None
+        self.on_sale = on_sale
+        self.in_stock = in_stock
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> 'FilterState':
+        """
+        :param args: Query string of the filter form
+        :return: The criteria it selects, malformed values ignored
+        """
+        category_id = args.get('category_id', '')
+        return cls(category_id=int(category_id) if category_id.isdigit() else None,
+                   name_query=args.get('name_query'),
+                   tag_query=args.get('tag_query'),
+                   price_band=args.get('price_band'),
+                   on_sale=bool(args.get('on_sale')),
+                   in_stock=not args.get('include_out_of_stock'))
+
+    def filter_kwargs(self) -> dict[str, Any]:
+        """Keyword arguments of filter_products selecting the same products."""
+        return {'category_query': self.category_id, 'name_query': self.name_query, 'tag_query': self.tag_query,
+                'price_band': self.price_band, 'on_sale': self.on_sale, 'in_stock': self.in_stock}
+
+    def cache_key(self, prefix: str = 'facets') -> str:
+        """
+        :param prefix: What is cached for the state, facet counts by default
+        :return: Key of the cache entry
+        """
+        # Hashed, the texts typed by users may hold characters cache backends reject in keys
+        state = repr((self.category_id, self.name_query, self.tag_query, self.price_band, self.on_sale, self.in_stock))
+        return f"{prefix}:{hashlib.sha1(state.encode()).hexdigest()}"
+
+
+class _Selection:
+    """
+    The filters of a state as a check on the (category, price band, on sale, in stock, tag match) buckets.
+    """
+
+    def __init__(self, state: FilterState, bands: list[dict[str, Any]], subtrees: dict[int, list[int]]) -> None:
+        self.state = state
+        self.categories = None
+        if state.category_id is not None:
+            self.categories = set(subtrees.get(state.category_id, [state.category_id]))
+        self.band = next((index for index, band in enumerate(bands) if band['key'] == state.price_band), None)
+
+    def matches(self, bucket: list[Any], ignore: str = '') -> bool:
+        """
+        :param bucket: Facet values of a group of products
+        :param ignore: Facet whose own selection is not applied
+        :return: Whether the group passes the selected filters
+        """
+        category_id, band, sale, stock, tag = bucket
+        return ((ignore == 'category' or self.categories is None or category_id in self.categories)
+                and (ignore == 'price' or self.band is None or band == self.band)
+                and (ignore == 'on_sale' or not self.state.on_sale or bool(sale))
+                and (ignore == 'in_stock' or not self.state.in_stock or bool(stock))
+                and (ignore == 'tag' or bool(tag)))
+
+
+def _count_products(rows: list[Any], selection: _Selection, subtrees: dict[int, list[int]]) -> dict[str, Any]:
+    total = on_sale_count = in_stock_count = 0
+    own_counts: dict[Optional[int], int] = defaultdict(int)
+    band_counts: dict[int, int] = defaultdict(int)
+    for *bucket, count in rows:
+        category_id, band_index, sale, stock, _ = bucket
+        if selection.matches(bucket):
+            total += count
+        if selection.matches(bucket, ignore='category'):
+            own_counts[category_id] += count
+        if selection.matches(bucket, ignore='price'):
+            band_counts[band_index] += count
+        if sale and selection.matches(bucket, ignore='on_sale'):
+            on_sale_count += count
+        if stock and selection.matches(bucket, ignore='in_stock'):
+            in_stock_count += count
+
+    # Categories count the products of every category below them, like the category filter selects them
+    category_counts = {category_id: sum(own_counts.get(descendant_id, 0) for descendant_id in descendant_ids)
+                       for category_id, descendant_ids in subtrees.items()}
+
+    return {'total': total, 'categories': category_counts, 'price_bands': band_counts, 'on_sale': on_sale_count,
+            'in_stock': in_stock_count}
+
+
+def compute_facet_counts(state: FilterState) -> dict[str, Any]:
+    """
+    Count the products matching the criteria per facet value.
+
+    :param state: Current filter criteria
+    :return: total, categories (ID -> count including the categories below, as the category filter matches),
+        tags (list of id, name, count, most used first), price_bands (bands with their count), on_sale, in_stock
+    """
+    bands = price_bands()
+    band = _price_band_index(bands)
+    on_sale = case((Product.onSale == 1, 1), else_=0)
+    in_stock = case((Product.stock > 0, 1), else_=0)
+    tag_match = literal(1) if state.tag_query is None else case((exists().where(
+        products_tags.c.product_id == Product.id, Tag.id == products_tags.c.tag_id,
+        func.lower(Tag.name).contains(state.tag_query)), 1), else_=0)
+
+    base = db.session.query(Product)
+    if state.name_query:
+        base, _ = search_products(base, state.name_query)
+    base = base.order_by(None)
+
+    dimensions = [Product.category_id, band, on_sale, in_stock]
+    product_rows = base.with_entities(*dimensions, tag_match, func.count()).group_by(*dimensions, tag_match).all()
+    tag_rows = (base.join(products_tags, products_tags.c.product_id == Product.id)
+                .join(Tag, Tag.id == products_tags.c.tag_id)
+                .with_entities(Tag.id, Tag.name, *dimensions, func.count())
+                .group_by(Tag.id, Tag.name, *dimensions).all())
+
+    subtrees = read_subtrees(db.session)
+    selection = _Selection(state, bands, subtrees)
+
+    facets = _count_products(product_rows, selection, subtrees)
+
+    tag_counts: dict[int, list[Any]] = {}
+    for tag_id, name, *bucket, count in tag_rows:
+        if selection.matches(bucket + [1], ignore='tag'):
+            tag_counts.setdefault(tag_id, [name, 0])[1] += count
+
+    # Plain values only, the cache backend pickles them
+    facets['tags'] = [{'id': tag_id, 'name': name, 'count': count}
+                      for tag_id, (name, count) in sorted(tag_counts.items(), key=lambda item: (-item[1][1], item[0]))]
+    facets['price_bands'] = [dict(value, count=facets['price_bands'].get(index, 0))
+                             for index, value in enumerate(bands)]
+    return facets
+
+
+def get_facet_counts(state: FilterState) -> dict[str, Any]:
+    """
+    Get the facet counts of the criteria, computing and caching them on a miss.
+
+    :param state: Current filter criteria
+    :return: See compute_facet_counts
+    """
+    key = state.cache_key()
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facet_counts(state)
+        cache.set(key, facets, timeout=current_app.config.get('FACET_CACHE_TIMEOUT', 60))
+    return facets
@@ -0,0 +1,205 @@
+# /modular_store_backend/modules/filter/pagination.py
+"""
+Cursor (keyset) pagination of the product lists.
+
+The previous and next links carry an opaque cursor: the page number, and the ID and sort key of the first or last
+product shown. The neighbouring page continues from that product instead of skipping OFFSET rows: a selection of
+the catalog index looks the product up in its ordered IDs, a query adds `(sort key, id) > (:key, :id)` to its
+WHERE clause and is ordered by the sort key and the product ID. Page number links (?page=N) still use OFFSET, as do
+search results ordered by their FTS5 rank, which has no keyset.
+
+Totals of queries are cached per filter for LISTING_COUNT_CACHE_TIMEOUT seconds instead of counted on every page
+view, selections know their exact total.
+"""
+import base64
+import json
+from typing import Any, Optional, Union
+
+from flask import current_app, request, url_for
+from sqlalchemy import ColumnElement, and_, func, or_
+from sqlalchemy.orm import Query
+
+from modular_store_backend.modules.cache import cache
+from modular_store_backend.modules.catalog_index import ProductSelection
+from modular_store_backend.modules.db.models import Product
+from modular_store_backend.modules.filter.sort_options import SortOptions
+from modular_store_backend.modules.filter.utils import load_products
+
+# Stand-ins for NULL prices and ratings in the sort key, sorting after every value like nullslast() does
+NULL_SORT_KEYS = {'asc': 2 ** 53, 'desc': -1}
+
+
+def encode_cursor(cursor: dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str]) -> Optional[dict[str, Any]]:
+    """
+    :param token: Cursor of a previous or next link
+    :return: page, dir ('next' or 'prev'), id and key (None without a sort), None for a malformed token
+    """
+    if not token:
+        return None
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:  # also binascii.Error and undecodable bytes
+        return None
+    if not (isinstance(cursor, dict) and isinstance(cursor.get('page'), int) and cursor['page'] >= 1
+            and isinstance(cursor.get('id'), int) and cursor.get('dir') in ('next', 'prev')
+            and isinstance(cursor.get('key'), (int, float, type(None)))):
+        return None
+    return cursor
+
+
+def sort_key(sort_by: Optional[str]) -> tuple[Optional[ColumnElement], bool]:
+    """
+    :param sort_by: Key of a sort option
+    :return: The sort expression with NULLs replaced (None to order by ID only), and whether it sorts descending
+    """
+    option = SortOptions.get_by_key(sort_by) if sort_by else None
+    if option is None:
+        return None, False
+    return func.coalesce(option.field, NULL_SORT_KEYS[option.order]), option.order == 'desc'
+
+
+def count_products(query: Query[Product], count_key: Optional[str]) -> int:
+    """
+    :param query: Query of the listing
+    :param count_key: Cache key of the filter, None to count every time
+    :return: Number of products the query returns, up to LISTING_COUNT_CACHE_TIMEOUT seconds old
+    """
+    total = cache.get(count_key) if count_key else None
+    if total is None:
+        total = query.order_by(None).count()
+        if count_key:
+            cache.set(count_key, total, timeout=current_app.config.get('LISTING_COUNT_CACHE_TIMEOUT', 30))
+    return total
+
+
+class ListingPage:
+    """
+    One page of a product list, with the cursors of its neighbours.
+    """
+
+    def __init__(self, items: list[Product], page: int, per_page: int, total: int,
+                 next_cursor: Optional[str] = None, prev_cursor: Optional[str] = None) -> None:
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.total_pages = (total + per_page - 1) // per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def url(self, page: Optional[int] = None, cursor: Optional[str] = None) -> str:
+        """
+        :param page: Page number to link to
+        :param cursor: Cursor to link to instead
+        :return: URL of the current list (filters and sort kept) at that page
+        """
+        args = {key: value for key, value in request.args.items() if key not in ('page', 'cursor')}
+        if cursor:
+            args['cursor'] = cursor
+        elif page and page > 1:
+            args['page'] = page
+        return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+    @property
+    def next_url(self) -> Optional[str]:
+        return self.url(cursor=self.next_cursor) if self.next_cursor else None
+
+    @property
+    def prev_url(self) -> Optional[str]:
+        return self.url(cursor=self.prev_cursor) if self.prev_cursor else None
+
+
+def _cursor(page: int, direction: str, product_id: int, key: Any) -> str:
+    return encode_cursor({'page': page, 'dir': direction, 'id': product_id, 'key': key})
+
+
+def _selection_page(selection: ProductSelection, page: int, cursor: Optional[dict[str, Any]],
+                    per_page: int) -> ListingPage:
+    start = (page - 1) * per_page
+    position = selection.index_of(cursor['id']) if cursor else None
+    if position is not None:
+        start = position + 1 if cursor['dir'] == 'next' else max(position - per_page, 0)
+        page = 1 if start == 0 else page
+    items = load_products(selection.page(start, per_page))
+    has_next = start + per_page < len(selection)
+    return ListingPage(items, page, per_page, len(selection),
+                       next_cursor=_cursor(page + 1, 'next', items[-1].id, None) if items and has_next else None,
+                       prev_cursor=_cursor(page - 1, 'prev', items[0].id, None) if items and start > 0 else None)
+
+
+def _keyset_condition(key: Optional[ColumnElement], descending: bool, cursor: dict[str, Any]) -> ColumnElement:
+    forward = cursor['dir'] == 'next'
+    after_id = Product.id > cursor['id'] if forward else Product.id < cursor['id']
+    if key is None:
+        return after_id
+    after_key = key < cursor['key'] if descending == forward else key > cursor['key']
+    return or_(after_key, and_(key == cursor['key'], after_id))
+
+
+def _query_page(query: Query[Product], page: int, cursor: Optional[dict[str, Any]], per_page: int,
+                sort_by: Optional[str], total: int) -> ListingPage:
+    key, descending = sort_key(sort_by)
+    if cursor is not None and key is not None and cursor['key'] is None:
+        cursor = None  # handed out for another order, the page number still holds
+    backward = cursor is not None and cursor['dir'] == 'prev'
+    if cursor is not None:
+        query = query.filter(_keyset_condition(key, descending, cursor))
+
+    reverse = descending != backward
+    order = [] if key is None else [key.desc() if reverse else key.asc()]
+    order.append(Product.id.desc() if backward else Product.id.asc())
+    query = query.order_by(None).order_by(*order)
+    if cursor is None:
+        query = query.offset((page - 1) * per_page)
+    rows = query.add_columns(key if key is not None else Product.id).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+        page = page if more else 1
+    has_next, has_prev = (True, more) if backward else (more, page > 1)
+    items = [product for product, _ in rows]
+    return ListingPage(items, page, per_page, total,
+                       next_cursor=_cursor(page + 1, 'next', rows[-1][0].id, rows[-1][1]) if rows and has_next
+                       else None,
+                       prev_cursor=_cursor(page - 1, 'prev', rows[0][0].id, rows[0][1]) if rows and has_prev
+                       else None)
+
+
+def _offset_page(query: Query[Product], page: int, per_page: int, total: int) -> ListingPage:
+    rows = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    items = rows[:per_page]
+    # Without a keyset the cursors are page numbers
+    return ListingPage(items, page, per_page, total,
+                       next_cursor=_cursor(page + 1, 'next', items[-1].id, None) if len(rows) > per_page else None,
+                       prev_cursor=_cursor(page - 1, 'prev', items[0].id, None) if items and page > 1 else None)
+
+
+def paginate_listing(products: Union[ProductSelection, Query[Product]], page: int = 1,
+                     cursor: Optional[str] = None, sort_by: Optional[str] = None, keyset: bool = True,
+                     count_key: Optional[str] = None) -> ListingPage:
+    """
+    Get a page of a product list, by cursor when one is given and by page number otherwise.
+
+    :param products: Selection of the catalog index or query of the products
+    :param page: Page number, used without a (valid) cursor
+    :param cursor: Cursor of a previous or next link
+    :param sort_by: Sort option the query is ordered by, replaced by its keyset order
+    :param keyset: Whether the query may be reordered by sort key and ID, False for queries ordered by search rank
+    :param count_key: Cache key of the total of the query, see count_products
+    :return: The page
+    """
+    per_page = current_app.config['PER_PAGE']
+    decoded = decode_cursor(cursor)
+    page = max(decoded['page'] if decoded else page, 1)
+    if isinstance(products, ProductSelection):
+        return _selection_page(products, page, decoded, per_page)
+    total = count_products(products, count_key)
+    if not keyset:
+        return _offset_page(products, page, per_page, total)
+    return _query_page(products, page, decoded, per_page, sort_by, total)
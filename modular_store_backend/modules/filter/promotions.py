@@ -0,0 +1,87 @@
+# /modular_store_backend/modules/filter/promotions.py
+"""
+Promotion schedule: the IDs of the products with a running promotion, cached until the next promotion starts or
+ends. Listing pages read the IDs from the cache instead of joining product_promotions on every render.
+
+The boundary is the earliest start_date after now or end_date of a running promotion, two MIN lookups on the
+start_date and end_date indexes. Commits that write a promotion (ProductPromotionView, ORM code) drop the schedule;
+PROMOTION_SCHEDULE_CACHE_TIMEOUT bounds how long edits of other processes go unseen.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from modular_store_backend.modules.cache import cache
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import ProductPromotion
+
+PROMOTION_SCHEDULE_KEY = 'promotion_schedule'
+PROMOTIONS_CHANGED_KEY = 'promotions_changed'
+
+# end_date is inclusive, a promotion ending at 12:00:00 still runs at 12:00:00
+END_DATE_RESOLUTION = timedelta(microseconds=1)
+
+
+def compute_promotion_schedule(now: datetime) -> dict[str, Any]:
+    """
+    :param now: Time to compute the schedule at
+    :return: product_ids (products with a promotion running at that time, in order) and valid_until (the next time
+        a promotion starts or ends, None when none will)
+    """
+    product_ids = [product_id for product_id, in db.session.query(ProductPromotion.product_id)
+                   .filter(ProductPromotion.start_date <= now, ProductPromotion.end_date >= now)
+                   .group_by(ProductPromotion.product_id)
+                   .order_by(ProductPromotion.product_id)]
+    next_start: Optional[datetime] = (db.session.query(func.min(ProductPromotion.start_date))
+                                      .filter(ProductPromotion.start_date > now).scalar())
+    next_end: Optional[datetime] = (db.session.query(func.min(ProductPromotion.end_date))
+                                    .filter(ProductPromotion.end_date >= now).scalar())
+    boundaries = [boundary for boundary in (next_start, next_end + END_DATE_RESOLUTION if next_end else None)
+                  if boundary is not None]
+    return {'product_ids': product_ids, 'valid_until': min(boundaries) if boundaries else None}
+
+
+def get_promoted_product_ids(now: Optional[datetime] = None) -> list[int]:
+    """
+    Get the IDs of the products with a running promotion, computing and caching the schedule when it is missing or
+    a promotion started or ended since.
+
+    :param now: Current time, datetime.now() by default
+    :return: Product IDs in ascending order
+    """
+    now = now or datetime.now()
+    schedule = cache.get(PROMOTION_SCHEDULE_KEY)
+    if schedule is None or (schedule['valid_until'] is not None and now >= schedule['valid_until']):
+        schedule = compute_promotion_schedule(now)
+        timeout = current_app.config.get('PROMOTION_SCHEDULE_CACHE_TIMEOUT', 3600)
+        if schedule['valid_until'] is not None:
+            # Whole seconds, the boundary itself is checked above
+            timeout = max(min(timeout, int((schedule['valid_until'] - now).total_seconds()) + 1), 1)
+        cache.set(PROMOTION_SCHEDULE_KEY, schedule, timeout=timeout)
+    return schedule['product_ids']
+
+
+def invalidate_promotion_schedule() -> None:
+    cache.delete(PROMOTION_SCHEDULE_KEY)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_promotion_changes(session: Session, flush_context: Any) -> None:
+    if any(isinstance(instance, ProductPromotion)
+           for instance in (*session.new, *session.dirty, *session.deleted)):
+        session.info[PROMOTIONS_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_schedule_on_commit(session: Session) -> None:
+    # Sessions of apps without the cache (scripts, bare test apps) have nothing cached
+    if session.info.pop(PROMOTIONS_CHANGED_KEY, False) and has_app_context() and 'cache' in current_app.extensions:
+        invalidate_promotion_schedule()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_promotion_changes(session: Session) -> None:
+    session.info.pop(PROMOTIONS_CHANGED_KEY, None)
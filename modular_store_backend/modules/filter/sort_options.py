@@ -2,10 +2,9 @@
 from typing import Optional
 
 from flask_babel import gettext as _
-from sqlalchemy import func
 from sqlalchemy.orm import Query
 
-from modular_store_backend.modules.db.models import Product, Review
+from modular_store_backend.modules.db.models import Product
 
 
 class SortOption:
@@ -30,8 +29,6 @@ class SortOption:
         :param query: SQLAlchemy query
         :return: Modified query with sorting applied
         """
-        if self.key == 'rating':
-            query = query.outerjoin(Review, Review.product_id == Product.id).group_by(Product.id)
         order_func = getattr(self.field, self.order)
         return query.order_by(order_func().nullslast())
 
@@ -39,7 +36,11 @@ class SortOption:
 class SortOptions:
     PRICE_ASC = SortOption('price_asc', _('Price: Low to High'), Product.current_price, 'asc')
     PRICE_DESC = SortOption('price_desc', _('Price: High to Low'), Product.current_price, 'desc')
-    AVG_RATING_DESC = SortOption('rating', _('Rating: High to Low'), func.coalesce(func.avg(Review.rating), 0), 'desc')
+    AVG_RATING_DESC = SortOption('rating', _('Rating: High to Low'), Product.rating_avg, 'desc')
+    # Popularity scores kept by modules/rankings.py
+    BEST_SELLING = SortOption('best_selling', _('Best Selling'), Product.sales_score, 'desc')
+    MOST_VIEWED = SortOption('most_viewed', _('Most Viewed'), Product.view_score, 'desc')
+    TRENDING = SortOption('trending', _('Trending'), Product.trending_score, 'desc')
 
     @classmethod
     def get_all(cls) -> list[SortOption]:
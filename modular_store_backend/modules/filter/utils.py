@@ -1,16 +1,26 @@
-from datetime import datetime
+import json
 from typing import Tuple
-from typing import Optional
+from typing import Optional, Union
 
 from flask import current_app
-from sqlalchemy import func, exists, and_, or_
-from sqlalchemy import select
+from markupsafe import Markup, escape
+from sqlalchemy import func, exists, and_, or_, case, false, ColumnElement
 from sqlalchemy.orm import selectinload
 from sqlalchemy.orm.query import Query
 
+from modular_store_backend.modules.catalog_index import ProductSelection, catalog_index, catalog_index_enabled
+from modular_store_backend.modules.db.category_tree import subtree_ids
 from modular_store_backend.modules.db.database import db
-from modular_store_backend.modules.db.models import Product, Category, Tag, products_tags, ProductPromotion
+from modular_store_backend.modules.db.models import Product, Category, Tag, products_tags
+from modular_store_backend.modules.db.product_search import any_term_expression, match_expression, search_subquery, \
+    snippet_query
+from modular_store_backend.modules.db.sqlite_tuning import is_sqlite
+from modular_store_backend.modules.filter.promotions import get_promoted_product_ids
 from modular_store_backend.modules.filter.sort_options import SortOptions
+from modular_store_backend.modules.search_index import product_search_index, search_index_enabled
+
+
+DEFAULT_PRICE_BANDS = [1000, 2500, 5000, 10000, 25000]  # upper bounds in cents, the last band is open
 
 
 def filter_products(
@@ -18,7 +28,10 @@ def filter_products(
         name_query: Optional[str] = None,
         category_query: Optional[str] = None,
         sort_by: Optional[str] = None,
-        tag_query: Optional[str] = None
+        tag_query: Optional[str] = None,
+        price_band: Optional[str] = None,
+        on_sale: bool = False,
+        in_stock: bool = True
 ) -> Query[Product]:
     """
     Filter products based on various criteria.
@@ -28,21 +41,24 @@ def filter_products(
     :param category_query: Category ID to filter by
     :param sort_by: Sorting option
     :param tag_query: Tag to filter by
+    :param price_band: Key of a price band (see price_bands) the current price must fall in
+    :param on_sale: Only products on sale
+    :param in_stock: Only products in stock, applies when no initial query is given
     :return: Filtered query
     """
     if query is None:
-        query = db.session.query(Product).filter(Product.stock > 0)
+        query = db.session.query(Product)
+        if in_stock:
+            query = query.filter(Product.stock > 0)
 
     query = query.options(selectinload(Product.category), selectinload(Product.tags))
 
-    if name_query:  # Case-insensitive search
-        query = query.filter(func.lower(Product.samplename).contains(name_query.lower()))
+    rank = None
+    if name_query:  # Full-text search over name, description, tags and category
+        query, rank = search_products(query, name_query)
 
-    if category_query:  # Filter by category and its subcategories
-        subcategories = select(Category.id).where(
-            or_(Category.id == category_query, Category.parent_id == category_query)
-        ).scalar_subquery()
-        query = query.filter(Product.category_id.in_(subcategories))
+    if category_query:  # Filter by category and the categories below it, at any depth
+        query = query.filter(Product.category_id.in_(subtree_ids(category_query).scalar_subquery()))
 
     if tag_query:  # Filter by tag
         tag_subquery = exists().where(
@@ -54,30 +70,174 @@ def filter_products(
         )
         query = query.filter(tag_subquery)
 
+    query = filter_by_price(query, price_band, on_sale)
+
     if sort_by:  # Apply sorting if provided
         sort_option = SortOptions.get_by_key(sort_by)
         if sort_option:
             query = sort_option.apply(query)
 
+    if rank is not None:  # Best matches first, or among products with the same sort key
+        query = query.order_by(rank)
+
     return query
 
 
-def get_filter_options() -> dict[str, any]:
+def select_products(
+        name_query: Optional[str] = None,
+        category_query: Optional[int] = None,
+        sort_by: Optional[str] = None,
+        tag_query: Optional[str] = None,
+        price_band: Optional[str] = None,
+        on_sale: bool = False,
+        in_stock: bool = True
+) -> Union[ProductSelection, Query[Product]]:
+    """
+    Resolve the criteria of filter_products through the catalog index, when it is enabled and ready.
+
+    Name searches need the in-memory search index for their ranking, sort options the catalog index does not hold
+    fall back to the query as well. The filters and the sort apply to every match of a search, not only to the
+    PRODUCT_SEARCH_MAX_RESULTS best.
+
+    :return: The ordered IDs of the matching products, or the query of filter_products
+    """
+    if catalog_index_enabled(current_app) and catalog_index.ready:
+        ranked_ids = None
+        if name_query and search_index_enabled(current_app) and product_search_index.ready:
+            ranked_ids = product_search_index.search(name_query, complete=True)
+        band = find_price_band(price_band) if price_band else None
+        if not name_query or ranked_ids is not None:
+            selection = catalog_index.select(category_id=int(category_query) if category_query else None,
+                                             tag_query=tag_query,
+                                             price_range=(band['min'], band['max']) if band else None,
+                                             on_sale=on_sale, in_stock=in_stock, sort_by=sort_by,
+                                             ranked_ids=ranked_ids)
+            if selection is not None:
+                return selection
+    return filter_products(name_query=name_query, category_query=category_query, sort_by=sort_by,
+                           tag_query=tag_query, price_band=price_band, on_sale=on_sale, in_stock=in_stock)
+
+
+def filter_by_price(query: Query[Product], price_band: Optional[str], on_sale: bool) -> Query[Product]:
+    """
+    :param query: Query to restrict
+    :param price_band: Key of the price band the current price must fall in, unknown bands are ignored
+    :param on_sale: Only products on sale
+    :return: The restricted query
+    """
+    condition = price_band_condition(price_band) if price_band else None
+    if condition is not None:
+        query = query.filter(condition)
+    if on_sale:
+        query = query.filter(Product.onSale == 1)
+    return query
+
+
+def search_products(query: Query[Product], name_query: str) -> Tuple[Query[Product], Optional[ColumnElement]]:
+    """
+    Restrict a query to the products matching a search, through the in-memory index or the FTS5 index depending
+    on PRODUCT_SEARCH_BACKEND.
+
+    Every word of the search matches as a prefix (or with typos, in memory), in the name, description, tag names
+    or category name. Databases without the FTS5 index (not SQLite) fall back to a case-insensitive LIKE on name
+    and description.
+
+    :param query: Query to restrict
+    :param name_query: Text typed into the search box
+    :return: The restricted query and its rank column to order by (None without an index)
+    """
+    if search_index_enabled(current_app) and product_search_index.ready:
+        return search_index_products(query, name_query)
+
+    expression = match_expression(name_query)
+    if expression is None or not is_sqlite(db.engine):
+        pattern = name_query.lower()
+        return query.filter(or_(func.lower(Product.samplename).contains(pattern),
+                                func.lower(Product.description).contains(pattern))), None
+
+    matches = search_subquery(expression)
+    return query.join(matches, matches.c.product_id == Product.id), matches.c.rank
+
+
+def search_index_products(query: Query[Product], name_query: str) -> Tuple[Query[Product], Optional[ColumnElement]]:
+    """
+    Restrict a query to the matches of the in-memory index. All of them, the filters and the sort of the query
+    apply after this.
+
+    :param query: Query to restrict
+    :param name_query: Text typed into the search box
+    :return: The restricted query and the position of each product in the ranking, to order by
+    """
+    product_ids = product_search_index.search(name_query, complete=True)
+    if not product_ids:
+        return query.filter(false()), None
+    if is_sqlite(db.engine):
+        # One bound JSON array instead of a parameter per ID, its keys are the positions in the ranking
+        ranking = func.json_each(json.dumps(product_ids)).table_valued('key', 'value').alias('search_ranking')
+        return query.join(ranking, ranking.c.value == Product.id), ranking.c.key
+    return (query.filter(Product.id.in_(product_ids)),
+            case({product_id: position for position, product_id in enumerate(product_ids)}, value=Product.id))
+
+
+def search_snippets(products: list[Product], name_query: Optional[str]) -> dict[int, Markup]:
     """
-    Get filter options for categories, tags, and sorting.
+    Description snippets of search results with the matched words wrapped in <mark>.
 
-    :return: dictionary containing filter options
+    :param products: Products shown on the page
+    :param name_query: Text typed into the search box
+    :return: Product ID mapped to its snippet, empty without a search
     """
-    categories = get_categories()
-    tags = get_all_tags()
-    sort_options = [{'value': option.key, 'label': option.label} for option in SortOptions.get_all()]
+    if not name_query:
+        expression = None
+    elif search_index_enabled(current_app) and product_search_index.ready:
+        # Highlight the words the search matched through, typos corrected
+        expression = any_term_expression(product_search_index.corrections(name_query))
+    else:
+        expression = match_expression(name_query)
+    if expression is None or not products or not is_sqlite(db.engine):
+        return {}
 
-    filter_options = {
-        'categories': categories,
-        'tags': tags,
-        'sort_options': sort_options,
+    # The snippet is escaped first, the control characters marking the matches cannot come from the text
+    rows = db.session.execute(snippet_query(), {'search_expression': expression, 'start': '\x02', 'end': '\x03',
+                                                'product_ids': [product.id for product in products]})
+    return {
+        product_id: Markup(str(escape(snippet)).replace('\x02', '<mark>').replace('\x03', '</mark>'))
+        for product_id, snippet in rows if snippet
     }
-    return filter_options
+
+
+def price_bands(bounds: Optional[list[int]] = None) -> list[dict[str, any]]:
+    """
+    Price ranges offered by the filter.
+
+    :param bounds: Ascending band limits in cents, FACET_PRICE_BANDS by default
+    :return: The bands in order, with their key (used in URLs), lower and upper (None for the last) limit in cents
+    """
+    if bounds is None:
+        bounds = current_app.config.get('FACET_PRICE_BANDS', DEFAULT_PRICE_BANDS)
+    limits = [0] + list(bounds) + [None]
+    return [{'key': f"{low}-{high if high is not None else ''}", 'min': low, 'max': high}
+            for low, high in zip(limits, limits[1:])]
+
+
+def find_price_band(key: str) -> Optional[dict[str, any]]:
+    """
+    :param key: Key of a price band
+    :return: The band (see price_bands), None for an unknown key
+    """
+    return next((band for band in price_bands() if band['key'] == key), None)
+
+
+def price_band_condition(key: str) -> Optional[ColumnElement]:
+    """
+    :param key: Key of a price band
+    :return: Condition on the current product price, None for an unknown key
+    """
+    band = find_price_band(key)
+    if band is None:
+        return None
+    price = func.coalesce(Product.current_price, 0)
+    return price >= band['min'] if band['max'] is None else and_(price >= band['min'], price < band['max'])
 
 
 def get_categories() -> list[dict[str, any]]:
@@ -91,35 +251,53 @@ def get_all_tags() -> list[dict[str, any]]:
     return [{'id': tag.id, 'name': tag.name} for tag in db.session.query(Tag).all()]
 
 
-def get_promoted_products(products_query: Optional[Query[Product]] = None) -> list[Product]:
+def get_promoted_products(products: Union[ProductSelection, Query[Product], None] = None) -> list[Product]:
     """
     Get a list of promoted products.
 
-    :param products_query: Initial query to apply promotions on
+    :param products: Initial query to apply promotions on, or the selection of the catalog index to keep them from
     :return: list of promoted products
     """
-    if products_query is None:
-        products_query = db.session.query(Product).filter(Product.stock > 0)
+    # The running promotions come from the cached schedule, only their products are queried
+    promoted_ids = get_promoted_product_ids()
+    if isinstance(products, ProductSelection):
+        return load_products([product_id for product_id in promoted_ids if product_id in products])
+    if not promoted_ids:
+        return []
+    if products is None:
+        products = db.session.query(Product).filter(Product.stock > 0)
+    return products.filter(Product.id.in_(promoted_ids)).all()
+
 
-    current_timestamp = datetime.now()
-    return products_query.join(ProductPromotion).filter(
-        ProductPromotion.start_date <= current_timestamp,
-        ProductPromotion.end_date >= current_timestamp
-    ).all()
+def load_products(product_ids: list[int]) -> list[Product]:
+    """
+    :param product_ids: IDs of the products of a page, in order
+    :return: The products in that order, with their category and tags; deleted ones skipped
+    """
+    if not product_ids:
+        return []
+    loaded = {product.id: product for product in db.session.query(Product)
+              .options(selectinload(Product.category), selectinload(Product.tags))
+              .filter(Product.id.in_(product_ids))}
+    return [loaded[product_id] for product_id in product_ids if product_id in loaded]
 
 
-def paginate_query(query: Query[Product], page: int) -> Tuple[list[Product], int, int, int]:
+def paginate_query(query: Union[ProductSelection, Query[Product]], page: int) -> Tuple[list[Product], int, int, int]:
     """
-    Paginate a query.
+    Paginate a query, or a selection of the catalog index whose page alone is loaded.
 
-    :param query: Query to paginate
+    :param query: Query or selection to paginate
     :param page: Page number
     :return: Tuple containing the paginated results, total items, total pages, and items per page
     """
-    in_total = query.count()
     per_page = current_app.config['PER_PAGE']
     offset = (page - 1) * per_page
-    paginated_query = query.offset(offset).limit(per_page).all()
+    if isinstance(query, ProductSelection):
+        in_total = len(query)
+        paginated_query = load_products(query.page(offset, per_page))
+    else:
+        in_total = query.order_by(None).count()  # the count does not need the (search rank) sort
+        paginated_query = query.offset(offset).limit(per_page).all()
 
     total_pages = (in_total + per_page - 1) // per_page
 
@@ -4,8 +4,11 @@ from typing import Optional
 from flask import Blueprint, render_template, request, Flask
 from flask.typing import ResponseValue
 
-from modular_store_backend.modules.filter.utils import filter_products, paginate_query, get_categories, \
-    get_promoted_products
+from modular_store_backend.modules.filter.facets import FilterState, get_facet_counts
+from modular_store_backend.modules.filter.pagination import paginate_listing
+from modular_store_backend.modules.filter.catalog_metadata import get_filter_options
+from modular_store_backend.modules.filter.categories import get_category_tree
+from modular_store_backend.modules.filter.utils import select_products, get_promoted_products, search_snippets
 
 filter_bp = Blueprint('filter', __name__)
 
@@ -13,24 +16,22 @@ filter_bp = Blueprint('filter', __name__)
 @filter_bp.route('/filter')
 def filter_route() -> ResponseValue:
     """Filter products based on various query parameters and render the results."""
-    category_id: Optional[str] = request.args.get('category_id')
-    name_query: Optional[str] = request.args.get('name_query')
+    state = FilterState.from_args(request.args)
     sort_by: Optional[str] = request.args.get('sort_by')
-    tag_query: Optional[str] = request.args.get('tag_query')
     page: int = request.args.get('page', 1, type=int)
 
-    products_query = filter_products(category_query=category_id,
-                                     name_query=name_query,
-                                     sort_by=sort_by,
-                                     tag_query=tag_query)
-    products, in_total, total_pages, per_page = paginate_query(products_query, page)
+    selection = select_products(sort_by=sort_by, **state.filter_kwargs())
+    listing = paginate_listing(selection, page, request.args.get('cursor'), sort_by=sort_by,
+                               keyset=not state.name_query, count_key=state.cache_key('listing_count'))
 
-    categories = get_categories()
-    promoted_products = get_promoted_products(products_query)
+    categories = get_category_tree()
+    promoted_products = get_promoted_products(selection)
 
-    return render_template('index.html', products=products,
-                           current_page=page, total_pages=total_pages, categories=categories,
-                           promoted_products=promoted_products, per_page=per_page, in_total=in_total)
+    return render_template('index.html', products=listing.items, pagination=listing,
+                           current_page=listing.page, total_pages=listing.total_pages, categories=categories,
+                           promoted_products=promoted_products, per_page=listing.per_page, in_total=listing.total,
+                           snippets=search_snippets(listing.items, state.name_query), facets=get_facet_counts(state),
+                           filter_options=get_filter_options())
 
 
 def init_filter(app: Flask) -> None:
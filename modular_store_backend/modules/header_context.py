@@ -0,0 +1,127 @@
+# /modular_store_backend/modules/header_context.py
+"""
+Site header values (cart summary, mini cart, unread notification count) cached per user.
+
+Commits that write cart or notification rows through the ORM (the store pages, the admin views) drop the entries of
+their users, and so does the retention job for the notifications it deletes. Other bulk writes must call
+invalidate_header_context. The entry lives in the cache backend of CACHE_TYPE: with the default per-process
+SimpleCache only the worker that handled the write drops it, the other workers keep showing the old counts until
+HEADER_CONTEXT_CACHE_TIMEOUT expires them.
+"""
+from typing import Any, Iterable
+
+from flask import current_app, has_app_context
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes
+
+from modular_store_backend.modules.cache import cache
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Cart, Notification
+
+HEADERS_CHANGED_KEY = 'header_contexts_changed'
+
+EMPTY_HEADER_CONTEXT: dict[str, Any] = {
+    'total_items': 0,
+    'total_amount': 0,
+    'discount_percentage': 0,
+    'mini_cart_items': [],
+    'unread_notifications_count': 0,
+}
+
+
+def _cache_key(user_id: int) -> str:
+    return f'header_context:{user_id}'
+
+
+def build_header_context() -> dict[str, Any]:
+    """
+    Query the cart summary, mini-cart lines and unread notification count for the current user.
+
+    :return: dictionary with the values rendered in the site header
+    """
+    total_items, total_amount, discount_percentage = Cart.cart_info()
+
+    cart_items: list[Cart] = db.session.query(Cart).filter_by(user_id=current_user.id).all()
+    mini_cart_items = [{
+        'id': item.id,
+        'product_id': item.product_id,
+        'name': item.product.samplename if item.product else None,
+        'quantity': item.quantity,
+        'price': item.price,
+        'variant_options': item.variant_options,
+    } for item in cart_items]
+
+    unread_notifications_count: int = db.session.query(Notification).filter_by(
+        user_id=current_user.id, read=False
+    ).count()
+
+    # Plain values only, the cache backend pickles them
+    return {
+        'total_items': int(total_items),
+        'total_amount': float(total_amount),
+        'discount_percentage': float(discount_percentage),
+        'mini_cart_items': mini_cart_items,
+        'unread_notifications_count': int(unread_notifications_count),
+    }
+
+
+def get_header_context() -> dict[str, Any]:
+    """
+    Get the header context of the current user, building and caching it on a miss.
+
+    :return: dictionary with the values rendered in the site header
+    """
+    if not current_user or not current_user.is_authenticated:
+        return dict(EMPTY_HEADER_CONTEXT)
+
+    key = _cache_key(current_user.id)
+    header_context: dict[str, Any] | None = cache.get(key)
+    if header_context is None:
+        header_context = build_header_context()
+        cache.set(key, header_context, timeout=current_app.config.get('HEADER_CONTEXT_CACHE_TIMEOUT', 300))
+
+    # Cart.cart_info() stores the discount on the user, checkout relies on it
+    current_user.discount = header_context['discount_percentage']
+    return header_context
+
+
+def invalidate_header_context(user_id: int) -> None:
+    """
+    Drop the cached header context of a user after their cart or notifications changed.
+
+    :param user_id: ID of the user whose header context is stale
+    """
+    cache.delete(_cache_key(user_id))
+
+
+def invalidate_header_contexts(user_ids: Iterable[int]) -> None:
+    """
+    Drop the cached header contexts of users, when the app has a cache.
+
+    :param user_ids: IDs of the users whose header context is stale
+    """
+    keys = [_cache_key(user_id) for user_id in user_ids if user_id is not None]
+    if keys and has_app_context() and 'cache' in current_app.extensions:
+        cache.delete_many(*keys)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_header_changes(session: Session, flush_context: Any) -> None:
+    user_ids: set[int] = set()
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (Cart, Notification)):
+            user_ids.add(instance.user_id)
+            user_ids.update(attributes.get_history(instance, 'user_id').deleted)  # moved to another user
+    if user_ids:
+        session.info.setdefault(HEADERS_CHANGED_KEY, set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_headers_on_commit(session: Session) -> None:
+    invalidate_header_contexts(session.info.pop(HEADERS_CHANGED_KEY, ()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_header_changes(session: Session) -> None:
+    session.info.pop(HEADERS_CHANGED_KEY, None)
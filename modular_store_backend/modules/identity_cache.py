@@ -0,0 +1,123 @@
+# /modular_store_backend/modules/identity_cache.py
+"""
+Logged-in user rows cached between requests, tagged with users.identity_version.
+
+Every ORM update of a user raises identity_version in the same UPDATE statement, so the version commits (or rolls
+back) together with the change and every worker process sees it. load_cached_user reads the version of the row from
+the primary database, one single-column primary key lookup, and only loads and refreshes the whole row when the
+cached copy is of an older version. An admin demotion or deactivation is therefore seen by the next request of every
+worker, whatever the cache backend.
+
+Bulk writes (query.update(), Core UPDATE statements) skip the mapper events: those changing what a user may do must
+call bump_user_version in their transaction. users.last_seen, written in bulk by the presence tracker, does not.
+"""
+import threading
+from typing import Any, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session, object_session
+
+from modular_store_backend.modules.cache import cache
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import User
+
+IDENTITIES_CHANGED_KEY = 'identities_changed'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'db_loads': 0}
+
+
+def _identity_key(user_id: int) -> str:
+    return f'user_identity:{user_id}'
+
+
+def _count(stat: str) -> None:
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def get_identity_cache_stats() -> dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def get_user_version(user_id: int) -> Optional[int]:
+    """
+    :param user_id: ID of the user
+    :return: identity_version of the user row, None if the user does not exist
+    """
+    # Session.connection() is the primary: a lagging read replica must not vouch for a stale identity
+    version: Optional[int] = db.session.connection().scalar(
+        select(User.identity_version).where(User.id == user_id))
+    return version
+
+
+def bump_user_version(user_id: int) -> None:
+    """
+    Invalidate the cached identity of a user changed by a bulk write, in the transaction of the caller.
+
+    :param user_id: ID of the changed user
+    """
+    db.session.execute(update(User).where(User.id == user_id)
+                       .values(identity_version=User.identity_version + 1)
+                       .execution_options(synchronize_session=False))
+
+
+def load_cached_user(user_id: int) -> Optional[User]:
+    """
+    Get a user attached to the current session, from the identity cache when its version is current.
+
+    :param user_id: ID of the user
+    :return: User instance or None if the user does not exist
+    """
+    user_id = int(user_id)
+    version = get_user_version(user_id)
+    if version is None:
+        return None
+
+    cached: Optional[User] = cache.get(_identity_key(user_id))
+    if cached is not None and cached.identity_version == version:
+        _count('hits')
+        # load=False attaches the cached state to the session without a SELECT
+        return db.session.merge(cached, load=False)
+
+    _count('db_loads')
+    user: Optional[User] = db.session.get(User, user_id)
+    if user is None:
+        return None
+
+    # The identity map may still hold a copy loaded earlier in this session
+    db.session.refresh(user)
+    # Cached under the version of the row itself, which may already be newer than the one read above
+    cache.set(_identity_key(user_id), user, timeout=current_app.config.get('USER_IDENTITY_CACHE_TIMEOUT', 300))
+    return user
+
+
+@event.listens_for(User, 'before_update')
+def _bump_version_on_update(mapper: Any, connection: Any, target: User) -> None:
+    # Profile handlers, password resets and admin edits all go through the ORM; the SQL expression increments the
+    # committed value, not the one this session loaded
+    session = object_session(target)
+    if session is not None and session.is_modified(target, include_collections=False):
+        target.identity_version = User.identity_version + 1
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_identity_changes(session: Session, flush_context: Any) -> None:
+    user_ids = {instance.id for instance in (*session.dirty, *session.deleted) if isinstance(instance, User)}
+    if user_ids:
+        session.info.setdefault(IDENTITIES_CHANGED_KEY, set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_identities_on_commit(session: Session) -> None:
+    # The version already tells stale copies apart, dropping them just frees the cache of this process
+    user_ids = session.info.pop(IDENTITIES_CHANGED_KEY, None)
+    if user_ids and has_app_context() and 'cache' in current_app.extensions:
+        cache.delete_many(*(_identity_key(user_id) for user_id in user_ids))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_identity_changes(session: Session) -> None:
+    session.info.pop(IDENTITIES_CHANGED_KEY, None)
@@ -1,12 +1,167 @@
 # /modular_store_backend/modules/logger.py
+import atexit
+import logging
+import queue
+import random
+import threading
 import time
-from typing import Optional
+from datetime import datetime
+from typing import Any, Optional
 
 from flask import current_app, Flask, request, Response
 from flask_login import current_user
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
 
 from modular_store_backend.modules.db.database import db
 from modular_store_backend.modules.db.models import RequestLog
+from modular_store_backend.modules.query_stats import query_instrumentation
+
+
+class RequestLogWriter:
+    """
+    Buffers request log records in a bounded queue and writes them in batches
+    with multi-row INSERTs from a background thread.
+    """
+
+    OVERFLOW_POLICIES = ('drop', 'block')
+
+    def __init__(self,
+                 max_queue_size: int = 10000,
+                 batch_size: int = 100,
+                 flush_interval: float = 0.5,
+                 overflow_policy: str = 'drop',
+                 block_timeout: float = 0.05,
+                 synchronous: bool = False) -> None:
+        """
+        :param max_queue_size: Maximum number of records waiting to be written
+        :param batch_size: Maximum number of records per INSERT statement
+        :param flush_interval: Maximum time in seconds a record waits before its batch is written
+        :param overflow_policy: 'drop' discards records when the queue is full, 'block' waits up to block_timeout
+        :param block_timeout: Time in seconds to wait for free space with the 'block' policy
+        :param synchronous: Write every record in the calling thread instead of the background thread
+        """
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.synchronous = synchronous
+
+        self._queue: queue.Queue[dict[str, Any]] = queue.Queue(maxsize=max_queue_size)
+        self._engine: Optional[Engine] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0}
+
+    def start(self, engine: Engine) -> None:
+        self._engine = engine
+        if self.synchronous or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='request-log-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, record: dict[str, Any]) -> bool:
+        """
+        Hand a record over to the writer.
+
+        :param record: Column values of a RequestLog row
+        :return: True if the record was accepted, False if it was dropped
+        """
+        if self.synchronous:
+            self._count('queued')
+            self._write([record])
+            return True
+
+        try:
+            if self.overflow_policy == 'block':
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+        self._count('queued')
+        return True
+
+    def flush(self) -> int:
+        """
+        Write every queued record from the calling thread.
+
+        :return: Number of records written
+        """
+        written = 0
+        while batch := self._drain(self.batch_size):
+            written += self._write(batch)
+        return written
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def get_metrics(self) -> dict[str, int]:
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics['queue_size'] = self._queue.qsize()
+        return metrics
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+
+    def _collect_batch(self) -> list[dict[str, Any]]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self, limit: int) -> list[dict[str, Any]]:
+        batch: list[dict[str, Any]] = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list[dict[str, Any]]) -> int:
+        if self._engine is None:
+            raise RuntimeError("Writer not started. Call start() first.")
+        try:
+            with self._engine.begin() as connection:
+                connection.execute(insert(RequestLog).values(batch))
+        except Exception as e:
+            self._count('failed', len(batch))
+            logging.error(f"Error writing {len(batch)} request log(s): {str(e)}")
+            return 0
+
+        self._count('written', len(batch))
+        return len(batch)
+
+    def _count(self, metric: str, value: int = 1) -> None:
+        with self._metrics_lock:
+            self._metrics[metric] += value
 
 
 class DatabaseLogger:
@@ -15,20 +170,46 @@ class DatabaseLogger:
     """
 
     def __init__(self, app: Optional[Flask] = None) -> None:
+        self.writer: Optional[RequestLogWriter] = None
         if app is not None:
             self.init_app(app)
 
     def init_app(self, app: Flask) -> None:
+        self.sample_rate: float = app.config.get('REQUEST_LOG_SAMPLE_RATE', 1.0)
+        self.excluded_endpoints: set[str] = set(app.config.get('REQUEST_LOG_EXCLUDED_ENDPOINTS', ['static']))
+        self.excluded_status_codes: set[int] = set(app.config.get('REQUEST_LOG_EXCLUDED_STATUS_CODES', []))
+
+        # Every thread gets its own in-memory database, so only the request thread can write there
+        in_memory_db = db.engine.url.database in (None, '', ':memory:')
+        self.writer = RequestLogWriter(
+            max_queue_size=app.config.get('REQUEST_LOG_QUEUE_SIZE', 10000),
+            batch_size=app.config.get('REQUEST_LOG_BATCH_SIZE', 100),
+            flush_interval=app.config.get('REQUEST_LOG_FLUSH_INTERVAL', 0.5),
+            overflow_policy=app.config.get('REQUEST_LOG_OVERFLOW_POLICY', 'drop'),
+            synchronous=in_memory_db or not app.config.get('REQUEST_LOG_ASYNC', True),
+        )
+        self.writer.start(db.engine)
+        atexit.register(self.writer.stop)
+
+        app.extensions['request_log_writer'] = self.writer
         app.before_request(self.before_request)
         app.after_request(self.after_request)
 
     def before_request(self) -> None:
         request.start_time = time.time()  # type: ignore
 
+    def should_log(self, endpoint: str, status_code: int) -> bool:
+        if endpoint in self.excluded_endpoints or status_code in self.excluded_status_codes:
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
     def after_request(self, response: Response) -> Response:
+        endpoint = request.endpoint if request.endpoint else 'unknown'
+        if not self.writer or not self.should_log(endpoint, response.status_code):
+            return response
+
         execution_time = time.time() - request.start_time  # type: ignore
         user_id = current_user.id if current_user.is_authenticated else None
-        endpoint = request.endpoint if request.endpoint else 'unknown'
 
         log_data = {
             'user_id': user_id,
@@ -39,6 +220,5 @@ class DatabaseLogger:
             'execution_time': execution_time
         }
         current_app.logger.info(f"Request: {log_data}")
-        db.session.add(RequestLog(**log_data))
-        db.session.commit()
+        self.writer.submit({**log_data, **query_instrumentation.request_log_fields(), 'timestamp': datetime.utcnow()})
         return response
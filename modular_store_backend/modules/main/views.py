@@ -1,6 +1,5 @@
 # /modular_store_backend/modules/main/views.py
 import json
-from math import ceil
 from typing import Optional
 
 from flask import Blueprint, render_template, request, flash, redirect, url_for, session, current_app
@@ -18,8 +17,9 @@ from modular_store_backend.modules.db.models import Product, ProductSelectionOpt
     RecentlyViewedProduct, \
     ComparisonHistory
 from modular_store_backend.modules.decorators import login_required_with_message
-from modular_store_backend.modules.filter import get_filter_options, filter_products, paginate_query, \
-    get_promoted_products, get_categories
+from modular_store_backend.modules.filter import get_filter_options, get_promoted_products, get_category_tree, \
+    get_breadcrumbs, search_snippets, FilterState, get_facet_counts, select_products, paginate_listing
+from modular_store_backend.modules.rankings import ranking_recorder
 from modular_store_backend.modules.recommendations import get_recommended_products, update_recently_viewed_products
 from modular_store_backend.modules.reviews import has_purchased
 
@@ -28,33 +28,37 @@ main_bp = Blueprint('main', __name__)
 
 @main_bp.route("/")
 def index() -> ResponseValue:
-    if 'filter_options' not in session:
-        session['filter_options'] = get_filter_options()
+    # Sessions from before the shared catalog metadata still carry a copy in their cookie
+    if 'filter_options' in session:
+        del session['filter_options']
 
     page: int = request.args.get('page', 1, type=int)
-    products_query = filter_products(None, None, None).options(selectinload(Product.tags))
-    paginated_query, in_total, total_pages, per_page = paginate_query(products_query, page)
+    state = FilterState()
+    listing = paginate_listing(select_products(), page, request.args.get('cursor'),
+                               count_key=state.cache_key('listing_count'))
 
-    return render_template("index.html", products=paginated_query, current_page=page, total_pages=total_pages,
-                           categories=get_categories(), promoted_products=get_promoted_products(), per_page=per_page,
-                           in_total=in_total)
+    return render_template("index.html", products=listing.items, pagination=listing, current_page=listing.page,
+                           total_pages=listing.total_pages, categories=get_category_tree(),
+                           promoted_products=get_promoted_products(), per_page=listing.per_page,
+                           in_total=listing.total, facets=get_facet_counts(state),
+                           filter_options=get_filter_options())
 
 
 @main_bp.route("/search")
 def search_route() -> ResponseValue:
     query: Optional[str] = request.args.get('query')
     page: int = request.args.get('page', 1, type=int)
-    per_page: int = current_app.config['PER_PAGE']
 
-    search_query = filter_products(name_query=query)
-    total: int = search_query.count()
-    offset: int = (page - 1) * per_page
-    paginated_products: list[Product] = search_query.offset(offset).limit(per_page).all()
-    total_pages: int = ceil(total / per_page)
+    state = FilterState(name_query=query)
+    # Ordered by search rank, queries (without the in-memory indexes) page by OFFSET
+    listing = paginate_listing(select_products(name_query=query), page, request.args.get('cursor'), keyset=False,
+                               count_key=state.cache_key('listing_count'))
 
-    return render_template("index.html", products=paginated_products, query=query,
-                           total_pages=total_pages, current_page=page, per_page=per_page, in_total=total,
-                           categories=get_categories(), promoted_products=get_promoted_products())
+    return render_template("index.html", products=listing.items, pagination=listing, query=query,
+                           total_pages=listing.total_pages, current_page=listing.page, per_page=listing.per_page,
+                           in_total=listing.total, categories=get_category_tree(),
+                           promoted_products=get_promoted_products(), snippets=search_snippets(listing.items, query),
+                           facets=get_facet_counts(state), filter_options=get_filter_options())
 
 
 @main_bp.route("/products/<int:product_id>")
@@ -85,6 +89,7 @@ def product_page(product_id: int) -> ResponseValue:
         variant.name: [v.value for v in selection_options if v.name == variant.name] for
         variant in selection_options}
 
+    ranking_recorder.record(product_id, 'view')
     user_id: int = current_user.id if current_user.is_authenticated else -1  # -1 is an invalid user ID
     in_wishlist: bool = False
     no_review: bool = True
@@ -125,7 +130,8 @@ def product_page(product_id: int) -> ResponseValue:
                            user_has_purchased=user_has_purchased, no_review=no_review,
                            related_products=related_products, tags=product.tags,
                            variant_names=list(variant_options.keys()), in_wishlist=in_wishlist,
-                           variant_options=variant_options, product_in_comparison=product_in_comparison)
+                           variant_options=variant_options, product_in_comparison=product_in_comparison,
+                           breadcrumbs=get_breadcrumbs(product.category_id))
 
 
 @main_bp.route("/toggle-wishlist", methods=["POST"])
@@ -148,6 +154,8 @@ def toggle_wishlist() -> ResponseValue:
 
     try:
         db.session.commit()
+        if not wishlist_item:
+            ranking_recorder.record(product_id, 'wishlist')
         flash(message, "success")
     except SQLAlchemyError:
         db.session.rollback()
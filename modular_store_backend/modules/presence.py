@@ -0,0 +1,107 @@
+# /modular_store_backend/modules/presence.py
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask import Flask
+from sqlalchemy import bindparam, column, table, update
+
+from modular_store_backend.modules.db.database import db
+
+# Lightweight table construct, models.py imports this module
+users_table = table('users', column('id'), column('last_seen'))
+
+
+class PresenceTracker:
+    """
+    Keeps user activity timestamps in memory and writes them to users.last_seen in bulk.
+    """
+
+    def __init__(self, retention: timedelta = timedelta(days=1)) -> None:
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._last_seen: dict[int, datetime] = {}
+        self._pending: dict[int, datetime] = {}
+
+    def touch(self, user_id: int, timestamp: Optional[datetime] = None) -> None:
+        """
+        Record activity of a user.
+
+        :param user_id: ID of the active user
+        :param timestamp: Time of the activity, defaults to now (UTC)
+        """
+        timestamp = timestamp or datetime.utcnow()
+        with self._lock:
+            self._last_seen[user_id] = timestamp
+            self._pending[user_id] = timestamp
+
+    def last_seen(self, user_id: int) -> Optional[datetime]:
+        """
+        Get the last recorded activity of a user, flushed or not.
+
+        :param user_id: ID of the user
+        :return: Timestamp of the last activity seen by this process, if any
+        """
+        with self._lock:
+            return self._last_seen.get(user_id)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Write pending timestamps to users.last_seen in a single executemany UPDATE.
+
+        :return: Number of users written
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return 0
+
+        statement = (
+            update(users_table)
+            .where(users_table.c.id == bindparam('user_id'))
+            .values(last_seen=bindparam('seen_at'))
+        )
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(statement, [{'user_id': user_id, 'seen_at': seen_at}
+                                               for user_id, seen_at in pending.items()])
+        except Exception:
+            # Keep the timestamps for the next run unless newer ones arrived meanwhile
+            with self._lock:
+                for user_id, seen_at in pending.items():
+                    self._pending.setdefault(user_id, seen_at)
+            raise
+
+        self._prune()
+        return len(pending)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._last_seen.clear()
+            self._pending.clear()
+
+    def _prune(self) -> None:
+        threshold = datetime.utcnow() - self.retention
+        with self._lock:
+            for user_id in [user_id for user_id, seen_at in self._last_seen.items()
+                            if seen_at < threshold and user_id not in self._pending]:
+                del self._last_seen[user_id]
+
+
+presence_tracker = PresenceTracker()
+
+
+def flush_presence(app: Flask) -> None:
+    with app.app_context():
+        try:
+            flushed = presence_tracker.flush()
+            if flushed:
+                logging.info(f"Presence flushed for {flushed} user(s)")
+        except Exception as e:
+            logging.error(f"Error flushing presence: {str(e)}")
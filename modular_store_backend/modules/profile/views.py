@@ -7,6 +7,7 @@ from flask_login import current_user, login_required
 from modular_store_backend.modules.db.database import db
 from modular_store_backend.modules.db.models import Address, Notification, SocialAccount
 from modular_store_backend.modules.decorators import login_required_with_message
+from modular_store_backend.modules.header_context import invalidate_header_context
 from modular_store_backend.modules.oauth_login import oauth
 from modular_store_backend.modules.profile.utils import handle_profile_update
 
@@ -49,6 +50,7 @@ def mark_notification_as_read(notification_id: int) -> ResponseValue:
         return redirect(url_for('profile.profile_info'))
     notification.read = True
     db.session.commit()
+    invalidate_header_context(current_user.id)
     return redirect(url_for('profile.notifications'))
 
 
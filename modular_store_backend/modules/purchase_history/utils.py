@@ -1,12 +1,16 @@
 # /modular_store_backend/modules/purchase_history/utils.py
 import datetime
+import logging
 from typing import List, Optional
 
 from flask_login import current_user
+from sqlalchemy import insert
 from sqlalchemy.orm import scoped_session, Session
 
 from modular_store_backend.modules.db.models import Purchase, PurchaseItem, ShippingAddress, Address, ShippingMethod, Cart
 from modular_store_backend.modules.email import send_email
+from modular_store_backend.modules.rankings import ranking_recorder
+from modular_store_backend.modules.stock import OutOfStockError, reserve_stock
 
 
 def save_purchase_history(
@@ -17,6 +21,13 @@ def save_purchase_history(
         payment_method: str,
         payment_id: str
 ) -> Purchase:
+    """
+    Persist an order in one transaction: the stock of every line, the purchase with its shipping address and
+    its items are written together or not at all. The confirmation email is sent once the order is committed.
+
+    :raises ValueError: Without cart items or with an unknown shipping address
+    :raises OutOfStockError: If a product does not have enough stock, nothing is saved then
+    """
     if not cart_items:
         raise ValueError("No cart items!")
 
@@ -33,41 +44,50 @@ def save_purchase_history(
     if shipping_address is None:
         raise ValueError("Invalid shipping address ID")
 
-    new_purchase = Purchase(
-        user_id=user_id,
-        date=datetime.datetime.now(),
-        total_price=total_price,
-        discount_amount=discount_amount,
-        delivery_fee=delivery_fee,
-        status="Pending",  # changed from completed to pending, only admin may change status to completed
-        tracking_number=tracking_number,
-        shipping_method=shipping_method.name if shipping_method else None,
-        payment_method=payment_method,
-        payment_id=payment_id
-    )
-
-    db_session.add(new_purchase)
-    db_session.flush()
-
-    new_shipping_address = ShippingAddress(
-        purchase_id=new_purchase.id,
-        address_line1=shipping_address.address_line1,
-        address_line2=shipping_address.address_line2,
-        city=shipping_address.city,
-        state=shipping_address.state,
-        zip_code=shipping_address.zip_code,
-        country=shipping_address.country
-    )
-    db_session.add(new_shipping_address)
-    db_session.flush()
-
-    create_purchase_items(db_session=db_session, purchase_id=new_purchase.id, cart_items=cart_items)
-
-    db_session.commit()
-    Purchase.update_stock(new_purchase)
-    send_email(current_user.email,
-               'Order Confirmation',
-               'Thank you for your order! Your order is being processed.')
+    try:
+        # Taken first, so a sold out product fails the order before anything is inserted
+        reservation = reserve_stock([(item.product_id, item.quantity) for item in cart_items], session=db_session)
+        if not reservation.ok:
+            raise OutOfStockError(reservation.failed)
+
+        new_purchase = Purchase(
+            user_id=user_id,
+            date=datetime.datetime.now(),
+            total_price=total_price,
+            discount_amount=discount_amount,
+            delivery_fee=delivery_fee,
+            status="Pending",  # changed from completed to pending, only admin may change status to completed
+            tracking_number=tracking_number,
+            shipping_method=shipping_method.name if shipping_method else None,
+            payment_method=payment_method,
+            payment_id=payment_id,
+            shipping_address=ShippingAddress(
+                address_line1=shipping_address.address_line1,
+                address_line2=shipping_address.address_line2,
+                city=shipping_address.city,
+                state=shipping_address.state,
+                zip_code=shipping_address.zip_code,
+                country=shipping_address.country
+            )
+        )
+        db_session.add(new_purchase)
+        db_session.flush()  # inserts the purchase and its shipping address, assigning the purchase id
+
+        create_purchase_items(db_session=db_session, purchase_id=new_purchase.id, cart_items=cart_items)
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    for item in cart_items:
+        ranking_recorder.record(item.product_id, 'purchase', item.quantity)
+
+    try:
+        send_email(current_user.email,
+                   'Order Confirmation',
+                   'Thank you for your order! Your order is being processed.')
+    except Exception as e:
+        # The order is committed, a mail server failure must not turn it into an error page
+        logging.error(f"Order confirmation email for purchase {new_purchase.id} failed: {str(e)}")
 
     return new_purchase
 
@@ -94,12 +114,8 @@ def create_purchase_items(
         purchase_id: int,
         cart_items: List[Cart]
 ) -> None:
-    for item in cart_items:
-        new_purchase_item = PurchaseItem(
-            purchase_id=purchase_id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            price=item.price
-        )
-        db_session.add(new_purchase_item)
-    db_session.flush()
+    # One multi-row INSERT instead of a unit of work entry per item
+    db_session.execute(insert(PurchaseItem), [
+        {'purchase_id': purchase_id, 'product_id': item.product_id, 'quantity': item.quantity, 'price': item.price}
+        for item in cart_items
+    ])
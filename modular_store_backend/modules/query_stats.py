@@ -0,0 +1,192 @@
+# /modular_store_backend/modules/query_stats.py
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Optional
+
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import RequestLog
+
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Normalize a statement so executions that only differ in their parameters compare equal.
+
+    :param statement: SQL as sent to the driver
+    :return: Statement with whitespace collapsed, literal numbers and expanded IN lists replaced
+    """
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _IN_LIST.sub('(?)', shape)
+    return _NUMBER.sub('N', shape)
+
+
+class RequestQueryStats:
+    """SQL executed while handling one request."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes: Counter[str] = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.total_time += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated_shapes(self, threshold: int) -> dict[str, int]:
+        """
+        Statement shapes run at least `threshold` times, the usual sign of a query per row (N+1).
+        """
+        return {shape: count for shape, count in self.shapes.most_common() if count >= threshold}
+
+
+class SlowQueryLog:
+    """The most recent queries slower than the threshold, kept in memory for the admin page."""
+
+    def __init__(self, max_entries: int = 100) -> None:
+        self._entries: deque[dict[str, Any]] = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def add(self, statement: str, duration: float, endpoint: Optional[str]) -> None:
+        with self._lock:
+            self._entries.appendleft({'statement': statement, 'duration': duration, 'endpoint': endpoint,
+                                      'timestamp': datetime.utcnow()})
+
+    def entries(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class QueryInstrumentation:
+    """
+    Times every statement through engine events and aggregates them per request.
+    """
+
+    def __init__(self) -> None:
+        self.slow_query_threshold = 0.1
+        self.n_plus_one_threshold = 5
+        self.slow_query_log = SlowQueryLog()
+
+    def init_app(self, app: Flask) -> None:
+        if not app.config.get('SQL_INSTRUMENTATION_ENABLED', True):
+            return
+
+        self.slow_query_threshold = app.config.get('SLOW_QUERY_THRESHOLD', 0.1)
+        self.n_plus_one_threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5)
+        self.slow_query_log = SlowQueryLog(app.config.get('SLOW_QUERY_LOG_SIZE', 100))
+
+        # Listening on the Engine class covers the primary and the read-only engines
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+        app.before_request(self.before_request)
+
+    def before_request(self) -> None:
+        g.query_stats = RequestQueryStats()
+
+    def record(self, statement: str, duration: float) -> None:
+        endpoint = None
+        if has_request_context():
+            endpoint = request.endpoint
+            stats: Optional[RequestQueryStats] = g.get('query_stats')
+            if stats is not None:
+                stats.record(statement, duration)
+
+        if duration >= self.slow_query_threshold:
+            self.slow_query_log.add(statement, duration, endpoint)
+            logging.warning(f"Slow query ({duration:.3f} s) on {endpoint}: {_WHITESPACE.sub(' ', statement)}")
+
+    def request_log_fields(self) -> dict[str, Any]:
+        """
+        Query statistics of the current request, as RequestLog column values.
+        """
+        stats: Optional[RequestQueryStats] = g.get('query_stats')
+        if stats is None:
+            return {'query_count': None, 'db_time': None, 'repeated_queries': None}
+
+        repeated = stats.repeated_shapes(self.n_plus_one_threshold)
+        if repeated:
+            logging.warning(f"Possible N+1 queries on {request.endpoint}: "
+                            f"{', '.join(f'{count} x {shape[:120]}' for shape, count in repeated.items())}")
+        return {
+            'query_count': stats.count,
+            'db_time': stats.total_time,
+            'repeated_queries': json.dumps(repeated) if repeated else None,
+        }
+
+
+query_instrumentation = QueryInstrumentation()
+
+
+def _before_cursor_execute(connection: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                           executemany: bool) -> None:
+    connection.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(connection: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                          executemany: bool) -> None:
+    started = connection.info.get('query_start_time')
+    if started:  # empty when the listeners were attached while the statement ran
+        query_instrumentation.record(statement, time.perf_counter() - started.pop())
+
+
+def get_worst_endpoints(since: datetime, limit: int = 20) -> list[dict[str, Any]]:
+    """
+    Rank endpoints by the database time their logged requests spent.
+
+    :param since: Only consider requests logged after this moment
+    :param limit: Number of endpoints to return
+    :return: Per endpoint: requests, total/average DB time, average/max query count and repeated statement shapes
+    """
+    rows = (
+        db.session.query(RequestLog.endpoint,
+                         func.count(RequestLog.id).label('requests'),
+                         func.sum(RequestLog.db_time).label('total_db_time'),
+                         func.avg(RequestLog.db_time).label('avg_db_time'),
+                         func.avg(RequestLog.query_count).label('avg_queries'),
+                         func.max(RequestLog.query_count).label('max_queries'),
+                         func.count(RequestLog.repeated_queries).label('n_plus_one_requests'))
+        .filter(RequestLog.timestamp >= since, RequestLog.query_count.isnot(None))
+        .group_by(RequestLog.endpoint)
+        .order_by(func.sum(RequestLog.db_time).desc())
+        .limit(limit)
+        .all()
+    )
+
+    # Latest repeated shapes per endpoint, to show what the N+1 looks like
+    repeated_queries: dict[str, dict[str, int]] = {}
+    for endpoint, repeated in (
+            db.session.query(RequestLog.endpoint, RequestLog.repeated_queries)
+            .filter(RequestLog.timestamp >= since, RequestLog.repeated_queries.isnot(None),
+                    RequestLog.endpoint.in_([row.endpoint for row in rows]))
+            .order_by(RequestLog.id.desc())
+            .limit(1000)):
+        repeated_queries.setdefault(endpoint, json.loads(repeated))
+
+    return [{
+        'endpoint': row.endpoint,
+        'requests': row.requests,
+        'total_db_time': row.total_db_time or 0.0,
+        'avg_db_time': row.avg_db_time or 0.0,
+        'avg_queries': row.avg_queries or 0.0,
+        'max_queries': row.max_queries or 0,
+        'n_plus_one_requests': row.n_plus_one_requests,
+        'repeated_queries': repeated_queries.get(row.endpoint, {}),
+    } for row in rows]
@@ -0,0 +1,245 @@
+# /modular_store_backend/modules/rankings.py
+"""
+Popularity rankings of the products behind the best selling, most viewed and trending sort options.
+
+Purchases, product page views, wishlist adds and cart adds are counted in memory and folded into three indexed
+scores on the products table every RANKING_FLUSH_INTERVAL seconds: sales_score, view_score and trending_score. Each
+score decays exponentially with its own half-life (RANKING_HALF_LIVES). Rather than decaying every score on every
+run, the scores use forward decay: a signal at time t adds weight * 2 ** ((t - epoch) / half_life). Every score is
+then its decayed sum times the same factor, so the products keep the order of the decayed sums and a fold only
+touches the products that got signals. The factors grow with time, so once the epoch is REBASE_AFTER half-lives
+old it is moved to now and the scores are divided by the factor in between.
+
+Signals of a batch are all dated at the fold, which is off by at most one flush interval. Counts not folded yet
+are lost when the process exits, like presence timestamps.
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Optional
+
+from flask import Flask
+from sqlalchemy import bindparam, func, or_, select, update
+
+from modular_store_backend.modules.catalog_index import mark_products_changed
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Cart, Product, Purchase, PurchaseItem, RankingEpoch, \
+    RecentlyViewedProduct, Wishlist
+
+EPOCH_NAME = 'products'
+
+# Score -> column of products
+SCORE_COLUMNS = {'sales': 'sales_score', 'views': 'view_score', 'trending': 'trending_score'}
+
+# Signal -> weight per unit in each score it counts towards
+SIGNALS: dict[str, dict[str, float]] = {
+    'purchase': {'sales': 1.0, 'trending': 4.0},
+    'view': {'views': 1.0, 'trending': 1.0},
+    'wishlist': {'trending': 2.0},
+    'cart': {'trending': 2.0},
+}
+
+DEFAULT_HALF_LIVES = {'sales': 30.0, 'views': 7.0, 'trending': 2.0}  # in days
+
+# Half-lives of the fastest decaying score the epoch may age before the scores are rebased (2 ** 128 ~ 3e38)
+REBASE_AFTER = 128
+
+
+def half_lives(config: Any) -> dict[str, float]:
+    """
+    :param config: Application config
+    :return: Score mapped to its half-life in seconds
+    """
+    configured = config.get('RANKING_HALF_LIVES') or {}
+    return {score: float(configured.get(score, days)) * 86400 for score, days in DEFAULT_HALF_LIVES.items()}
+
+
+def growth(at: datetime, epoch: datetime, half_life: float) -> float:
+    """:return: Weight of a signal at `at` relative to one at the epoch"""
+    return 2 ** ((at - epoch).total_seconds() / half_life)
+
+
+class RankingRecorder:
+    """
+    Counts popularity signals in memory until they are folded into the scores.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[int, str], float] = {}
+
+    def record(self, product_id: int, signal: str, amount: float = 1) -> None:
+        """
+        Count a signal for a product.
+
+        :param product_id: ID of the product
+        :param signal: 'purchase', 'view', 'wishlist' or 'cart'
+        :param amount: Units of the signal, e.g. the quantity purchased
+        """
+        if signal not in SIGNALS:
+            raise ValueError(f"Unknown ranking signal: {signal}")
+        with self._lock:
+            self._pending[(product_id, signal)] = self._pending.get((product_id, signal), 0) + amount
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def take(self) -> dict[tuple[int, str], float]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending: dict[tuple[int, str], float]) -> None:
+        """Put back counts whose fold failed, for the next run."""
+        with self._lock:
+            for key, amount in pending.items():
+                self._pending[key] = self._pending.get(key, 0) + amount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+
+
+ranking_recorder = RankingRecorder()
+
+
+def score_increments(signals: dict[tuple[int, str], float], at: datetime, epoch: datetime,
+                     lives: dict[str, float]) -> dict[int, dict[str, float]]:
+    """
+    :param signals: (product ID, signal) mapped to its units
+    :param at: Time the signals are dated at
+    :param epoch: Time origin of the scores
+    :param lives: Score mapped to its half-life in seconds
+    :return: Product ID mapped to the amount to add to each of its scores
+    """
+    factors = {score: growth(at, epoch, half_life) for score, half_life in lives.items()}
+    increments: dict[int, dict[str, float]] = {}
+    for (product_id, signal), amount in signals.items():
+        scores = increments.setdefault(product_id, dict.fromkeys(SCORE_COLUMNS, 0.0))
+        for score, weight in SIGNALS[signal].items():
+            scores[score] += weight * amount * factors[score]
+    return increments
+
+
+def _add_scores(increments: dict[int, dict[str, float]]) -> None:
+    if not increments:
+        return
+    products = Product.__table__  # a Core executemany, not an ORM bulk update by primary key
+    statement = (
+        update(products)
+        .where(products.c.id == bindparam('product_id'))
+        .values({column: products.c[column] + bindparam(score) for score, column in SCORE_COLUMNS.items()})
+    )
+    db.session.execute(statement, [{'product_id': product_id, **scores} for product_id, scores in increments.items()])
+
+
+def _rebase(epoch: RankingEpoch, now: datetime, lives: dict[str, float]) -> None:
+    """Move the epoch to now, dividing the scores by the growth in between so their order stays the same."""
+    scored = or_(*(getattr(Product, column) > 0 for column in SCORE_COLUMNS.values()))
+    mark_products_changed(db.session, db.session.scalars(select(Product.id).where(scored)).all())
+    db.session.execute(
+        update(Product).where(scored)
+        .values({column: getattr(Product, column) / growth(now, epoch.epoch, lives[score])
+                 for score, column in SCORE_COLUMNS.items()})
+        .execution_options(synchronize_session=False))
+    epoch.epoch = now
+
+
+def fold_rankings(lives: dict[str, float], now: Optional[datetime] = None) -> int:
+    """
+    Add the signals counted since the last fold to the scores, in one transaction.
+
+    :param lives: Score mapped to its half-life in seconds
+    :param now: Time the signals are dated at, datetime.utcnow() by default
+    :return: Number of products whose scores changed
+    """
+    now = now or datetime.utcnow()
+    pending = ranking_recorder.take()
+    if not pending:
+        return 0
+    try:
+        epoch: Optional[RankingEpoch] = db.session.get(RankingEpoch, EPOCH_NAME)
+        if epoch is None:
+            # First fold on this database: start from its history, which already holds the purchases, wishlist and
+            # cart rows and the views of logged-in users of this batch. Adding the batch would count them twice, so
+            # it is dropped, and with it the anonymous views of one flush interval
+            return rebuild_rankings(lives, now)
+        if (now - epoch.epoch).total_seconds() > REBASE_AFTER * min(lives.values()):
+            _rebase(epoch, now, lives)
+
+        increments = score_increments(pending, now, epoch.epoch, lives)
+        _add_scores(increments)
+        mark_products_changed(db.session, increments)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        ranking_recorder.restore(pending)
+        raise
+    return len(increments)
+
+
+def read_signal_history(connection: Any, now: datetime) -> list[tuple[int, str, float, datetime]]:
+    """
+    :param connection: Connection or session to read with
+    :param now: Time to date wishlist and cart rows at, which store none
+    :return: (product ID, signal, units, time) of the purchases, recent views, wishlists and carts in the database
+    """
+    history: list[tuple[int, str, float, datetime]] = []
+    for product_id, quantity, date in connection.execute(
+            select(PurchaseItem.product_id, PurchaseItem.quantity, Purchase.date)
+            .join(Purchase, Purchase.id == PurchaseItem.purchase_id)):
+        history.append((product_id, 'purchase', quantity, date or now))
+    for product_id, timestamp in connection.execute(
+            select(RecentlyViewedProduct.product_id, RecentlyViewedProduct.timestamp)):
+        history.append((product_id, 'view', 1, timestamp or now))
+    for product_id, count in connection.execute(
+            select(Wishlist.product_id, func.count()).group_by(Wishlist.product_id)):
+        history.append((product_id, 'wishlist', count, now))
+    for product_id, quantity in connection.execute(
+            select(Cart.product_id, func.sum(Cart.quantity)).group_by(Cart.product_id)):
+        history.append((product_id, 'cart', quantity, now))
+    return history
+
+
+def rebuild_rankings(lives: dict[str, float], now: Optional[datetime] = None) -> int:
+    """
+    Recompute every score from the purchases, recently viewed products, wishlists and carts stored in the database,
+    with a new epoch. Views of visitors who were not logged in are only known to the counts folded so far.
+
+    :param lives: Score mapped to its half-life in seconds
+    :param now: New epoch, datetime.utcnow() by default
+    :return: Number of products with a score
+    """
+    now = now or datetime.utcnow()
+    increments: dict[int, dict[str, float]] = {}
+    for product_id, signal, amount, at in read_signal_history(db.session, now):
+        scores = increments.setdefault(product_id, dict.fromkeys(SCORE_COLUMNS, 0.0))
+        for score, weight in SIGNALS[signal].items():
+            scores[score] += weight * amount * growth(at, now, lives[score])
+
+    scored = or_(*(getattr(Product, column) > 0 for column in SCORE_COLUMNS.values()))
+    mark_products_changed(db.session, db.session.scalars(select(Product.id).where(scored)).all())
+    db.session.execute(update(Product).where(scored).values(dict.fromkeys(SCORE_COLUMNS.values(), 0.0))
+                       .execution_options(synchronize_session=False))
+    _add_scores(increments)
+    mark_products_changed(db.session, increments)
+    epoch: Optional[RankingEpoch] = db.session.get(RankingEpoch, EPOCH_NAME)
+    if epoch is None:
+        db.session.add(RankingEpoch(name=EPOCH_NAME, epoch=now))
+    else:
+        epoch.epoch = now
+    db.session.commit()
+    return len(increments)
+
+
+def flush_rankings(app: Flask) -> None:
+    with app.app_context():
+        try:
+            folded = fold_rankings(half_lives(app.config))
+            if folded:
+                logging.info(f"Ranking scores updated for {folded} product(s)")
+        except Exception as e:
+            logging.error(f"Error folding ranking signals: {str(e)}")
+        finally:
+            db.session.remove()
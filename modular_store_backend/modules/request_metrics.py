@@ -0,0 +1,209 @@
+# /modular_store_backend/modules/request_metrics.py
+import json
+import logging
+import threading
+from bisect import bisect_left
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from flask import Flask
+from sqlalchemy import func
+
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import RequestLog, RequestMetricRollup, RollupWatermark
+
+WATERMARK_NAME = 'request_metrics'
+
+# Upper bounds (in seconds) of the latency histogram buckets, the last bucket collects everything slower
+LATENCY_BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+GRANULARITIES: dict[str, Callable[[datetime], datetime]] = {
+    'minute': lambda timestamp: timestamp.replace(second=0, microsecond=0),
+    'hour': lambda timestamp: timestamp.replace(minute=0, second=0, microsecond=0),
+}
+
+_rollup_lock = threading.Lock()
+
+RollupKey = tuple[str, datetime, str, str, int]
+
+
+def histogram_index(execution_time: float) -> int:
+    return bisect_left(LATENCY_BUCKETS, execution_time)
+
+
+def histogram_percentile(histogram: list[int], percentile: float, max_value: float = 0.0) -> float:
+    """
+    Estimate a percentile from a latency histogram, interpolating linearly inside the bucket.
+
+    :param histogram: Counts per LATENCY_BUCKETS bucket, plus the overflow bucket
+    :param percentile: Percentile to estimate, 0 - 100
+    :param max_value: Largest observed value, used as the upper bound of the overflow bucket
+    :return: Estimated latency in seconds
+    """
+    total = sum(histogram)
+    if total == 0:
+        return 0.0
+
+    rank = total * percentile / 100.0
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count and cumulative + count >= rank:
+            lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+            upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else max(max_value, lower)
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+    return max_value
+
+
+def update_request_metric_rollups(batch_size: int = 10000, max_batches: Optional[int] = None) -> int:
+    """
+    Fold request logs written since the last run into the rollup buckets.
+
+    :param batch_size: Number of request logs folded per transaction
+    :param max_batches: Stop after this many transactions, None folds the whole backlog
+    :return: Number of request logs folded
+    """
+    processed = 0
+    batches = 0
+    with _rollup_lock:
+        while (max_batches is None or batches < max_batches) and (folded := _rollup_batch(batch_size)):
+            processed += folded
+            batches += 1
+    return processed
+
+
+def _rollup_batch(batch_size: int) -> int:
+    watermark: Optional[RollupWatermark] = db.session.get(RollupWatermark, WATERMARK_NAME)
+    last_id = watermark.last_id if watermark else 0
+
+    rows = (
+        db.session.query(RequestLog.id, RequestLog.timestamp, RequestLog.endpoint, RequestLog.method,
+                         RequestLog.status_code, RequestLog.execution_time)
+        .filter(RequestLog.id > last_id)
+        .order_by(RequestLog.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not rows:
+        db.session.rollback()
+        return 0
+
+    # Claim the id range first, a concurrent run (another worker) then fails the guarded update
+    new_last_id = rows[-1].id
+    if watermark is None:
+        db.session.add(RollupWatermark(name=WATERMARK_NAME, last_id=new_last_id))
+    else:
+        claimed = (
+            db.session.query(RollupWatermark)
+            .filter_by(name=WATERMARK_NAME, last_id=last_id)
+            .update({'last_id': new_last_id}, synchronize_session=False)
+        )
+        if claimed != 1:
+            db.session.rollback()
+            return 0
+
+    aggregates: dict[RollupKey, dict[str, Any]] = {}
+    for row in rows:
+        if row.timestamp is None:
+            continue
+        for granularity, truncate in GRANULARITIES.items():
+            key = (granularity, truncate(row.timestamp), row.endpoint, row.method, row.status_code)
+            bucket = aggregates.setdefault(key, {'count': 0, 'total': 0.0, 'max': 0.0,
+                                                 'histogram': [0] * (len(LATENCY_BUCKETS) + 1)})
+            bucket['count'] += 1
+            bucket['total'] += row.execution_time
+            bucket['max'] = max(bucket['max'], row.execution_time)
+            bucket['histogram'][histogram_index(row.execution_time)] += 1
+
+    _merge_into_rollups(aggregates)
+    db.session.commit()
+    return len(rows)
+
+
+def _merge_into_rollups(aggregates: dict[RollupKey, dict[str, Any]]) -> None:
+    existing: dict[RollupKey, RequestMetricRollup] = {}
+    for granularity in GRANULARITIES:
+        bucket_starts = {key[1] for key in aggregates if key[0] == granularity}
+        if not bucket_starts:
+            continue
+        for rollup in (db.session.query(RequestMetricRollup)
+                       .filter(RequestMetricRollup.granularity == granularity,
+                               RequestMetricRollup.bucket_start.in_(bucket_starts))):
+            existing[(rollup.granularity, rollup.bucket_start, rollup.endpoint, rollup.method,
+                      rollup.status_code)] = rollup
+
+    for key, bucket in aggregates.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            granularity, bucket_start, endpoint, method, status_code = key
+            db.session.add(RequestMetricRollup(
+                granularity=granularity,
+                bucket_start=bucket_start,
+                endpoint=endpoint,
+                method=method,
+                status_code=status_code,
+                request_count=bucket['count'],
+                total_execution_time=bucket['total'],
+                max_execution_time=bucket['max'],
+                latency_histogram=json.dumps(bucket['histogram'])
+            ))
+            continue
+
+        histogram = json.loads(rollup.latency_histogram)
+        rollup.request_count += bucket['count']
+        rollup.total_execution_time += bucket['total']
+        rollup.max_execution_time = max(rollup.max_execution_time, bucket['max'])
+        rollup.latency_histogram = json.dumps([a + b for a, b in zip(histogram, bucket['histogram'])])
+
+
+def get_request_metrics(start: datetime, end: datetime, granularity: str = 'hour') -> dict[str, Any]:
+    """
+    Summarize request metrics between two timestamps from the rollup buckets.
+
+    :param start: Start of the range (inclusive)
+    :param end: End of the range (inclusive)
+    :param granularity: Bucket size to read, 'minute' or 'hour'
+    :return: Total requests, average execution time, status code counts and latency percentiles
+    """
+    in_range = db.session.query(RequestMetricRollup).filter(
+        RequestMetricRollup.granularity == granularity,
+        RequestMetricRollup.bucket_start >= start,
+        RequestMetricRollup.bucket_start <= end
+    )
+
+    status_code_counts = dict(
+        (row[0], int(row[1])) for row in in_range.with_entities(
+            RequestMetricRollup.status_code, func.sum(RequestMetricRollup.request_count)
+        ).group_by(RequestMetricRollup.status_code)
+    )
+    total_requests = sum(status_code_counts.values())
+
+    total_time = 0.0
+    max_time = 0.0
+    histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+    for row in in_range.with_entities(RequestMetricRollup.total_execution_time,
+                                      RequestMetricRollup.max_execution_time,
+                                      RequestMetricRollup.latency_histogram):
+        total_time += row.total_execution_time
+        max_time = max(max_time, row.max_execution_time)
+        histogram = [a + b for a, b in zip(histogram, json.loads(row.latency_histogram))]
+
+    return {
+        'total_requests': total_requests,
+        'average_execution_time': total_time / total_requests if total_requests else 0.0,
+        'status_code_counts': status_code_counts,
+        'percentiles': {p: histogram_percentile(histogram, p, max_time) for p in (50, 95, 99)},
+    }
+
+
+def rollup_request_metrics(app: Flask) -> None:
+    with app.app_context():
+        try:
+            folded = update_request_metric_rollups(app.config.get('REQUEST_METRICS_ROLLUP_BATCH_SIZE', 10000))
+            if folded:
+                logging.info(f"Request metrics rollup folded {folded} request log(s)")
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error rolling up request metrics: {str(e)}")
+        finally:
+            db.session.remove()
@@ -0,0 +1,379 @@
+# /modular_store_backend/modules/retention.py
+"""
+Retention policies for the tables that grow with traffic: request logs, recently viewed products, notifications
+and comparison history.
+
+Expired rows are deleted in short batches, each its own transaction, so the write lock is never held for long.
+Before a batch is deleted it can be copied to a compressed JSON Lines file or to a cold-storage SQLite file.
+Afterwards an incremental vacuum returns the freed pages to the file system.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterator, Optional, Protocol
+
+from flask import Flask
+from sqlalchemy import ColumnElement, Table, create_engine, delete, func, insert, select, text
+from sqlalchemy.engine import Engine
+
+from modular_store_backend.modules.db.backup import open_compressed, resolve_compression
+from modular_store_backend.modules.db.database import Base, db
+from modular_store_backend.modules.db.models import ComparisonHistory, Notification, RecentlyViewedProduct, \
+    RequestLog, RollupWatermark
+from modular_store_backend.modules.db.sqlite_tuning import is_sqlite
+from modular_store_backend.modules.header_context import invalidate_header_contexts
+from modular_store_backend.modules.request_metrics import WATERMARK_NAME
+
+ARCHIVE_MODES = ('file', 'sqlite')
+ARCHIVE_SUFFIXES = {'zstd': '.jsonl.zst', 'gzip': '.jsonl.gz', 'none': '.jsonl'}
+AUTO_VACUUM_INCREMENTAL = 2
+
+_retention_lock = threading.Lock()
+
+
+def _rolled_up_request_logs() -> ColumnElement[bool]:
+    # Logs not folded into the request metric rollups yet are kept, the analytics would lose them otherwise
+    last_id = db.session.query(RollupWatermark.last_id).filter_by(name=WATERMARK_NAME).scalar()
+    return RequestLog.id <= (last_id or 0)
+
+
+class RetentionTable:
+    """A table retention policies apply to: the column rows age by and the user they belong to."""
+
+    def __init__(self, model: type[Base], timestamp_column: Any, user_column: Any,
+                 guard: Optional[Callable[[], ColumnElement[bool]]] = None,
+                 on_delete: Optional[Callable[[set[int]], None]] = None) -> None:
+        self.model = model
+        self.timestamp_column = timestamp_column
+        self.user_column = user_column
+        self.guard = guard  # rows outside it are never expired
+        self.on_delete = on_delete  # called with the users of each deleted batch once it committed
+
+    @property
+    def table(self) -> Table:
+        return self.model.__table__  # type: ignore[return-value]
+
+
+RETENTION_TABLES: dict[str, RetentionTable] = {
+    'request_logs': RetentionTable(RequestLog, RequestLog.timestamp, RequestLog.user_id,
+                                   guard=_rolled_up_request_logs),
+    'recently_viewed_products': RetentionTable(RecentlyViewedProduct, RecentlyViewedProduct.timestamp,
+                                               RecentlyViewedProduct.user_id),
+    'notifications': RetentionTable(Notification, Notification.created_at, Notification.user_id,
+                                    on_delete=invalidate_header_contexts),  # unread count of the header
+    'comparison_history': RetentionTable(ComparisonHistory, ComparisonHistory.timestamp, ComparisonHistory.user_id),
+}
+
+
+class RetentionPolicy:
+    """How long rows of a table are kept and where expired rows go."""
+
+    def __init__(self, max_age_days: Optional[float] = None, max_rows_per_user: Optional[int] = None,
+                 archive: Optional[str] = None) -> None:
+        if archive is not None and archive not in ARCHIVE_MODES:
+            raise ValueError(f"Unknown retention archive mode {archive!r}, use one of {', '.join(ARCHIVE_MODES)}")
+        self.max_age_days = max_age_days
+        self.max_rows_per_user = max_rows_per_user
+        self.archive = archive
+
+
+def policies_from_config(config: dict[str, Any]) -> dict[str, RetentionPolicy]:
+    """
+    :param config: Flask app config
+    :return: The RETENTION_POLICIES entries, by table name
+    """
+    policies = {}
+    for table_name, values in (config.get('RETENTION_POLICIES') or {}).items():
+        if table_name not in RETENTION_TABLES:
+            raise ValueError(f"No retention support for table {table_name!r}")
+        policies[table_name] = RetentionPolicy(**(values or {}))
+    return policies
+
+
+def expired_condition(table: RetentionTable, policy: RetentionPolicy, now: datetime) -> Optional[ColumnElement[bool]]:
+    """
+    :return: Condition matching the rows the policy expires by age, None if it sets no max_age_days
+    """
+    if policy.max_age_days is None:
+        return None
+    condition = table.timestamp_column < now - timedelta(days=policy.max_age_days)
+    return condition & table.guard() if table.guard else condition
+
+
+def over_limit_ids(table: RetentionTable, policy: RetentionPolicy) -> list[int]:
+    """
+    :return: IDs of the rows beyond the newest max_rows_per_user of their user, in ascending order
+    """
+    if policy.max_rows_per_user is None:
+        return []
+    model_id = table.model.id  # type: ignore[attr-defined]
+    ranked = select(
+        model_id.label('id'),
+        func.row_number().over(partition_by=table.user_column,
+                               order_by=(table.timestamp_column.desc(), model_id.desc())).label('position')
+    ).subquery()
+    query = select(model_id).where(model_id.in_(select(ranked.c.id).where(ranked.c.position > policy.max_rows_per_user)))
+    if table.guard:
+        query = query.where(table.guard())
+    return list(db.session.scalars(query.order_by(model_id)))
+
+
+def _expired_batches(table: RetentionTable, policy: RetentionPolicy, now: datetime,
+                     batch_size: int) -> Iterator[list[int]]:
+    model_id = table.model.id  # type: ignore[attr-defined]
+    condition = expired_condition(table, policy, now)
+    if condition is not None:
+        last_id = 0
+        while ids := db.session.scalars(
+                select(model_id).where(condition, model_id > last_id).order_by(model_id).limit(batch_size)).all():
+            yield list(ids)
+            last_id = ids[-1]
+            if len(ids) < batch_size:
+                break
+    # The rows expired by age rank last within their user, so ranking what is left keeps the same newest rows. The
+    # window runs over the whole table, once per run: the IDs it finds are deleted in slices
+    ids = over_limit_ids(table, policy)
+    for start in range(0, len(ids), batch_size):
+        yield ids[start:start + batch_size]
+
+
+class RowArchive(Protocol):
+    def write(self, rows: list[dict[str, Any]]) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class FileArchive:
+    """Expired rows appended to a compressed JSON Lines file, one file per table and run."""
+
+    def __init__(self, archive_dir: str, table_name: str, compression: str, now: datetime) -> None:
+        directory = os.path.join(archive_dir, table_name)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{table_name}_{now:%Y%m%d_%H%M%S}{ARCHIVE_SUFFIXES[compression]}")
+        self.file = open_compressed(self.path, 'wb', compression)
+
+    def write(self, rows: list[dict[str, Any]]) -> None:
+        self.file.write(''.join(f"{json.dumps(row, default=str)}\n" for row in rows).encode())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class SqliteArchive:
+    """Expired rows copied into the same table of a cold-storage SQLite file."""
+
+    def __init__(self, path: str, table: Table) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.table = table
+        self.engine: Engine = create_engine(f'sqlite:///{path}')
+        table.create(self.engine, checkfirst=True)
+
+    def write(self, rows: list[dict[str, Any]]) -> None:
+        # A batch archived by a run that failed before deleting it is archived again, keep one copy
+        with self.engine.begin() as connection:
+            connection.execute(insert(self.table).prefix_with('OR IGNORE'), rows)
+
+    def close(self) -> None:
+        self.engine.dispose()
+
+
+class TableReport:
+    def __init__(self, table_name: str) -> None:
+        self.table_name = table_name
+        self.deleted = 0
+        self.archived = 0
+        self.batches = 0
+        self.archive_path: Optional[str] = None
+        self.duration = 0.0
+
+    def summary(self) -> str:
+        archived = f", {self.archived} archived to {self.archive_path}" if self.archive_path else ''
+        return f"{self.table_name}: {self.deleted} deleted in {self.batches} batch(es){archived}"
+
+
+class RetentionReport:
+    def __init__(self) -> None:
+        self.tables: list[TableReport] = []
+        self.vacuum = 'skipped'  # 'incremental', 'disabled' (auto_vacuum is not INCREMENTAL) or 'skipped'
+        self.freed_pages = 0
+        self.reclaimed_bytes = 0
+        self.free_pages_left = 0
+        self.duration = 0.0
+
+    @property
+    def deleted(self) -> int:
+        return sum(table.deleted for table in self.tables)
+
+    def summary(self) -> str:
+        tables = '; '.join(table.summary() for table in self.tables)
+        vacuum = (f"incremental vacuum reclaimed {self.reclaimed_bytes / 1024:.0f} KiB ({self.freed_pages} pages)"
+                  if self.vacuum == 'incremental' else
+                  f"vacuum {self.vacuum}, {self.free_pages_left} free pages left in the file")
+        return f"{self.deleted} rows deleted ({tables}), {vacuum}, {self.duration:.2f} s"
+
+
+def _open_archive(table_name: str, policy: RetentionPolicy, archive_dir: str, cold_storage_path: str,
+                  compression: str, now: datetime) -> tuple[RowArchive, str]:
+    if policy.archive == 'file':
+        file_archive = FileArchive(archive_dir, table_name, compression, now)
+        return file_archive, file_archive.path
+    return SqliteArchive(cold_storage_path, RETENTION_TABLES[table_name].table), cold_storage_path
+
+
+def apply_retention_policy(table_name: str, policy: RetentionPolicy, batch_size: int = 1000,
+                           batch_sleep: float = 0.05, archive_dir: str = '', cold_storage_path: str = '',
+                           compression: str = 'gzip', now: Optional[datetime] = None) -> TableReport:
+    """
+    Delete the rows of a table a policy expires, `batch_size` rows per transaction.
+
+    :param table_name: Key of RETENTION_TABLES
+    :param policy: Policy to apply
+    :param batch_size: Rows deleted per transaction
+    :param batch_sleep: Seconds to yield to other writers between batches
+    :param archive_dir: Directory of the JSON Lines archives (archive mode 'file')
+    :param cold_storage_path: Cold-storage SQLite file (archive mode 'sqlite')
+    :param compression: Compression of the JSON Lines archives, 'zstd', 'gzip' or 'none'
+    :param now: Time rows age against
+    :return: Rows deleted and archived
+    """
+    started = time.perf_counter()
+    table = RETENTION_TABLES[table_name]
+    now = now or datetime.utcnow()
+    report = TableReport(table_name)
+
+    model_id = table.model.id  # type: ignore[attr-defined]
+    archive: Optional[RowArchive] = None
+    try:
+        for ids in _expired_batches(table, policy, now, batch_size):
+            if report.batches:
+                time.sleep(batch_sleep)
+            if policy.archive:
+                if archive is None:
+                    archive, report.archive_path = _open_archive(table_name, policy, archive_dir, cold_storage_path,
+                                                                 compression, now)
+                rows = [dict(row) for row in db.session.execute(
+                    select(table.table).where(model_id.in_(ids)).order_by(model_id)).mappings()]
+                archive.write(rows)
+                report.archived += len(rows)
+            user_ids = set(db.session.scalars(select(table.user_column).where(model_id.in_(ids)).distinct())) \
+                if table.on_delete else set()
+            report.deleted += db.session.execute(
+                delete(table.model).where(model_id.in_(ids)).execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            report.batches += 1
+            if table.on_delete and user_ids:
+                table.on_delete(user_ids)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if archive is not None:
+            archive.close()
+    report.duration = time.perf_counter() - started
+    return report
+
+
+def sqlite_page_stats(engine: Engine) -> dict[str, int]:
+    with engine.connect() as connection:
+        return {name: connection.execute(text(f"PRAGMA {name}")).scalar() or 0
+                for name in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum')}
+
+
+def reclaim_free_pages(engine: Engine, report: RetentionReport, pages_per_step: int = 1000,
+                       step_sleep: float = 0.05) -> None:
+    """
+    Return free pages to the file system with PRAGMA incremental_vacuum, `pages_per_step` pages per transaction.
+
+    Needs auto_vacuum=INCREMENTAL, which an existing database only gets through enable_incremental_vacuum.
+
+    :param engine: SQLite engine
+    :param report: Report to record the reclaimed pages in
+    :param pages_per_step: Pages freed per transaction
+    :param step_sleep: Seconds to yield to other writers between steps
+    """
+    stats = sqlite_page_stats(engine)
+    free_pages = stats['freelist_count']
+    if stats['auto_vacuum'] != AUTO_VACUUM_INCREMENTAL:
+        report.vacuum, report.free_pages_left = 'disabled', free_pages
+        return
+
+    report.vacuum = 'incremental'
+    with engine.connect() as connection:
+        while free_pages:
+            connection.exec_driver_sql(f"PRAGMA incremental_vacuum({int(pages_per_step)})")
+            connection.commit()
+            remaining = connection.execute(text("PRAGMA freelist_count")).scalar() or 0
+            report.freed_pages += free_pages - remaining
+            if remaining >= free_pages:
+                break
+            free_pages = remaining
+            time.sleep(step_sleep)
+    report.free_pages_left = free_pages
+    report.reclaimed_bytes = report.freed_pages * stats['page_size']
+
+
+def enable_incremental_vacuum(engine: Engine) -> None:
+    """
+    Switch a database to auto_vacuum=INCREMENTAL. The full VACUUM this takes rewrites the whole file and blocks
+    writers meanwhile, so run it in a maintenance window.
+
+    :param engine: SQLite engine
+    """
+    with engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.exec_driver_sql("VACUUM")
+
+
+def apply_retention_policies(policies: dict[str, RetentionPolicy], batch_size: int = 1000,
+                             batch_sleep: float = 0.05, archive_dir: str = '', cold_storage_path: str = '',
+                             compression: str = 'gzip', vacuum_pages_per_step: int = 1000,
+                             now: Optional[datetime] = None) -> RetentionReport:
+    """
+    Apply the retention policies of every table, then vacuum the freed pages.
+
+    :return: Rows deleted per table and the pages reclaimed
+    """
+    started = time.perf_counter()
+    report = RetentionReport()
+    if any(policy.archive == 'file' for policy in policies.values()):
+        compression = resolve_compression(compression)
+    with _retention_lock:
+        for table_name, policy in policies.items():
+            report.tables.append(apply_retention_policy(table_name, policy, batch_size, batch_sleep, archive_dir,
+                                                        cold_storage_path, compression, now))
+        if is_sqlite(db.engine) and report.deleted:
+            reclaim_free_pages(db.engine, report, vacuum_pages_per_step, batch_sleep)
+    report.duration = time.perf_counter() - started
+    return report
+
+
+def run_retention(app: Flask) -> Optional[RetentionReport]:
+    """
+    Scheduled job: apply the RETENTION_POLICIES of the config.
+
+    :param app: Flask application instance
+    :return: The report of the run, None if it failed with an error
+    """
+    with app.app_context():
+        try:
+            report = apply_retention_policies(
+                policies_from_config(app.config),
+                batch_size=app.config.get('RETENTION_BATCH_SIZE', 1000),
+                batch_sleep=app.config.get('RETENTION_BATCH_SLEEP', 0.05),
+                archive_dir=app.config.get('RETENTION_ARCHIVE_DIR', ''),
+                cold_storage_path=app.config.get('RETENTION_COLD_STORAGE_PATH', ''),
+                compression=app.config.get('BACKUP_COMPRESSION', 'zstd'),
+                vacuum_pages_per_step=app.config.get('RETENTION_VACUUM_PAGES_PER_STEP', 1000),
+            )
+            logging.info(f"Retention: {report.summary()}")
+            return report
+        except Exception as e:
+            logging.error(f"Error applying retention policies: {str(e)}")
+            return None
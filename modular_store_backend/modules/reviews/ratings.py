@@ -0,0 +1,146 @@
+# /modular_store_backend/modules/reviews/ratings.py
+from typing import Any, Optional
+
+from sqlalchemy import case, event, func, update
+from sqlalchemy.orm import Session, attributes
+
+from modular_store_backend.modules.catalog_index import mark_products_changed
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Product, Review
+
+RATING_COLUMNS = ['review_count', 'rating_sum', 'rating_avg']
+
+
+def _history_values(review: Review, key: str) -> tuple[Any, Any]:
+    """Value of an attribute before and after the pending change."""
+    added, unchanged, deleted = attributes.get_history(review, key)
+    new = added[0] if added else (unchanged[0] if unchanged else None)
+    old = deleted[0] if deleted else (unchanged[0] if unchanged else new)
+    return old, new
+
+
+PENDING_DELTAS_KEY = 'pending_rating_deltas'
+
+RatingDeltas = dict[int, list[int]]  # product ID -> [review count delta, rating sum delta]
+
+
+def _add_delta(deltas: RatingDeltas, product_id: int, count_delta: int, rating_delta: int) -> None:
+    delta = deltas.setdefault(product_id, [0, 0])
+    delta[0] += count_delta
+    delta[1] += rating_delta
+
+
+def collect_deleted_deltas(session: Session) -> RatingDeltas:
+    """
+    Rating changes caused by the reviews deleted in the coming flush, collected before their rows are gone.
+
+    :param session: Session in its pre-flush state
+    :return: Product ID mapped to [review count delta, rating sum delta]
+    """
+    deltas: RatingDeltas = {}
+    for review in session.deleted:
+        if isinstance(review, Review):
+            product_id, _ = _history_values(review, 'product_id')
+            rating, _ = _history_values(review, 'rating')
+            _add_delta(deltas, product_id, -1, -rating)
+    return deltas
+
+
+def collect_rating_deltas(session: Session, deltas: Optional[RatingDeltas] = None) -> RatingDeltas:
+    """
+    Rating changes caused by the reviews added or edited in a flush.
+
+    :param session: Session whose new and dirty sets still reflect the flush
+    :param deltas: Deltas collected earlier in the flush (deleted reviews), added to
+    :return: Product ID mapped to [review count delta, rating sum delta], without zero deltas
+    """
+    deltas = dict(deltas or {})
+
+    for review in session.new:
+        if isinstance(review, Review) and review.product_id is not None:
+            _add_delta(deltas, review.product_id, 1, review.rating)
+
+    for review in session.dirty:
+        if not isinstance(review, Review) or not session.is_modified(review):
+            continue
+        old_product_id, new_product_id = _history_values(review, 'product_id')
+        old_rating, new_rating = _history_values(review, 'rating')
+        if old_product_id == new_product_id and old_rating == new_rating:
+            continue
+        _add_delta(deltas, old_product_id, -1, -old_rating)
+        _add_delta(deltas, new_product_id, 1, new_rating)
+
+    return {product_id: delta for product_id, delta in deltas.items() if delta != [0, 0]}
+
+
+def apply_rating_delta(session: Session, product_id: int, count_delta: int, rating_delta: int) -> None:
+    """
+    Shift the rating aggregates of a product in the current transaction.
+
+    :param session: Session whose transaction the update joins
+    :param product_id: ID of the product
+    :param count_delta: Reviews added (positive) or removed (negative)
+    :param rating_delta: Ratings added or removed
+    """
+    new_count = Product.review_count + count_delta
+    new_sum = Product.rating_sum + rating_delta
+    session.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(review_count=new_count,
+                rating_sum=new_sum,
+                rating_avg=case((new_count > 0, new_sum * 1.0 / new_count), else_=0.0))
+        .execution_options(synchronize_session=False)
+    )
+    mark_products_changed(session, [product_id])
+
+    product: Optional[Product] = session.identity_map.get(session.identity_key(Product, product_id))
+    if product is not None:
+        session.expire(product, RATING_COLUMNS)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_deleted_reviews(session: Session, flush_context: Any, instances: Any) -> None:
+    session.info[PENDING_DELTAS_KEY] = collect_deleted_deltas(session)
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_rating_aggregates(session: Session, flush_context: Any) -> None:
+    # after_flush still sees the pre-flush new/dirty sets and attribute history, new reviews have their
+    # product_id set by now and products inserted in the same flush already exist
+    deltas = collect_rating_deltas(session, session.info.pop(PENDING_DELTAS_KEY, None))
+    for product_id, (count_delta, rating_delta) in deltas.items():
+        apply_rating_delta(session, product_id, count_delta, rating_delta)
+
+
+def recalculate_rating_aggregates() -> int:
+    """
+    Recompute the rating aggregates of every product from its reviews, e.g. after bulk deletes that bypass the ORM.
+
+    :return: Number of products whose aggregates were out of sync
+    """
+    actual = {
+        row.product_id: (row.review_count, row.rating_sum)
+        for row in db.session.query(Review.product_id,
+                                    func.count(Review.id).label('review_count'),
+                                    func.sum(Review.rating).label('rating_sum'))
+        .group_by(Review.product_id)
+    }
+
+    repaired = 0
+    for product_id, review_count, rating_sum, rating_avg in db.session.query(
+            Product.id, Product.review_count, Product.rating_sum, Product.rating_avg):
+        expected_count, expected_sum = actual.get(product_id, (0, 0))
+        expected_avg = expected_sum / expected_count if expected_count else 0.0
+        if (review_count, rating_sum) == (expected_count, expected_sum) and rating_avg == expected_avg:
+            continue
+        db.session.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(review_count=expected_count, rating_sum=expected_sum, rating_avg=expected_avg)
+            .execution_options(synchronize_session=False)
+        )
+        repaired += 1
+
+    db.session.commit()
+    return repaired
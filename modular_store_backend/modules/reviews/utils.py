@@ -9,6 +9,7 @@ from werkzeug.utils import secure_filename
 
 from modular_store_backend.modules.db.database import db
 from modular_store_backend.modules.db.models import Purchase, PurchaseItem, ReportedReview, Review, ReviewImage
+from modular_store_backend.modules.reviews import ratings  # noqa: F401  keeps product rating aggregates in sync
 
 
 def get_review(review_id: int) -> Optional[Review]:
@@ -0,0 +1,74 @@
+# /modular_store_backend/modules/startup_profiler.py
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterator
+
+PROFILE_ENV_VAR = 'STARTUP_PROFILE'
+
+
+class StartupProfiler:
+    """Wall-clock timings of the stages of create_app."""
+
+    def __init__(self) -> None:
+        self.stages: list[tuple[str, float]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - started))
+
+    @property
+    def total(self) -> float:
+        return sum(duration for _, duration in self.stages)
+
+    def format_report(self) -> str:
+        lines = ['create_app startup profile:']
+        for name, duration in self.stages:
+            lines.append(f"  {name:<24} {duration * 1000:9.1f} ms")
+        lines.append(f"  {'total':<24} {self.total * 1000:9.1f} ms")
+        return '\n'.join(lines)
+
+
+def profiling_enabled() -> bool:
+    return os.environ.get(PROFILE_ENV_VAR, '').lower() in ('1', 'true', 'yes')
+
+
+def parse_import_times(output: str) -> dict[str, float]:
+    """
+    Sum the self import time of modules per top-level package from `python -X importtime` output.
+
+    :param output: stderr of the interpreter run with -X importtime
+    :return: Seconds spent importing each top-level package
+    """
+    totals: dict[str, float] = defaultdict(float)
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            self_us, _, module = line[len('import time:'):].split('|')
+            seconds = int(self_us) / 1_000_000
+        except ValueError:
+            continue  # header line
+        totals[module.strip().split('.')[0]] += seconds
+    return dict(totals)
+
+
+def profile_imports(module: str = 'modular_store_backend.app') -> dict[str, float]:
+    """
+    Import a module in a fresh interpreter and measure where the import time goes.
+
+    :param module: Module to import
+    :return: Seconds spent importing each top-level package
+    """
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [project_root, os.environ.get('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, env=env, cwd=project_root, check=False)
+    return parse_import_times(result.stderr)
@@ -0,0 +1,119 @@
+# /modular_store_backend/modules/stock.py
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session, scoped_session
+
+from modular_store_backend.modules.catalog_index import mark_products_changed
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Product
+
+
+class StockLine:
+    """Outcome of reserving stock for one product of an order."""
+
+    def __init__(self, product_id: int, quantity: int, reserved: bool) -> None:
+        self.product_id = product_id
+        self.quantity = quantity
+        self.reserved = reserved
+
+    def __repr__(self) -> str:
+        return f'StockLine(product_id={self.product_id}, quantity={self.quantity}, reserved={self.reserved})'
+
+
+class StockReservation:
+    """Per-line outcome of a stock reservation for a whole order."""
+
+    def __init__(self, lines: list[StockLine], applied: bool) -> None:
+        self.lines = lines
+        self.applied = applied  # False when a failed line caused the other lines to be released again
+
+    @property
+    def ok(self) -> bool:
+        return all(line.reserved for line in self.lines)
+
+    @property
+    def failed(self) -> list[StockLine]:
+        return [line for line in self.lines if not line.reserved]
+
+
+class OutOfStockError(Exception):
+    """Raised when an order cannot be saved because products do not have enough stock."""
+
+    def __init__(self, failed: list[StockLine]) -> None:
+        super().__init__(f"Not enough stock for products {', '.join(str(line.product_id) for line in failed)}")
+        self.failed = failed
+
+
+def _merge_lines(items: Iterable[tuple[int, int]]) -> OrderedDict[int, int]:
+    # Two cart rows for the same product (different variants) must be guarded as one quantity
+    merged: OrderedDict[int, int] = OrderedDict()
+    for product_id, quantity in items:
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    return merged
+
+
+def _expire_stock(session: Session | scoped_session[Session], product_ids: Iterable[int]) -> None:
+    # The UPDATEs bypass the identity map, so loaded products would keep showing the old stock, and the flush
+    # events the catalog index is patched from
+    product_ids = list(product_ids)
+    mark_products_changed(session, product_ids)
+    for product_id in product_ids:
+        product: Optional[Product] = session.identity_map.get(session.identity_key(Product, product_id))
+        if product is not None:
+            session.expire(product, ['stock'])
+
+
+def reserve_stock(items: Iterable[tuple[int, int]], all_or_nothing: bool = True,
+                  session: Optional[Session | scoped_session[Session]] = None) -> StockReservation:
+    """
+    Decrement the stock of the products of an order, never below zero.
+
+    Each line is a single `UPDATE products SET stock = stock - :q WHERE id = :id AND stock >= :q`, so
+    the check and the decrement cannot interleave with a concurrent checkout. All lines run in the
+    caller's transaction, which is left open for the caller to commit together with the order.
+
+    :param items: (product ID, quantity) pairs
+    :param all_or_nothing: Release the reserved lines again when any line fails
+    :param session: Session whose transaction to use, the app session by default
+    :return: Per-line outcome
+    """
+    session = session if session is not None else db.session
+    lines = []
+    for product_id, quantity in _merge_lines(items).items():
+        result = session.execute(
+            update(Product)
+            .where(Product.id == product_id, Product.stock >= quantity)
+            .values(stock=Product.stock - quantity)
+            .execution_options(synchronize_session=False)
+        )
+        lines.append(StockLine(product_id, quantity, result.rowcount == 1))
+
+    reservation = StockReservation(lines, applied=True)
+    if all_or_nothing and not reservation.ok:
+        release_stock(((line.product_id, line.quantity) for line in lines if line.reserved), session=session)
+        reservation.applied = False
+
+    _expire_stock(session, (line.product_id for line in lines))
+    return reservation
+
+
+def release_stock(items: Iterable[tuple[int, int]],
+                  session: Optional[Session | scoped_session[Session]] = None) -> None:
+    """
+    Return stock of cancelled orders or removed cart items, in the caller's transaction.
+
+    :param items: (product ID, quantity) pairs
+    :param session: Session whose transaction to use, the app session by default
+    """
+    session = session if session is not None else db.session
+    merged = _merge_lines(items)
+    for product_id, quantity in merged.items():
+        session.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(stock=Product.stock + quantity)
+            .execution_options(synchronize_session=False)
+        )
+    _expire_stock(session, merged)
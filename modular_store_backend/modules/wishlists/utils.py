@@ -4,6 +4,7 @@ from typing import Optional
 
 from modular_store_backend.modules.db.database import db
 from modular_store_backend.modules.db.models import Wishlist
+from modular_store_backend.modules.rankings import ranking_recorder
 
 
 def get_product_selection_options(selection_options_json: Optional[str]) -> dict[str, str]:
@@ -40,3 +41,4 @@ def add_item_to_wishlist(user_id: int, product_id: int, variant_options: dict[st
     new_wishlist_item = Wishlist(user_id=user_id, product_id=product_id, variant_options=variant_options_str)
     db.session.add(new_wishlist_item)
     db.session.commit()
+    ranking_recorder.record(product_id, 'wishlist')
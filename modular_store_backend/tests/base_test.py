@@ -4,8 +4,13 @@ import unittest
 from flask_login import LoginManager
 
 from modular_store_backend.app import create_app, load_config
+from modular_store_backend.modules.cache import cache
+from modular_store_backend.modules.catalog_index import catalog_index
 from modular_store_backend.modules.db.database import db, Base
 from modular_store_backend.modules.db.models import User
+from modular_store_backend.modules.presence import presence_tracker
+from modular_store_backend.modules.rankings import ranking_recorder
+from modular_store_backend.modules.search_index import product_search_index
 
 
 class TestConfig:
@@ -65,6 +70,11 @@ class BaseTest(unittest.TestCase):
 
     def tearDown(self):
         self.session.remove()
+        cache.clear()
+        presence_tracker.clear()
+        ranking_recorder.clear()
+        product_search_index.clear()
+        catalog_index.clear()
         Base.metadata.drop_all(bind=db.engine)
         Base.metadata.create_all(bind=db.engine)
 
@@ -12,6 +12,7 @@ from modular_store_backend.modules.db.models import (
     ShippingMethod,
     ReportedReview, Discount, Purchase, Address
 )
+from modular_store_backend.modules.request_metrics import update_request_metric_rollups
 from modular_store_backend.tests.base_test import BaseTest
 from modular_store_backend.tests.util import create_user
 
@@ -181,6 +182,43 @@ class TestAdminIntegration(BaseTest):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Total Requests: 5', response.data)
 
+    def test_analytics_data_after_retention(self):
+        for _ in range(3):
+            self.session.add(RequestLog(user_id=self.regular_user.id, ip_address='127.0.0.1',
+                                        endpoint='/test', method='GET', status_code=404,
+                                        execution_time=0.5, timestamp=datetime.now()))
+        self.session.commit()
+        # The rollups keep the counts of the raw logs purged by the retention job
+        update_request_metric_rollups(100)
+        self.session.query(RequestLog).delete()
+        self.session.commit()
+
+        client = self.login_admin()
+        response = client.post(url_for('analytics.index'), data={
+            'start_date': (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d'),
+            'end_date': datetime.now().strftime('%Y-%m-%d')
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Total Requests: 3', response.data)
+        self.assertIn(b'404: 3', response.data)
+        self.assertNotIn(b'Request Logs (Last 10)', response.data)
+
+    def test_query_stats_view(self):
+        for endpoint, db_time in (('main.index', 0.02), ('main.product_page', 0.2)):
+            self.session.add(RequestLog(user_id=self.regular_user.id, ip_address='127.0.0.1',
+                                        endpoint=endpoint, method='GET', status_code=200,
+                                        execution_time=0.5, timestamp=datetime.utcnow(),
+                                        query_count=12, db_time=db_time,
+                                        repeated_queries='{"SELECT avg(reviews.rating) FROM reviews": 9}'))
+        self.session.commit()
+
+        client = self.login_admin()
+        response = client.get(url_for('query_stats.index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'SQL Performance', response.data)
+        self.assertLess(response.data.index(b'main.product_page'), response.data.index(b'main.index'))
+        self.assertIn(b'9 x SELECT avg(reviews.rating)', response.data)
+
     def test_unauthorized_access(self):
         with self.app.test_request_context():
             with self.app.test_client() as client:
@@ -219,7 +257,7 @@ class TestAdminIntegration(BaseTest):
         self.assertEqual(response.status_code, 200)
         self.assertNotIn(self.category.name.encode(), response.data)
 
-    @patch('modular_store_backend.modules.admin.views.ProfileReport')
+    @patch('ydata_profiling.ProfileReport')
     def test_generate_statistics(self, mock_profile_report):
         mock_profile = MagicMock()
         mock_profile.to_html.return_value = '<html>Mock Profile Report</html>'
@@ -158,7 +158,8 @@ class TestFilterViews(BaseTest):
     def test_sort_options(self):
         from modular_store_backend.modules.filter.sort_options import SortOptions
 
-        self.assertEqual(len(SortOptions.get_all()), 3)  # PRICE_ASC, PRICE_DESC, AVG_RATING_DESC
+        # PRICE_ASC, PRICE_DESC, AVG_RATING_DESC, BEST_SELLING, MOST_VIEWED, TRENDING
+        self.assertEqual(len(SortOptions.get_all()), 6)
         self.assertIsNotNone(SortOptions.get_by_key('price_asc'))
         self.assertIsNone(SortOptions.get_by_key('invalid_key'))
 
@@ -6,6 +6,7 @@ from flask_login import login_user, logout_user
 
 from modular_store_backend.modules.db.models import Purchase, ShippingMethod, Address, Product, ShippingAddress, Cart
 from modular_store_backend.modules.purchase_history.utils import save_purchase_history
+from modular_store_backend.modules.stock import OutOfStockError
 from modular_store_backend.tests.base_test import BaseTest
 from modular_store_backend.tests.util import create_user
 
@@ -105,6 +106,40 @@ class TestPurchaseHistoryIntegration(BaseTest):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Cancelled', response.data)
 
+    def test_save_purchase_history_is_one_transaction(self):
+        other_product = Product(samplename='Other Product', price=20, stock=3)
+        self.session.add(other_product)
+        self.session.commit()
+        cart_items = [Cart(user_id=self.user.id, product_id=self.product.id, quantity=2, price=10),
+                      Cart(user_id=self.user.id, product_id=other_product.id, quantity=1, price=20)]
+
+        with self.app.test_request_context():
+            login_user(self.user)
+            purchase = save_purchase_history(self.session, cart_items, self.address.id, self.shipping_method.id,
+                                             'Credit Card', '789')
+
+        self.session.expire_all()
+        purchase = self.session.get(Purchase, purchase.id)
+        self.assertEqual(sorted((item.product_id, item.quantity) for item in purchase.items),
+                         [(self.product.id, 2), (other_product.id, 1)])
+        self.assertEqual(purchase.shipping_address.address_line1, '123 Test St')
+        self.assertEqual((self.product.stock, other_product.stock), (8, 2))
+
+    def test_save_purchase_history_out_of_stock_saves_nothing(self):
+        purchases = self.session.query(Purchase).count()
+        cart_items = [Cart(user_id=self.user.id, product_id=self.product.id, quantity=11, price=10)]
+
+        with self.app.test_request_context():
+            login_user(self.user)
+            with self.assertRaises(OutOfStockError) as context:
+                save_purchase_history(self.session, cart_items, self.address.id, self.shipping_method.id,
+                                      'Credit Card', '789')
+
+        self.assertEqual([line.product_id for line in context.exception.failed], [self.product.id])
+        self.assertEqual(self.session.query(Purchase).count(), purchases)
+        self.assertEqual(self.session.query(ShippingAddress).count(), 1)
+        self.assertEqual(self.product.stock, 10)
+
     def test_unauthorized_access(self):
         # Create a purchase for another user
         true_other = create_user(self)
@@ -1,48 +1,145 @@
+import gzip
 import os
+import shutil
+import sqlite3
+import tempfile
+import threading
 import unittest
+from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
 
-from modular_store_backend.modules.db.backup import backup_database
+from modular_store_backend.modules.db.backup import (
+    backup_database, create_backup, list_backups, restore_backup, resolve_compression, select_backups_to_keep,
+    verify_backup
+)
 
 
 class TestBackup(unittest.TestCase):
     def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.directory, 'test.db')
+        self.backup_dir = os.path.join(self.directory, 'backups')
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT)")
+        connection.executemany("INSERT INTO products (name) VALUES (?)", [(f'product {i}',) for i in range(2000)])
+        connection.commit()
+        connection.close()
+
         self.app = MagicMock()
         self.app.config = {
-            'BACKUP_DIR': '/tmp/backups',
-            'DB_PATH': '/tmp/test.db'
+            'BACKUP_DIR': self.backup_dir,
+            'DB_PATH': self.db_path,
+            'BACKUP_COMPRESSION': 'gzip',
         }
 
-    @patch('modular_store_backend.modules.db.backup.os.path.exists')
-    @patch('modular_store_backend.modules.db.backup.os.makedirs')
-    @patch('modular_store_backend.modules.db.backup.shutil.copyfile')
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def count_rows(self, path):
+        connection = sqlite3.connect(path)
+        try:
+            return connection.execute("SELECT count(*) FROM products").fetchone()[0]
+        finally:
+            connection.close()
+
     @patch('modular_store_backend.modules.db.backup.logging.info')
-    def test_backup_database_success(self, mock_logging_info, mock_copyfile, mock_makedirs, mock_exists):
-        mock_exists.return_value = False
-
-        # Patch datetime to return a fixed timestamp
-        with patch('modular_store_backend.modules.db.backup.datetime') as mock_datetime:
-            mock_datetime.now.return_value.strftime.return_value = "20250225_144524"
-            backup_database(self.app)
-
-            mock_exists.assert_called_once_with('/tmp/backups')
-            mock_makedirs.assert_called_once_with('/tmp/backups')
-            mock_copyfile.assert_called_once_with('/tmp/test.db',
-                                                  os.path.join('/tmp/backups', 'database_backup_20250225_144524.db'))
-
-            # Verify logging.info is called with the correct message
-            expected_path = os.path.normpath('/tmp/backups/database_backup_20250225_144524.db')
-            expected_message = f"Database backup created: {expected_path}"
-            mock_logging_info.assert_called_once_with(expected_message)
-
-    @patch('modular_store_backend.modules.db.backup.os.path.exists')
-    @patch('modular_store_backend.modules.db.backup.shutil.copyfile')
+    def test_backup_database_success(self, mock_logging_info):
+        result = backup_database(self.app)
+
+        self.assertTrue(os.path.exists(result.path))
+        self.assertTrue(result.path.endswith('.db.gz'))
+        self.assertTrue(result.verified)
+        self.assertGreater(result.database_size, result.backup_size)
+        self.assertEqual([path for _, path in list_backups(self.backup_dir)], [result.path])
+        self.assertEqual(os.listdir(self.backup_dir), [os.path.basename(result.path)])  # no leftover temp files
+
+        mock_logging_info.assert_called_once()
+        self.assertIn("Database backup created", mock_logging_info.call_args[0][0])
+        self.assertIn("snapshot", mock_logging_info.call_args[0][0])
+
+        restored = os.path.join(self.directory, 'restored.db')
+        restore_backup(result.path, restored)
+        self.assertEqual(self.count_rows(restored), 2000)
+
     @patch('modular_store_backend.modules.db.backup.logging.error')
-    def test_backup_database_error(self, mock_logging_error, mock_copyfile, mock_exists):
-        mock_exists.return_value = True
-        mock_copyfile.side_effect = Exception("Test exception")
+    def test_backup_database_error(self, mock_logging_error):
+        self.app.config['DB_PATH'] = os.path.join(self.directory, 'missing', 'test.db')
 
-        backup_database(self.app)
+        self.assertIsNone(backup_database(self.app))
 
         mock_logging_error.assert_called_once()
         self.assertIn("Error creating database backup", mock_logging_error.call_args[0][0])
+
+    def test_backup_under_concurrent_writes(self):
+        stop = threading.Event()
+
+        def write():
+            connection = sqlite3.connect(self.db_path, timeout=5)
+            while not stop.is_set():
+                connection.execute("INSERT INTO products (name) VALUES ('concurrent')")
+                connection.commit()
+            connection.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            result = create_backup(self.db_path, self.backup_dir, compression='none', pages_per_step=1)
+        finally:
+            stop.set()
+            writer.join()
+
+        self.assertTrue(result.verified)
+        self.assertGreaterEqual(self.count_rows(result.path), 2000)
+
+    def test_corrupt_backup_fails_verification(self):
+        result = create_backup(self.db_path, self.backup_dir, compression='gzip', verify=False)
+        with gzip.open(result.path, 'wb') as corrupt:
+            corrupt.write(b'not a database')
+
+        self.assertFalse(verify_backup(result.path))
+
+    def test_resolve_compression(self):
+        with patch('modular_store_backend.modules.db.backup._zstandard', return_value=None):
+            self.assertEqual(resolve_compression('zstd'), 'gzip')
+        self.assertEqual(resolve_compression('none'), 'none')
+        with self.assertRaises(ValueError):
+            resolve_compression('bz2')
+
+    def test_retention_prunes_old_backups(self):
+        now = datetime(2026, 10, 18, 12, 0, 0)
+        for hours in (0, 1, 30, 24 * 20):
+            create_backup(self.db_path, self.backup_dir, compression='none', verify=False,
+                          retention={'hourly': 100, 'daily': 100, 'weekly': 100}, now=now - timedelta(hours=hours))
+
+        result = create_backup(self.db_path, self.backup_dir, compression='none', verify=False,
+                               retention={'hourly': 2, 'daily': 2, 'weekly': 0}, now=now + timedelta(minutes=5))
+
+        kept = [timestamp for timestamp, _ in list_backups(self.backup_dir)]
+        # hours 12:05 and 11:00, days 18th (12:05) and 17th (06:00)
+        self.assertEqual(kept, [now + timedelta(minutes=5), now - timedelta(hours=1), now - timedelta(hours=30)])
+        self.assertEqual(len(result.pruned), 2)
+
+
+class TestRetentionPolicy(unittest.TestCase):
+
+    def test_keeps_newest_backup_per_bucket(self):
+        now = datetime(2026, 10, 18, 12, 0, 0)
+        timestamps = [now - timedelta(hours=hours) for hours in range(0, 24 * 30, 6)]
+
+        keep = select_backups_to_keep(timestamps, {'hourly': 0, 'daily': 3, 'weekly': 2})
+
+        self.assertEqual(sorted(keep, reverse=True), [
+            now,  # newest of the 18th (and of its ISO week)
+            datetime(2026, 10, 17, 18, 0, 0),
+            datetime(2026, 10, 16, 18, 0, 0),
+            datetime(2026, 10, 11, 18, 0, 0),  # newest of the previous ISO week
+        ])
+
+    def test_always_keeps_newest(self):
+        now = datetime(2026, 10, 18, 12, 0, 0)
+        self.assertEqual(select_backups_to_keep([now, now - timedelta(days=1)], {}), {now})
+
+
+if __name__ == '__main__':
+    unittest.main()
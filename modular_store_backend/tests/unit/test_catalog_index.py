@@ -0,0 +1,193 @@
+# /modular_store_backend/tests/unit/test_catalog_index.py
+import unittest
+from unittest.mock import patch
+
+from modular_store_backend.modules import catalog_index as catalog_index_module
+from modular_store_backend.modules.catalog_index import CatalogIndex, ProductSelection, build_catalog_index, \
+    catalog_index
+from modular_store_backend.modules.db.models import Category, Product, Tag
+from modular_store_backend.modules.filter.utils import filter_products, get_promoted_products, paginate_query, \
+    select_products
+from modular_store_backend.modules.stock import release_stock, reserve_stock
+from modular_store_backend.tests.base_test import BaseTest
+
+
+def row(category_id=1, price=1000, on_sale_price=None, stock=5, rating=0.0, tags=(), scores=(0.0, 0.0, 0.0)):
+    return category_id, price, 1 if on_sale_price else 0, on_sale_price, stock, rating, *scores, frozenset(tags)
+
+
+class TestCatalogIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = CatalogIndex()
+        self.index.build([
+            (1, row(category_id=1, price=3000, rating=4.0, tags=[10])),
+            (2, row(category_id=2, price=1000, rating=None)),
+            (3, row(category_id=3, price=5000, on_sale_price=2000, rating=5.0, tags=[10, 11])),
+            (4, row(category_id=3, price=None, stock=0, rating=4.0)),
+        ], lambda: ({1: [1, 3], 2: [2], 3: [3]}, {10: 'Gift', 11: 'clearance'}))
+
+    def ids(self, **criteria):
+        return self.index.select(**criteria).product_ids.tolist()
+
+    def test_filters(self):
+        self.assertEqual(self.ids(), [1, 2, 3])
+        self.assertEqual(self.ids(in_stock=False), [1, 2, 3, 4])
+        self.assertEqual(self.ids(category_id=1), [1, 3])  # with its direct subcategories
+        self.assertEqual(self.ids(tag_query='gif'), [1, 3])
+        self.assertEqual(self.ids(tag_query='clear', category_id=2), [])
+        self.assertEqual(self.ids(on_sale=True), [3])
+        self.assertEqual(self.ids(price_range=(1000, 2500)), [2, 3])  # current price
+        self.assertEqual(self.ids(price_range=(0, 1000), in_stock=False), [4])  # no price counts as free
+
+    def test_sort_orders_keep_nulls_last(self):
+        self.assertEqual(self.ids(sort_by='price_asc', in_stock=False), [2, 3, 1, 4])
+        self.assertEqual(self.ids(sort_by='price_desc', in_stock=False), [1, 3, 2, 4])
+        self.assertEqual(self.ids(sort_by='rating', in_stock=False), [3, 1, 4, 2])
+        self.assertIsNone(self.index.select(sort_by='newest'))
+
+    def test_ranked_ids(self):
+        self.assertEqual(self.ids(ranked_ids=[3, 4, 9, 1]), [3, 1])
+        self.assertEqual(self.ids(ranked_ids=[3, 2, 1], sort_by='price_desc'), [1, 3, 2])
+
+    def test_updates(self):
+        self.index.update(2, row(category_id=1, price=9000, tags=[11]))
+        self.index.update(1, None)
+        self.index.update(5, row(category_id=2, price=500))
+        self.index.update(6, None)  # deleted before it was indexed
+
+        self.assertEqual(self.ids(sort_by='price_asc'), [5, 3, 2])
+        self.assertEqual(self.ids(category_id=1), [2, 3])
+        self.assertEqual(self.ids(tag_query='gift'), [3])
+        self.assertEqual(self.ids(tag_query='clearance'), [2, 3])
+        self.assertEqual(len(self.index), 4)
+
+    def test_grows_past_its_capacity(self):
+        for product_id in range(10, 400):
+            self.index.update(product_id, row(category_id=2, price=10000 + product_id))
+
+        self.assertEqual(self.ids(category_id=2, sort_by='price_desc')[:3], [399, 398, 397])
+        self.assertEqual(len(self.index.select(price_range=(10000, 10100))), 90)
+
+    def test_build_replays_updates_made_during_the_build(self):
+        def rows():
+            yield 1, row()
+            self.index.update(2, row(category_id=2))
+
+        def taxonomy():
+            self.index.set_taxonomy({1: [1, 2]}, {})
+            return {}, {}
+
+        self.assertEqual(self.index.build(rows(), taxonomy), 2)
+
+        self.assertEqual(self.ids(category_id=2), [2])
+        self.assertEqual(self.ids(category_id=1), [1, 2])
+
+    def test_selection(self):
+        selection = ProductSelection(self.index.select().product_ids)
+
+        self.assertEqual(selection.page(1, 5), [2, 3])
+        self.assertIn(3, selection)
+        self.assertNotIn(4, selection)
+
+
+class TestCatalogIndexSync(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.parent = Category(name='Electronics')
+        self.session.add(self.parent)
+        self.session.flush()
+        self.child = Category(name='Phones', parent_id=self.parent.id)
+        self.tag = Tag(name='gift')
+        self.session.add_all([self.child, self.tag])
+        self.session.commit()
+
+    def add_product(self, name, price, category, stock=5, tags=()):
+        product = Product(samplename=name, price=price, category_id=category.id, stock=stock)
+        product.tags.extend(tags)
+        self.session.add(product)
+        self.session.commit()
+        return product
+
+    def selected(self, **criteria):
+        selection = select_products(**criteria)
+        self.assertIsInstance(selection, ProductSelection)
+        return selection.product_ids.tolist()
+
+    def test_commits_and_stock_updates_patch_the_index(self):
+        case = self.add_product('Case', 900, self.child, tags=[self.tag])
+        charger = self.add_product('Charger', 2000, self.parent, stock=1)
+        self.assertEqual(self.selected(category_query=self.parent.id, sort_by='price_desc'), [charger.id, case.id])
+
+        reserve_stock([(charger.id, 1)])
+        self.session.commit()
+        self.assertEqual(self.selected(), [case.id])
+
+        release_stock([(charger.id, 1)])
+        self.session.rollback()
+        self.assertEqual(self.selected(), [case.id])
+
+        case.onSale, case.onSalePrice = 1, 500
+        case.tags.clear()
+        self.session.commit()
+        self.assertEqual(self.selected(on_sale=True), [case.id])
+        self.assertEqual(self.selected(tag_query='gift'), [])
+
+        self.child.parent_id = None
+        self.session.commit()
+        self.assertEqual(self.selected(category_query=self.parent.id, in_stock=False), [charger.id])
+
+        self.session.delete(case)
+        self.session.commit()
+        self.assertEqual(self.selected(in_stock=False), [charger.id])
+
+    def test_agrees_with_filter_products(self):
+        self.add_product('Case', 900, self.child, tags=[self.tag])
+        self.add_product('Phone', 40000, self.child)
+        self.add_product('Cable', 1500, self.parent, stock=0, tags=[self.tag])
+        criteria = [{}, {'category_query': self.parent.id, 'sort_by': 'price_asc'}, {'tag_query': 'GIF'},
+                    {'price_band': '1000-2500', 'in_stock': False}, {'sort_by': 'price_desc', 'in_stock': False},
+                    {'name_query': 'phon'}]
+        for criterion in criteria:
+            self.assertEqual(self.selected(**criterion), [product.id for product in filter_products(**criterion)])
+
+    def test_pagination_loads_the_page_only(self):
+        products = [self.add_product(f'Product {index}', 100 * index, self.parent) for index in range(1, 5)]
+        default_per_page = self.app.config['PER_PAGE']
+        self.app.config['PER_PAGE'] = 3
+        try:
+            items, in_total, total_pages, per_page = paginate_query(select_products(sort_by='price_desc'), 2)
+        finally:
+            self.app.config['PER_PAGE'] = default_per_page
+
+        self.assertEqual(items, [products[0]])
+        self.assertEqual((in_total, total_pages, per_page), (4, 2, 3))
+        self.assertEqual(get_promoted_products(select_products()), [])
+
+    def test_rebuild_keeps_the_commits_made_while_it_reads(self):
+        tent_id = self.add_product('Tent', 9000, self.parent).id
+        read_rows = catalog_index_module.read_product_rows
+
+        def read_then_sell_out(connection, product_ids=None):
+            rows = read_rows(connection, product_ids)
+            if product_ids is None:  # the rebuild, not the commit below
+                self.session.get(Product, tent_id).stock = 0  # sold out after the rebuild read its rows
+                self.session.commit()
+            return rows
+
+        with patch.object(catalog_index_module, 'read_product_rows', read_then_sell_out):
+            build_catalog_index(self.app)
+
+        self.assertEqual(self.selected(), [])
+        self.assertEqual(self.selected(in_stock=False), [tent_id])
+
+    def test_unindexed_sort_falls_back_to_the_query(self):
+        self.assertNotIsInstance(select_products(sort_by='unknown'), ProductSelection)
+        catalog_index.ready = False
+        try:
+            self.assertNotIsInstance(select_products(), ProductSelection)
+        finally:
+            catalog_index.ready = True
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# /modular_store_backend/tests/unit/test_catalog_metadata.py
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Category, Product, Review, Tag
+from modular_store_backend.modules.filter.catalog_metadata import bump_catalog_version, get_catalog_version, \
+    get_filter_options
+from modular_store_backend.tests.base_test import BaseTest
+from modular_store_backend.tests.util import create_user
+
+
+class TestCatalogMetadata(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass(init_login_manager=True, define_load_user=True)
+
+    def setUp(self):
+        super().setUp()
+        self.category = Category(name='Garden')
+        self.tag = Tag(name='outdoor')
+        self.session.add_all([self.category, self.tag])
+        self.session.commit()
+
+    def count_queries(self, function):
+        statements = []
+
+        def record(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            function()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return len(statements)
+
+    def test_filter_options_are_cached_per_version(self):
+        options = get_filter_options()
+        self.assertEqual([category['name'] for category in options['categories']], ['Garden'])
+        self.assertEqual([tag['name'] for tag in options['tags']], ['outdoor'])
+        self.assertTrue(options['sort_options'])
+        self.assertEqual(self.count_queries(get_filter_options), 1)  # the version lookup
+
+    def test_catalog_writes_bump_the_version(self):
+        get_filter_options()
+        for instance in (Tag(name='patio'), Category(name='Tools'), Product(samplename='Rake', price=900, stock=3)):
+            version = get_catalog_version()
+            self.session.add(instance)
+            self.session.commit()
+            self.assertEqual(get_catalog_version(), version + 1)
+        self.assertEqual(len(get_filter_options()['tags']), 2)
+        self.assertEqual(len(get_filter_options()['categories']), 2)
+
+    def test_other_product_writes_keep_the_version(self):
+        product = Product(samplename='Rake', price=900, stock=3, category_id=self.category.id)
+        user = create_user(self)
+        self.session.add(product)
+        self.session.commit()
+        version = get_catalog_version()
+
+        product.description = 'A sturdy rake'
+        product.price = 1200
+        self.session.add(Review(user_id=user.id, product_id=product.id, rating=4))
+        self.session.commit()
+        self.assertEqual(get_catalog_version(), version)
+
+        product.stock = 0  # the product counts of the navigation
+        self.session.commit()
+        self.assertEqual(get_catalog_version(), version + 1)
+
+    def test_rolled_back_writes_keep_the_version(self):
+        version = get_catalog_version()
+        self.session.add(Tag(name='discarded'))
+        self.session.flush()
+        self.session.rollback()
+        self.session.commit()
+        self.assertEqual(get_catalog_version(), version)
+
+    def test_writes_of_other_workers_are_seen(self):
+        get_filter_options()
+        self.session.remove()
+
+        # Another worker process shares the database, not the cache of this one
+        with Session(db.engine) as other_worker:
+            other_worker.add(Tag(name='patio'))
+            other_worker.commit()
+
+        self.assertEqual([tag['name'] for tag in get_filter_options()['tags']], ['outdoor', 'patio'])
+
+    def test_bulk_writes_bump_the_version(self):
+        version = get_catalog_version()
+        self.session.query(Tag).filter_by(name='outdoor').update({'name': 'garden'})
+        bump_catalog_version()
+        self.session.commit()
+        self.assertEqual(get_catalog_version(), version + 1)
+
+    def test_nothing_catalog_sized_goes_in_the_session(self):
+        with self.client.session_transaction() as session:
+            session['filter_options'] = {'categories': [{'id': 1, 'name': 'Old'}]}
+        response = self.client.get('/')
+
+        self.assertIn(b'value="price_asc"', response.data)
+        with self.client.session_transaction() as session:
+            self.assertNotIn('filter_options', session)
+        self.assertIn(b'value="price_asc"', self.client.get('/filter?sort_by=rating').data)
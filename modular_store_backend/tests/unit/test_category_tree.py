@@ -0,0 +1,116 @@
+# /modular_store_backend/tests/unit/test_category_tree.py
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from modular_store_backend.modules.db.category_tree import read_subtrees, rebuild_category_tree, subtree_ids
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Category, Product, category_closure
+from modular_store_backend.modules.filter.categories import get_breadcrumbs, get_category_tree
+from modular_store_backend.modules.filter.utils import filter_products, select_products
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestCategoryTree(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass(init_login_manager=True, define_load_user=True)
+
+    def setUp(self):
+        super().setUp()
+        # Electronics > Phones > Cases, and Home
+        self.electronics = self.add_category('Electronics')
+        self.phones = self.add_category('Phones', self.electronics)
+        self.cases = self.add_category('Cases', self.phones)
+        self.home = self.add_category('Home')
+
+        self.case = self.add_product('Leather Case', self.cases)
+        self.phone = self.add_product('Smartphone', self.phones)
+        self.lamp = self.add_product('Lamp', self.home)
+
+    def add_category(self, name, parent=None):
+        category = Category(name=name, parent_id=parent.id if parent else None)
+        self.session.add(category)
+        self.session.commit()
+        return category
+
+    def add_product(self, name, category):
+        product = Product(samplename=name, category_id=category.id, price=1000, stock=5)
+        self.session.add(product)
+        self.session.commit()
+        return product
+
+    def paths(self):
+        return set(db.session.execute(select(category_closure.c.ancestor_id, category_closure.c.descendant_id,
+                                             category_closure.c.depth)))
+
+    def subtree(self, category):
+        return sorted(db.session.scalars(subtree_ids(category.id)))
+
+    def test_inserts_add_the_paths(self):
+        self.assertEqual(self.subtree(self.electronics), sorted([self.electronics.id, self.phones.id, self.cases.id]))
+        self.assertIn((self.electronics.id, self.cases.id, 2), self.paths())
+        self.assertEqual(self.subtree(self.home), [self.home.id])
+
+    def test_filters_include_every_depth(self):
+        for category, expected in ((self.electronics, {self.case.id, self.phone.id}), (self.cases, {self.case.id}),
+                                   (self.home, {self.lamp.id})):
+            self.assertEqual({product.id for product in filter_products(category_query=str(category.id))}, expected)
+            self.assertEqual(set(select_products(category_query=str(category.id)).product_ids.tolist()), expected)
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.phones.parent_id = self.home.id
+        self.session.commit()
+
+        self.assertEqual(self.subtree(self.electronics), [self.electronics.id])
+        self.assertIn((self.home.id, self.cases.id, 2), self.paths())
+        self.assertEqual({product.id for product in filter_products(category_query=str(self.home.id))},
+                         {self.case.id, self.phone.id, self.lamp.id})
+        self.assertEqual(set(select_products(category_query=str(self.home.id)).product_ids.tolist()),
+                         {self.case.id, self.phone.id, self.lamp.id})
+
+    def test_moving_a_category_below_itself_is_rejected(self):
+        self.electronics.parent_id = self.cases.id
+        with self.assertRaises(IntegrityError):
+            self.session.commit()
+        self.session.rollback()
+        self.assertIsNone(self.session.get(Category, self.electronics.id).parent_id)
+
+    def test_deleting_a_category_detaches_its_subcategories(self):
+        self.session.delete(self.phones)
+        self.session.commit()
+
+        paths = self.paths()
+        self.assertFalse({path for path in paths if self.phones.id in path[:2]})
+        self.assertIn((self.cases.id, self.cases.id, 0), paths)
+        self.assertNotIn((self.electronics.id, self.cases.id, 2), paths)
+
+    def test_rebuild_matches_the_triggers(self):
+        expected = self.paths()
+        with db.engine.begin() as connection:
+            self.assertEqual(rebuild_category_tree(connection), len(expected))
+        self.assertEqual(self.paths(), expected)
+        self.assertEqual(sorted(read_subtrees(db.session)[self.phones.id]), sorted([self.phones.id, self.cases.id]))
+
+    def test_navigation_is_cached_until_the_catalog_changes(self):
+        tree = get_category_tree()
+        self.assertEqual([(category['name'], category['depth'], category['product_count']) for category in tree],
+                         [('Electronics', 0, 2), ('Phones', 1, 2), ('Cases', 2, 1), ('Home', 0, 1)])
+        self.assertEqual([crumb['name'] for crumb in get_breadcrumbs(self.cases.id)], ['Electronics', 'Phones', 'Cases'])
+
+        db.session.execute(update(Product).where(Product.id == self.lamp.id).values(stock=0))
+        db.session.commit()
+        self.assertEqual(get_category_tree()[-1]['product_count'], 1)  # stock writes bypass the ORM events
+
+        self.session.add(Product(samplename='Charger', category_id=self.electronics.id, price=500, stock=5))
+        self.session.commit()
+        self.assertEqual(get_category_tree()[0]['product_count'], 3)
+        self.assertEqual(get_category_tree()[-1]['product_count'], 0)
+
+        self.cases.name = 'Covers'
+        self.session.commit()
+        self.assertEqual([crumb['name'] for crumb in get_breadcrumbs(self.cases.id)][-1], 'Covers')
+
+    def test_product_page_shows_the_breadcrumbs(self):
+        response = self.client.get(f'/products/{self.case.id}')
+        self.assertIn(f'category_id={self.phones.id}"'.encode(), response.data)
+        self.assertIn(b'>Cases</a>', response.data)
@@ -1,11 +1,16 @@
 # /modular_store_backend/tests/unit/test_database.py
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 
 from flask import Flask
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import scoped_session
 
 from modular_store_backend.modules.db.database import Database, db
+from modular_store_backend.modules.db.models import Category
 
 
 class TestDatabase(unittest.TestCase):
@@ -75,5 +80,70 @@ class TestDatabase(unittest.TestCase):
         self.assertIsInstance(db, Database)
 
 
+class TestReadWriteRouting(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.db_dir, 'routing.db')}"
+        self.app.config['SQLALCHEMY_READ_ONLY_ENGINE'] = True
+        self.database = Database()
+        self.database.init_app(self.app)
+        self.database.init_db()
+        self.session = self.database.session()
+        self.primary = self.database.engine
+        self.replica = self.database.read_engines[0]
+
+    def tearDown(self):
+        self.database.session.remove()
+        for engine in [self.primary, *self.database.read_engines]:
+            engine.dispose()
+        for name in os.listdir(self.db_dir):
+            os.remove(os.path.join(self.db_dir, name))
+        os.rmdir(self.db_dir)
+
+    def bind_for(self, statement):
+        return self.session.get_bind(clause=statement)
+
+    def test_read_engine_is_read_only(self):
+        self.assertIn('mode=ro', str(self.replica.url))
+        with self.replica.connect() as connection:
+            self.assertEqual(connection.execute(text("PRAGMA query_only")).scalar(), 1)
+            with self.assertRaises(OperationalError):
+                connection.execute(text("INSERT INTO categories (name) VALUES ('x')"))
+
+    def test_routes_by_request_method(self):
+        with self.app.test_request_context(method='GET'):
+            self.assertIs(self.bind_for(select(Category)), self.replica)
+            self.assertIs(self.bind_for(select(Category).with_for_update()), self.primary)
+        with self.app.test_request_context(method='POST'):
+            self.assertIs(self.bind_for(select(Category)), self.primary)
+        self.assertIs(self.bind_for(select(Category)), self.primary)  # no request, e.g. scheduler jobs
+
+    def test_read_session_outside_request(self):
+        with self.database.read_session() as session:
+            self.assertIs(session, self.session)
+            self.assertIs(self.bind_for(select(Category)), self.replica)
+        self.assertIs(self.bind_for(select(Category)), self.primary)
+
+    def test_reads_stay_on_primary_after_a_write(self):
+        with self.app.test_request_context(method='GET'):
+            self.session.add(Category(name='Books'))
+            self.session.flush()
+            self.assertIs(self.bind_for(select(Category)), self.primary)
+            self.assertEqual(self.session.scalars(select(Category.name)).all(), ['Books'])
+
+            self.session.commit()
+            self.assertIs(self.bind_for(select(Category)), self.replica)
+            self.assertEqual(self.session.scalars(select(Category.name)).all(), ['Books'])
+
+    def test_in_memory_database_has_no_read_engines(self):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_READ_ONLY_ENGINE'] = True
+        database = Database()
+        database.init_app(app)
+        self.assertEqual(database.read_engines, [])
+
+
 if __name__ == '__main__':
     unittest.main()
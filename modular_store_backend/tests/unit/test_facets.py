@@ -0,0 +1,124 @@
+# /modular_store_backend/tests/unit/test_facets.py
+from sqlalchemy import event
+
+from modular_store_backend.modules.cache import cache
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Category, Product, Tag
+from modular_store_backend.modules.filter.facets import FilterState, compute_facet_counts, get_facet_counts
+from modular_store_backend.modules.filter.utils import filter_products
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestFacets(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass(init_login_manager=True, define_load_user=True)
+
+    def setUp(self):
+        super().setUp()
+        self.electronics = Category(name='Electronics')
+        self.home = Category(name='Home')
+        self.session.add_all([self.electronics, self.home])
+        self.session.flush()
+        self.phones = Category(name='Phones', parent_id=self.electronics.id)
+        self.gift = Tag(name='gift')
+        self.sale = Tag(name='clearance')
+        self.session.add_all([self.phones, self.gift, self.sale])
+        self.session.commit()
+
+        self.add_product('Phone Case', self.phones, 900, tags=[self.gift])
+        self.add_product('Smartphone', self.phones, 40000, on_sale_price=30000, tags=[self.gift, self.sale])
+        self.add_product('Charger', self.electronics, 2000)
+        self.add_product('Lamp', self.home, 4000, stock=0, tags=[self.gift])
+        self.add_product('Vase', self.home, 1500, on_sale_price=1200, tags=[self.sale])
+
+    def add_product(self, name, category, price, on_sale_price=None, stock=5, tags=()):
+        product = Product(samplename=name, category_id=category.id, price=price, stock=stock,
+                          onSale=1 if on_sale_price else 0, onSalePrice=on_sale_price)
+        product.tags.extend(tags)
+        self.session.add(product)
+        self.session.commit()
+        return product
+
+    def test_counts_of_the_default_listing(self):
+        facets = compute_facet_counts(FilterState())
+
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(facets['categories'], {self.electronics.id: 3, self.home.id: 1, self.phones.id: 2})
+        self.assertEqual([(tag['name'], tag['count']) for tag in facets['tags']], [('gift', 2), ('clearance', 2)])
+        self.assertEqual([band['count'] for band in facets['price_bands']], [1, 2, 0, 0, 0, 1])
+        self.assertEqual(facets['price_bands'][1], {'key': '1000-2500', 'min': 1000, 'max': 2500, 'count': 2})
+        self.assertEqual(facets['on_sale'], 2)
+        self.assertEqual(facets['in_stock'], 4)
+
+    def test_each_facet_ignores_its_own_selection(self):
+        state = FilterState(category_id=self.electronics.id, on_sale=True)
+        facets = compute_facet_counts(state)
+
+        self.assertEqual(facets['total'], 1)
+        # Other categories still show what picking them instead would return (on sale products)
+        self.assertEqual(facets['categories'][self.home.id], 1)
+        self.assertEqual(facets['categories'][self.electronics.id], 1)
+        # Without the on sale filter the selected category holds 3 products
+        self.assertEqual(facets['on_sale'], 1)
+        self.assertEqual(sum(band['count'] for band in facets['price_bands']), 1)
+
+    def test_availability_and_tag_filters(self):
+        facets = compute_facet_counts(FilterState(in_stock=False, tag_query=' GIFT '))
+
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(facets['in_stock'], 2)
+        self.assertEqual(facets['categories'][self.home.id], 1)
+        self.assertEqual([(tag['name'], tag['count']) for tag in facets['tags']], [('gift', 3), ('clearance', 2)])
+
+    def test_totals_agree_with_filter_products(self):
+        states = [FilterState(), FilterState(category_id=self.phones.id), FilterState(price_band='1000-2500'),
+                  FilterState(on_sale=True, in_stock=False), FilterState(name_query='phone', tag_query='gift'),
+                  FilterState(price_band='25000-', category_id=self.electronics.id)]
+        for state in states:
+            self.assertEqual(compute_facet_counts(state)['total'], filter_products(**state.filter_kwargs()).count())
+
+    def test_query_count_does_not_grow_with_facet_values(self):
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            compute_facet_counts(FilterState(tag_query='gift'))
+            first = len(statements)
+            for index in range(10):
+                self.session.add(Category(name=f'Extra {index}'))
+                self.session.add(Tag(name=f'extra {index}'))
+            self.session.commit()
+            statements.clear()
+            compute_facet_counts(FilterState(tag_query='gift'))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(len(statements), first)
+        self.assertLessEqual(first, 3)
+
+    def test_cached_per_normalized_state(self):
+        facets = get_facet_counts(FilterState(name_query='Phone  ', tag_query='Gift'))
+
+        self.assertEqual(cache.get(FilterState(name_query='phone', tag_query='gift').cache_key()), facets)
+        self.assertNotEqual(FilterState(name_query='phone').cache_key(), FilterState(tag_query='phone').cache_key())
+
+    def test_state_from_args(self):
+        state = FilterState.from_args({'category_id': 'x', 'price_band': '1-2', 'on_sale': '1',
+                                       'include_out_of_stock': '1', 'name_query': '  '})
+
+        self.assertEqual(state.filter_kwargs(), {'category_query': None, 'name_query': None, 'tag_query': None,
+                                                 'price_band': None, 'on_sale': True, 'in_stock': False})
+        self.assertEqual(FilterState.from_args({'category_id': '3', 'price_band': '0-1000'}).filter_kwargs()
+                         ['price_band'], '0-1000')
+
+    def test_filter_page_renders_counts(self):
+        response = self.client.get(f'/filter?category_id={self.electronics.id}&price_band=1000-2500')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Charger', response.data)
+        self.assertNotIn(b'Phone Case', response.data)
+        self.assertIn(b'Home (1)', response.data)
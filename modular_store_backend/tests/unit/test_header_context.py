@@ -0,0 +1,110 @@
+# /modular_store_backend/tests/unit/test_header_context.py
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from flask_login import login_user
+from sqlalchemy import insert
+
+from modular_store_backend.modules.carts.utils import add_to_cart, clear_cart
+from modular_store_backend.modules.db.models import Product, Cart, Notification
+from modular_store_backend.modules.header_context import get_header_context, invalidate_header_context
+from modular_store_backend.modules.retention import RetentionPolicy, apply_retention_policy
+from modular_store_backend.tests.base_test import BaseTest
+from modular_store_backend.tests.util import create_user
+
+
+class TestHeaderContext(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass(init_login_manager=True, define_load_user=True)
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user(self)
+        self.product = Product(samplename="Test Product", price=1000, stock=10)
+        self.session.add(self.product)
+        self.session.commit()
+
+    def test_anonymous_user_gets_empty_context(self):
+        with self.app.test_request_context():
+            header_context = get_header_context()
+            self.assertEqual(header_context['total_items'], 0)
+            self.assertEqual(header_context['mini_cart_items'], [])
+            self.assertEqual(header_context['unread_notifications_count'], 0)
+
+    def test_context_is_built_once_and_cached(self):
+        self.session.add(Cart(user_id=self.user.id, product_id=self.product.id, quantity=2, price=1000))
+        self.session.add(Notification(user_id=self.user.id, message="Hello"))
+        self.session.commit()
+
+        with self.app.test_request_context():
+            login_user(self.user)
+            header_context = get_header_context()
+            self.assertEqual(header_context['total_items'], 2)
+            self.assertEqual(header_context['total_amount'], 2000)
+            self.assertEqual(header_context['mini_cart_items'][0]['name'], "Test Product")
+            self.assertEqual(header_context['unread_notifications_count'], 1)
+
+            with patch('modular_store_backend.modules.header_context.build_header_context') as mock_build:
+                self.assertEqual(get_header_context(), header_context)
+                mock_build.assert_not_called()
+
+    def test_invalidate_header_context(self):
+        with self.app.test_request_context():
+            login_user(self.user)
+            self.assertEqual(get_header_context()['unread_notifications_count'], 0)
+
+            # A bulk write skips the session events
+            self.session.execute(insert(Notification).values(user_id=self.user.id, message="Hello", read=False))
+            self.session.commit()
+            self.assertEqual(get_header_context()['unread_notifications_count'], 0)
+
+            invalidate_header_context(self.user.id)
+            self.assertEqual(get_header_context()['unread_notifications_count'], 1)
+
+    def test_orm_commits_invalidate_context(self):
+        notification = Notification(user_id=self.user.id, message="Hello")
+        with self.app.test_request_context():
+            login_user(self.user)
+            self.assertEqual(get_header_context()['unread_notifications_count'], 0)
+
+            # The writes of the admin views go through the session like these
+            self.session.add(notification)
+            self.session.commit()
+            self.assertEqual(get_header_context()['unread_notifications_count'], 1)
+
+            notification.read = True
+            self.session.rollback()
+            self.assertEqual(get_header_context()['unread_notifications_count'], 1)
+
+            self.session.delete(notification)
+            self.session.commit()
+            self.assertEqual(get_header_context()['unread_notifications_count'], 0)
+
+    def test_retention_deletes_invalidate_context(self):
+        self.session.add(Notification(user_id=self.user.id, message="Hello",
+                                      created_at=datetime.utcnow() - timedelta(days=100)))
+        self.session.commit()
+        with self.app.test_request_context():
+            login_user(self.user)
+            self.assertEqual(get_header_context()['unread_notifications_count'], 1)
+
+            report = apply_retention_policy('notifications', RetentionPolicy(max_age_days=30))
+            self.assertEqual(report.deleted, 1)
+            self.assertEqual(get_header_context()['unread_notifications_count'], 0)
+
+    def test_cart_mutations_invalidate_context(self):
+        with self.app.test_request_context():
+            login_user(self.user)
+            self.assertEqual(get_header_context()['total_items'], 0)
+
+            add_to_cart(self.product, 3, {})
+            self.assertEqual(get_header_context()['total_items'], 3)
+
+            clear_cart()
+            self.assertEqual(get_header_context()['total_items'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# /modular_store_backend/tests/unit/test_identity_cache.py
+import unittest
+from unittest.mock import patch
+
+from flask_login import login_user
+from sqlalchemy.orm import Session
+
+from modular_store_backend.modules.cache import cache
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import User
+from modular_store_backend.modules.identity_cache import (
+    load_cached_user, bump_user_version, get_user_version, get_identity_cache_stats, _identity_key
+)
+from modular_store_backend.modules.profile.utils import handle_change_language
+from modular_store_backend.tests.base_test import BaseTest
+from modular_store_backend.tests.util import create_user
+
+
+class TestIdentityCache(BaseTest):
+    def test_second_load_is_served_from_cache(self):
+        user = create_user(self)
+        user_id = user.id
+        self.session.remove()
+
+        stats_before = get_identity_cache_stats()
+        first = load_cached_user(user_id)
+        self.session.remove()
+
+        with patch.object(self.session, 'get') as mock_get:
+            second = load_cached_user(user_id)
+            mock_get.assert_not_called()
+
+        self.assertEqual(first.username, second.username)
+        self.assertIn(second, self.session)  # attached, lazy loads and commits keep working
+        stats_after = get_identity_cache_stats()
+        self.assertEqual(stats_after['db_loads'] - stats_before['db_loads'], 1)
+        self.assertEqual(stats_after['hits'] - stats_before['hits'], 1)
+
+    def test_bumped_version_reloads_from_db(self):
+        user = create_user(self, username='before')
+        load_cached_user(user.id)
+        version = get_user_version(user.id)
+
+        self.session.execute(user.__table__.update().where(user.__table__.c.id == user.id)
+                             .values(username='after'))
+        bump_user_version(user.id)
+        self.session.commit()
+
+        self.assertEqual(get_user_version(user.id), version + 1)
+        self.assertEqual(load_cached_user(user.id).username, 'after')
+
+    def test_profile_change_bumps_version(self):
+        user = create_user(self, language='en')
+        load_cached_user(user.id)
+        version = get_user_version(user.id)
+
+        with self.app.test_request_context(data={'language': 'ru'}):
+            login_user(user)
+            handle_change_language()
+
+        self.assertGreater(get_user_version(user.id), version)
+        self.session.remove()
+        self.assertEqual(load_cached_user(user.id).language, 'ru')
+
+    def test_rolled_back_write_keeps_the_version(self):
+        user = create_user(self)
+        load_cached_user(user.id)
+        version = get_user_version(user.id)
+
+        user.is_admin = True
+        self.session.flush()
+        self.session.rollback()
+
+        self.assertEqual(get_user_version(user.id), version)
+        self.assertFalse(load_cached_user(user.id).is_admin)
+
+    def test_writes_of_other_workers_are_seen(self):
+        user = create_user(self, is_admin=True)
+        user_id = user.id
+        load_cached_user(user_id)
+        stale = cache.get(_identity_key(user_id))
+        self.session.remove()
+
+        with Session(db.engine) as other_worker:
+            other_worker.get(User, user_id).is_admin = False
+            other_worker.commit()
+        cache.set(_identity_key(user_id), stale)  # the cache of this worker was not told
+
+        self.assertFalse(load_cached_user(user_id).is_admin)
+
+    def test_missing_user(self):
+        self.assertIsNone(load_cached_user(9999))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# /modular_store_backend/tests/unit/test_index_advisor.py
+import os
+import tempfile
+import unittest
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, text
+
+from modular_store_backend.modules.db.database import db, Base
+from modular_store_backend.modules.db.index_advisor import advise_indexes, find_full_scans
+from modular_store_backend.modules.db.models import Product, Notification
+from modular_store_backend.tests.base_test import BaseTest
+from modular_store_backend.tests.util import create_user
+
+
+class TestIndexAdvisor(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass(init_login_manager=False)
+
+    def test_hot_path_indexes_are_created(self):
+        indexes = {index['name'] for index in inspect(db.engine).get_indexes('notifications')}
+        self.assertIn('ix_notifications_user_id_read', indexes)
+
+    def test_find_full_scans(self):
+        statement = "SELECT * FROM products AS products_1 JOIN reviews ON reviews.product_id = products_1.id"
+        plan = ['SCAN products_1', 'SEARCH reviews USING INDEX ix_reviews_product_id_date (product_id=?)',
+                'SCAN reviews USING COVERING INDEX ix_reviews_product_id_date', 'SCAN CONSTANT ROW', 'SCAN anon_1']
+
+        self.assertEqual(find_full_scans(plan, statement, {'products', 'reviews'}), ['products'])
+
+    def test_advise_indexes_reports_scans_per_endpoint(self):
+        user = create_user(self)
+        for index in range(3):
+            self.session.add(Product(samplename=f'Product {index}', price=10, stock=5))
+            self.session.add(Notification(user_id=user.id, message='Hello'))
+        self.session.commit()
+
+        findings = advise_indexes(self.app, user_id=user.id)
+
+        scanned = {(finding['endpoint'], finding['table']) for finding in findings}
+        self.assertIn(('main.index', 'categories'), scanned)  # the sidebar lists every category
+        # The product lists load their page only, through the catalog and search indexes
+        self.assertNotIn(('main.index', 'products'), scanned)
+        self.assertNotIn(('main.search_route', 'products'), scanned)
+        self.assertNotIn('notifications', {table for _, table in scanned})
+        self.assertNotIn('wishlists', {table for _, table in scanned})
+        self.assertEqual(advise_indexes(self.app, user_id=user.id, min_rows=1000), [])
+
+
+class TestHotPathIndexMigration(unittest.TestCase):
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.url = f"sqlite:///{os.path.join(self.db_dir, 'migrate.db')}"
+        self.engine = create_engine(self.url)
+        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:  # a database created before the indexes were declared
+            connection.execute(text("DROP INDEX ix_notifications_user_id_read"))
+        self.config = Config('alembic.ini')
+        self.config.set_main_option('sqlalchemy.url', self.url)
+
+    def tearDown(self):
+        self.engine.dispose()
+        for name in os.listdir(self.db_dir):
+            os.remove(os.path.join(self.db_dir, name))
+        os.rmdir(self.db_dir)
+
+    def index_names(self):
+        return {index['name'] for index in inspect(self.engine).get_indexes('notifications')}
+
+    def test_upgrade_and_downgrade(self):
+        command.upgrade(self.config, 'head')
+        self.assertIn('ix_notifications_user_id_read', self.index_names())
+
+        command.downgrade(self.config, 'base')
+        self.assertNotIn('ix_notifications_user_id_read', self.index_names())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# /modular_store_backend/tests/unit/test_logger.py
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from sqlalchemy import create_engine, func, select
+
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import RequestLog
+from modular_store_backend.modules.logger import RequestLogWriter, DatabaseLogger
+from modular_store_backend.tests.base_test import BaseTest
+
+
+def make_record(endpoint: str = 'main.index') -> dict:
+    return {'user_id': None, 'ip_address': '127.0.0.1', 'endpoint': endpoint, 'method': 'GET',
+            'status_code': 200, 'execution_time': 0.01, 'timestamp': datetime.utcnow()}
+
+
+class TestRequestLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        self.db_file.close()
+        self.engine = create_engine(f'sqlite:///{self.db_file.name}')
+        RequestLog.__table__.create(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.db_file.name)
+
+    def count_logs(self) -> int:
+        with self.engine.connect() as connection:
+            return connection.execute(select(func.count()).select_from(RequestLog)).scalar_one()
+
+    def test_background_writer_batches_and_flushes_on_stop(self):
+        writer = RequestLogWriter(batch_size=10, flush_interval=0.05)
+        writer.start(self.engine)
+        for _ in range(25):
+            self.assertTrue(writer.submit(make_record()))
+        writer.stop()
+
+        self.assertEqual(self.count_logs(), 25)
+        metrics = writer.get_metrics()
+        self.assertEqual(metrics['queued'], 25)
+        self.assertEqual(metrics['written'], 25)
+        self.assertEqual(metrics['queue_size'], 0)
+
+    def test_full_queue_drops_records(self):
+        writer = RequestLogWriter(max_queue_size=2)
+        writer._engine = self.engine  # not started, nothing drains the queue
+
+        results = [writer.submit(make_record()) for _ in range(3)]
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(writer.get_metrics()['dropped'], 1)
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(self.count_logs(), 2)
+
+    def test_synchronous_writer_writes_immediately(self):
+        writer = RequestLogWriter(synchronous=True)
+        writer.start(self.engine)
+        writer.submit(make_record())
+        self.assertEqual(self.count_logs(), 1)
+
+    def test_unknown_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            RequestLogWriter(overflow_policy='explode')
+
+
+class TestDatabaseLogger(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass(init_login_manager=False)
+
+    def test_requests_are_logged(self):
+        self.client.get('/')
+        self.assertEqual(self.session.query(RequestLog).filter_by(endpoint='main.index').count(), 1)
+
+    def test_static_files_are_not_logged(self):
+        self.client.get('/static/robots.txt')
+        self.assertEqual(self.session.query(RequestLog).filter_by(endpoint='static').count(), 0)
+
+    def test_should_log_respects_sample_rate(self):
+        database_logger = DatabaseLogger()
+        database_logger.excluded_endpoints = set()
+        database_logger.excluded_status_codes = {429}
+
+        database_logger.sample_rate = 0.0
+        self.assertFalse(database_logger.should_log('main.index', 200))
+        database_logger.sample_rate = 1.0
+        self.assertTrue(database_logger.should_log('main.index', 200))
+        self.assertFalse(database_logger.should_log('main.index', 429))
+
+    def test_in_memory_database_is_written_synchronously(self):
+        self.assertIn(db.engine.url.database, (None, '', ':memory:'))
+        self.assertTrue(self.app.extensions['request_log_writer'].synchronous)
+
+
+if __name__ == '__main__':
+    unittest.main()
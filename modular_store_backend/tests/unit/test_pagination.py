@@ -0,0 +1,120 @@
+# /modular_store_backend/tests/unit/test_pagination.py
+import re
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy import event
+
+from modular_store_backend.modules.catalog_index import catalog_index
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Category, Product
+from modular_store_backend.modules.filter.pagination import decode_cursor, encode_cursor, paginate_listing
+from modular_store_backend.modules.filter.utils import filter_products, select_products
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestPagination(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass(init_login_manager=True, define_load_user=True)
+
+    def setUp(self):
+        super().setUp()
+        self.category = Category(name='Kitchen')
+        self.session.add(self.category)
+        self.session.commit()
+        # Ties, a product without a price and one on sale, so the keyset has to fall back on the ID
+        prices = [500, 300, 500, None, 800, 300, 500, 100, 900, 300, 700]
+        for index, price in enumerate(prices):
+            self.session.add(Product(samplename=f'Product {index}', price=price, stock=5, category_id=self.category.id,
+                                     onSale=1 if index == 4 else 0, onSalePrice=200 if index == 4 else None))
+        self.session.commit()
+        self.per_page = self.app.config['PER_PAGE']
+        self.app.config['PER_PAGE'] = 3
+
+    def tearDown(self):
+        self.app.config['PER_PAGE'] = self.per_page
+        catalog_index.ready = True
+        super().tearDown()
+
+    def walk(self, products, sort_by=None, **kwargs):
+        """Follow the next links to the end, then the previous links back to the start."""
+        forward, pages = [], []
+        listing = paginate_listing(products(), 1, sort_by=sort_by, **kwargs)
+        while True:
+            pages.append(listing.page)
+            forward.extend(product.id for product in listing.items)
+            if not listing.next_cursor:
+                break
+            listing = paginate_listing(products(), 1, listing.next_cursor, sort_by=sort_by, **kwargs)
+        backward = [product.id for product in listing.items]
+        while listing.prev_cursor:
+            listing = paginate_listing(products(), 1, listing.prev_cursor, sort_by=sort_by, **kwargs)
+            backward = [product.id for product in listing.items] + backward
+        self.assertEqual(listing.page, 1)
+        self.assertEqual(pages, [1, 2, 3, 4])
+        return forward, backward
+
+    def test_query_keyset_walks_the_sort_order(self):
+        catalog_index.ready = False
+        for sort_by in (None, 'price_asc', 'price_desc', 'rating'):
+            expected = [product.id for product in filter_products(sort_by=sort_by).order_by(Product.id)]
+            forward, backward = self.walk(lambda: filter_products(sort_by=sort_by), sort_by)
+            self.assertEqual(forward, expected, sort_by)
+            self.assertEqual(backward, expected, sort_by)
+
+    def test_keyset_pages_skip_the_offset(self):
+        catalog_index.ready = False
+        first = paginate_listing(filter_products(sort_by='price_asc'), 1, sort_by='price_asc')
+        statements = []
+
+        def record(*args):
+            statements.append((args[2], args[3]))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            paginate_listing(filter_products(sort_by='price_asc'), 1, first.next_cursor, sort_by='price_asc')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        page_query, parameters = next((statement, parameters) for statement, parameters in statements
+                                      if 'LIMIT' in statement)
+        self.assertIn('products.id >', page_query)
+        self.assertEqual(parameters[-1], 0)  # SQLite always renders an OFFSET with the LIMIT
+
+    def test_selection_walks_the_index_order(self):
+        for sort_by in (None, 'price_desc'):
+            expected = select_products(sort_by=sort_by).product_ids.tolist()
+            forward, backward = self.walk(lambda: select_products(sort_by=sort_by), sort_by)
+            self.assertEqual(forward, expected)
+            self.assertEqual(backward, expected)
+
+    def test_offset_pages_for_ranked_queries(self):
+        catalog_index.ready = False
+        listing = paginate_listing(filter_products(), 2, keyset=False)
+        self.assertEqual(listing.page, 2)
+        self.assertEqual(paginate_listing(filter_products(), 1, listing.next_cursor, keyset=False).page, 3)
+
+    def test_totals_are_cached_per_filter(self):
+        catalog_index.ready = False
+        self.assertEqual(paginate_listing(filter_products(), count_key='listing_count:all').total, 11)
+        self.session.add(Product(samplename='Late', price=100, stock=5))
+        self.session.commit()
+
+        self.assertEqual(paginate_listing(filter_products(), count_key='listing_count:all').total, 11)
+        self.assertEqual(paginate_listing(filter_products()).total, 12)
+
+    def test_malformed_cursors_are_ignored(self):
+        self.assertEqual(decode_cursor(encode_cursor({'page': 2, 'dir': 'next', 'id': 4, 'key': 1.5}))['key'], 1.5)
+        for token in ('', '!!', encode_cursor({'page': 0, 'dir': 'next', 'id': 1, 'key': None}),
+                      encode_cursor({'page': 2, 'dir': 'up', 'id': 1, 'key': None}), encode_cursor(['page'])):
+            self.assertIsNone(decode_cursor(token))
+        self.assertEqual(paginate_listing(select_products(), 2, cursor='garbage').page, 2)
+
+    def test_links_keep_the_filter(self):
+        response = self.client.get(f'/filter?category_id={self.category.id}&sort_by=price_asc')
+        next_link = re.search(r'class="pagination-link next-link" href="([^"]+)"', response.data.decode()).group(1)
+        args = parse_qs(urlparse(next_link.replace('&amp;', '&')).query)
+
+        self.assertEqual(args['sort_by'], ['price_asc'])
+        self.assertEqual(args['category_id'], [str(self.category.id)])
+        response = self.client.get(next_link.replace('&amp;', '&'))
+        self.assertIn(b'Showing 4 - 6 of 11', response.data)
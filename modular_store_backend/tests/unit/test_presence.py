@@ -0,0 +1,56 @@
+# /modular_store_backend/tests/unit/test_presence.py
+import unittest
+from datetime import datetime, timedelta
+
+from modular_store_backend.modules.db.models import User
+from modular_store_backend.modules.presence import presence_tracker, PresenceTracker
+from modular_store_backend.tests.base_test import BaseTest
+from modular_store_backend.tests.util import create_user
+
+
+class TestPresenceTracker(BaseTest):
+    def test_touch_is_visible_before_flush(self):
+        user = create_user(self)
+        old_timestamp = datetime.utcnow() - timedelta(hours=1)
+        user.last_seen = old_timestamp
+        self.session.commit()
+
+        presence_tracker.touch(user.id)
+
+        self.assertGreater(user.last_active, old_timestamp)
+        self.assertTrue(user.is_online())
+        self.assertFalse(user.is_session_expired(timedelta(minutes=15)))
+        self.assertEqual(presence_tracker.pending_count(), 1)
+
+    def test_flush_writes_last_seen_in_bulk(self):
+        user1 = create_user(self)
+        user2 = create_user(self)
+        seen_at = datetime.utcnow() + timedelta(minutes=1)
+        presence_tracker.touch(user1.id, seen_at)
+        presence_tracker.touch(user2.id, seen_at)
+
+        self.assertEqual(presence_tracker.flush(), 2)
+        self.assertEqual(presence_tracker.pending_count(), 0)
+        self.assertEqual(presence_tracker.flush(), 0)
+
+        self.session.expire_all()
+        self.assertEqual(self.session.get(User, user1.id).last_seen, seen_at)
+        self.assertEqual(self.session.get(User, user2.id).last_seen, seen_at)
+
+    def test_stale_entries_are_pruned_after_flush(self):
+        tracker = PresenceTracker(retention=timedelta(minutes=5))
+        user = create_user(self)
+        tracker.touch(user.id, datetime.utcnow() - timedelta(minutes=10))
+
+        tracker.flush()
+
+        self.assertIsNone(tracker.last_seen(user.id))
+
+    def test_user_without_activity_is_expired(self):
+        user = User(id=12345, username='ghost', password='x', last_seen=None)
+        self.assertTrue(user.is_session_expired(timedelta(minutes=15)))
+        self.assertFalse(user.is_online())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# /modular_store_backend/tests/unit/test_product_search.py
+import unittest
+
+from sqlalchemy import text
+
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Category, Product, Tag
+from modular_store_backend.modules.db.product_search import match_expression, rebuild_product_search
+from modular_store_backend.modules.filter.utils import filter_products, search_snippets
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestProductSearch(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.category = Category(name='Outdoor Gear')
+        self.tag = Tag(name='waterproof')
+        self.session.add_all([self.category, self.tag])
+        self.session.commit()
+
+    def add_product(self, name, description='', tags=(), **kwargs):
+        product = Product(samplename=name, description=description, category_id=self.category.id, stock=5,
+                          price=1000, **kwargs)
+        product.tags.extend(tags)
+        self.session.add(product)
+        self.session.commit()
+        return product
+
+    def search(self, name_query, **kwargs):
+        return [product.samplename for product in filter_products(name_query=name_query, **kwargs)]
+
+    def test_matches_every_indexed_field(self):
+        self.add_product('Trail Backpack', 'Light pack for long hikes')
+        self.add_product('Rain Jacket', 'Keeps you dry', tags=[self.tag])
+        self.add_product('Coffee Mug', 'Ceramic')
+
+        self.assertEqual(self.search('backpack'), ['Trail Backpack'])
+        self.assertEqual(self.search('hikes'), ['Trail Backpack'])
+        self.assertEqual(self.search('waterproof'), ['Rain Jacket'])
+        self.assertEqual(len(self.search('outdoor')), 3)
+        self.assertEqual(self.search('nothing like this'), [])
+
+    def test_prefix_case_and_diacritics(self):
+        self.add_product('Café Crème Grinder')
+
+        self.assertEqual(self.search('GRIND'), ['Café Crème Grinder'])
+        self.assertEqual(self.search('cafe cr'), ['Café Crème Grinder'])
+
+    def test_name_matches_rank_first(self):
+        self.add_product('Stand Mixer', 'A kitchen helper with a lamp light')
+        self.add_product('Desk Lamp', 'Bright')
+
+        self.assertEqual(self.search('lamp'), ['Desk Lamp', 'Stand Mixer'])
+        # An explicit sort still wins, the rank only breaks ties
+        self.assertEqual(self.search('lamp', sort_by='price_asc'), ['Desk Lamp', 'Stand Mixer'])
+
+    def test_triggers_keep_the_index_in_sync(self):
+        product = self.add_product('Old Name', tags=[self.tag])
+
+        product.samplename = 'Fresh Name'
+        self.session.commit()
+        self.assertEqual(self.search('fresh'), ['Fresh Name'])
+        self.assertEqual(self.search('old'), [])
+
+        self.tag.name = 'windproof'
+        self.category.name = 'Camping'
+        self.session.commit()
+        self.assertEqual(self.search('windproof camping'), ['Fresh Name'])
+
+        product.tags.remove(self.tag)
+        self.session.commit()
+        self.assertEqual(self.search('windproof'), [])
+
+        self.session.delete(product)
+        self.session.commit()
+        self.assertEqual(self.session.execute(text("SELECT count(*) FROM product_search")).scalar(), 0)
+
+    def test_stock_updates_leave_the_index_alone(self):
+        product = self.add_product('Tent')
+        changes = self.session.execute(text("SELECT total_changes()")).scalar()
+
+        product.stock = 3
+        self.session.commit()
+
+        # The product row and the catalog version (modules/filter/catalog_metadata.py), no search index row
+        self.assertEqual(self.session.execute(text("SELECT total_changes()")).scalar(), changes + 2)
+
+    def test_rebuild(self):
+        self.add_product('Sleeping Bag')
+        self.session.execute(text("DELETE FROM product_search"))
+
+        with db.engine.begin() as connection:
+            self.assertEqual(rebuild_product_search(connection), 1)
+        self.assertEqual(self.search('sleeping'), ['Sleeping Bag'])
+
+    def test_snippets_highlight_and_escape(self):
+        product = self.add_product('Lantern', 'A <b>bright</b> lantern for the tent, bright enough to read')
+
+        snippets = search_snippets([product], 'bright')
+
+        self.assertEqual(str(snippets[product.id]), 'A &lt;b&gt;<mark>bright</mark>&lt;/b&gt; lantern for the tent, '
+                                                    '<mark>bright</mark> enough to read')
+        self.assertEqual(search_snippets([product], None), {})
+
+
+class TestMatchExpression(unittest.TestCase):
+
+    def test_words_become_quoted_prefix_terms(self):
+        self.assertEqual(match_expression('Rain  jacket'), '"rain"* "jacket"*')
+
+    def test_fts_syntax_is_not_interpreted(self):
+        self.assertEqual(match_expression('name:"tent" OR NEAR(a b)'), '"name"* "tent"* "or"* "near"* "a"* "b"*')
+        self.assertIsNone(match_expression('"*" - ()'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# /modular_store_backend/tests/unit/test_promotions.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Product, ProductPromotion
+from modular_store_backend.modules.filter.promotions import compute_promotion_schedule, get_promoted_product_ids
+from modular_store_backend.modules.filter.utils import get_promoted_products, select_products
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestPromotions(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass(init_login_manager=True, define_load_user=True)
+
+    def setUp(self):
+        super().setUp()
+        self.now = datetime(2026, 6, 1, 12, 0)
+        self.running = self.add_product('Running')
+        self.upcoming = self.add_product('Upcoming')
+        self.sold_out = self.add_product('Sold Out', stock=0)
+        self.promote(self.running, self.now - timedelta(days=1), self.now + timedelta(hours=2))
+        self.promote(self.upcoming, self.now + timedelta(hours=1), self.now + timedelta(days=3))
+        self.promote(self.sold_out, self.now - timedelta(days=1), self.now + timedelta(days=1))
+
+    def add_product(self, name, stock=5):
+        product = Product(samplename=name, price=1000, stock=stock)
+        self.session.add(product)
+        self.session.commit()
+        return product
+
+    def promote(self, product, start_date, end_date):
+        self.session.add(ProductPromotion(product_id=product.id, start_date=start_date, end_date=end_date,
+                                          description=f'{product.samplename} promotion'))
+        self.session.commit()
+
+    def count_promotion_queries(self, function):
+        statements = []
+
+        def record(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            function()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return len([statement for statement in statements if 'product_promotions' in statement])
+
+    def test_schedule_is_valid_until_the_next_boundary(self):
+        schedule = compute_promotion_schedule(self.now)
+        self.assertEqual(schedule['product_ids'], [self.running.id, self.sold_out.id])
+        self.assertEqual(schedule['valid_until'], self.now + timedelta(hours=1))
+
+        later = self.now + timedelta(hours=2)  # end dates are inclusive
+        self.assertEqual(compute_promotion_schedule(later)['product_ids'],
+                         [self.running.id, self.upcoming.id, self.sold_out.id])
+        self.assertEqual(compute_promotion_schedule(later)['valid_until'], later + timedelta(microseconds=1))
+        self.assertIsNone(compute_promotion_schedule(self.now + timedelta(days=4))['valid_until'])
+
+    def test_cached_schedule_follows_the_clock(self):
+        self.assertEqual(get_promoted_product_ids(self.now), [self.running.id, self.sold_out.id])
+        self.assertEqual(self.count_promotion_queries(
+            lambda: get_promoted_product_ids(self.now + timedelta(minutes=59))), 0)
+
+        self.assertEqual(get_promoted_product_ids(self.now + timedelta(hours=1)),
+                         [self.running.id, self.upcoming.id, self.sold_out.id])
+        self.assertEqual(get_promoted_product_ids(self.now + timedelta(hours=3)), [self.upcoming.id, self.sold_out.id])
+
+    def test_promotion_writes_drop_the_schedule(self):
+        current = [product.id for product in get_promoted_products()]
+        late = self.add_product('Late')
+        self.assertEqual([product.id for product in get_promoted_products()], current)  # products do not invalidate
+
+        self.promote(late, datetime.now() - timedelta(minutes=1), datetime.now() + timedelta(days=1))
+        self.assertIn(late.id, [product.id for product in get_promoted_products()])
+
+    def test_products_out_of_stock_or_outside_the_selection_are_skipped(self):
+        self.promote(self.running, datetime.now() - timedelta(days=1), datetime.now() + timedelta(days=1))
+        self.promote(self.sold_out, datetime.now() - timedelta(days=1), datetime.now() + timedelta(days=1))
+
+        self.assertEqual(get_promoted_products(), [self.running])
+        self.assertEqual(get_promoted_products(select_products()), [self.running])
+        self.assertEqual(get_promoted_products(select_products(price_band='2500-5000')), [])
+        self.assertEqual(get_promoted_products(db.session.query(Product)), [self.running, self.sold_out])
+
+    def test_listing_pages_skip_promotion_queries_in_steady_state(self):
+        self.promote(self.running, datetime.now() - timedelta(days=1), datetime.now() + timedelta(days=1))
+        self.client.get('/')
+        for url in ('/', '/filter', '/search?query=Running'):
+            self.assertEqual(self.count_promotion_queries(lambda: self.client.get(url)), 0, url)
+        self.assertIn(b'Running', self.client.get('/filter').data)
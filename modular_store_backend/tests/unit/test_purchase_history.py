@@ -12,6 +12,7 @@ from modular_store_backend.modules.purchase_history.utils import (
     generate_tracking_number,
     create_purchase_items
 )
+from modular_store_backend.modules.stock import OutOfStockError
 
 
 class TestPurchaseHistoryUtils(unittest.TestCase):
@@ -80,6 +81,7 @@ class TestPurchaseHistoryUtils(unittest.TestCase):
             Address(id=1, address_line1='123 Test St', city='Test City', state='TS', zip_code='12345',
                     country='Test Country')
         ]
+        self.mock_db_session.execute.return_value = Mock(rowcount=1)  # stock available
         cart_items = [Cart(price=1000, quantity=2)]
 
         result = save_purchase_history(self.mock_db_session, cart_items, 1, 1, 'credit_card', 'payment123')
@@ -99,6 +101,24 @@ class TestPurchaseHistoryUtils(unittest.TestCase):
             'Order Confirmation',
             'Thank you for your order! Your order is being processed.'
         )
+        self.mock_db_session.commit.assert_called_once()
+        self.mock_db_session.rollback.assert_not_called()
+
+    @patch('modular_store_backend.modules.purchase_history.utils.current_user', new_callable=Mock)
+    @patch('modular_store_backend.modules.purchase_history.utils.send_email')
+    def test_save_purchase_history_out_of_stock(self, mock_send_email, mock_current_user):
+        mock_current_user.configure_mock(**self.mock_current_user.__dict__)
+        self.mock_db_session.get.side_effect = [ShippingMethod(id=1, name='Standard', price=500), Address(id=1)]
+        self.mock_db_session.execute.return_value = Mock(rowcount=0)  # sold out
+        cart_items = [Cart(product_id=1, price=1000, quantity=2)]
+
+        with self.assertRaises(OutOfStockError):
+            save_purchase_history(self.mock_db_session, cart_items, 1, 1, 'credit_card', 'payment123')
+
+        self.mock_db_session.add.assert_not_called()
+        self.mock_db_session.commit.assert_not_called()
+        self.mock_db_session.rollback.assert_called_once()
+        mock_send_email.assert_not_called()
 
     def test_create_purchase_items(self):
         cart_items = [
@@ -107,8 +127,12 @@ class TestPurchaseHistoryUtils(unittest.TestCase):
         ]
         create_purchase_items(self.mock_db_session, 1, cart_items)
 
-        self.assertEqual(self.mock_db_session.add.call_count, 2)
-        self.mock_db_session.flush.assert_called_once()
+        self.mock_db_session.execute.assert_called_once()
+        self.assertEqual(self.mock_db_session.execute.call_args.args[1], [
+            {'purchase_id': 1, 'product_id': 1, 'quantity': 2, 'price': 1000},
+            {'purchase_id': 1, 'product_id': 2, 'quantity': 1, 'price': 1500},
+        ])
+        self.mock_db_session.add.assert_not_called()
 
 
 if __name__ == '__main__':
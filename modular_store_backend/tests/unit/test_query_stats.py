@@ -0,0 +1,84 @@
+# /modular_store_backend/tests/unit/test_query_stats.py
+import json
+import unittest
+from datetime import datetime, timedelta
+
+from flask import g
+from sqlalchemy import text
+
+from modular_store_backend.modules.db.models import RequestLog
+from modular_store_backend.modules.query_stats import (
+    statement_shape, query_instrumentation, get_worst_endpoints, RequestQueryStats
+)
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestQueryStats(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass(init_login_manager=False)
+
+    def tearDown(self):
+        query_instrumentation.slow_query_log.clear()
+        super().tearDown()
+
+    def test_statement_shape(self):
+        self.assertEqual(statement_shape("SELECT *\n  FROM products WHERE id IN (?, ?, ?) LIMIT 10"),
+                         "SELECT * FROM products WHERE id IN (?) LIMIT N")
+        self.assertEqual(statement_shape("SELECT * FROM products WHERE id IN (?)"),
+                         "SELECT * FROM products WHERE id IN (?)")
+
+    def test_request_log_stores_query_stats(self):
+        self.client.get('/')
+
+        log = self.session.query(RequestLog).filter_by(endpoint='main.index').one()
+        self.assertGreater(log.query_count, 0)
+        self.assertGreater(log.db_time, 0)
+
+    def test_repeated_statements_are_flagged(self):
+        with self.app.test_request_context():
+            query_instrumentation.before_request()
+            for product_id in range(query_instrumentation.n_plus_one_threshold):
+                self.session.execute(text(f"SELECT avg(rating) FROM reviews WHERE product_id = {product_id}"))
+            self.session.execute(text("SELECT count(*) FROM products"))
+
+            fields = query_instrumentation.request_log_fields()
+            self.assertEqual(fields['query_count'], g.query_stats.count)
+            self.assertEqual(json.loads(fields['repeated_queries']),
+                             {'SELECT avg(rating) FROM reviews WHERE product_id = N':
+                              query_instrumentation.n_plus_one_threshold})
+
+    def test_no_repeated_statements(self):
+        stats = RequestQueryStats()
+        stats.record("SELECT 1", 0.001)
+        self.assertEqual(stats.repeated_shapes(2), {})
+
+    def test_slow_queries_are_logged(self):
+        threshold = query_instrumentation.slow_query_threshold
+        query_instrumentation.slow_query_threshold = 0.0
+        try:
+            self.session.execute(text("SELECT count(*) FROM users"))
+        finally:
+            query_instrumentation.slow_query_threshold = threshold
+
+        statements = [entry['statement'] for entry in query_instrumentation.slow_query_log.entries()]
+        self.assertIn("SELECT count(*) FROM users", statements)
+
+    def test_worst_endpoints_by_db_time(self):
+        now = datetime.utcnow()
+        for endpoint, db_time, timestamp in (('main.index', 0.01, now), ('main.index', 0.01, now),
+                                             ('main.product_page', 0.5, now),
+                                             ('filter.filter_route', 9.0, now - timedelta(days=2))):
+            self.session.add(RequestLog(ip_address='127.0.0.1', endpoint=endpoint, method='GET', status_code=200,
+                                        execution_time=1.0, timestamp=timestamp, query_count=3, db_time=db_time))
+        self.session.commit()
+
+        worst = get_worst_endpoints(now - timedelta(hours=1))
+
+        self.assertEqual([row['endpoint'] for row in worst], ['main.product_page', 'main.index'])
+        self.assertEqual(worst[1]['requests'], 2)
+        self.assertAlmostEqual(worst[1]['total_db_time'], 0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# /modular_store_backend/tests/unit/test_rankings.py
+from datetime import datetime, timedelta
+
+from modular_store_backend.modules.catalog_index import ProductSelection
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Product, Purchase, PurchaseItem, RankingEpoch, User, Wishlist
+from modular_store_backend.modules.filter.utils import filter_products, select_products
+from modular_store_backend.modules.rankings import EPOCH_NAME, REBASE_AFTER, fold_rankings, half_lives, \
+    ranking_recorder, rebuild_rankings
+from modular_store_backend.tests.base_test import BaseTest
+
+DAY = 86400.0
+LIVES = {'sales': 30 * DAY, 'views': 7 * DAY, 'trending': 2 * DAY}
+
+
+class TestRankings(BaseTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass(init_login_manager=True, define_load_user=True)
+
+    def setUp(self):
+        super().setUp()
+        self.now = datetime(2026, 6, 1, 12, 0)
+        self.products = [Product(samplename=f'Product {index}', price=1000, stock=5) for index in range(4)]
+        self.session.add_all(self.products)
+        self.session.commit()
+        self.ids = [product.id for product in self.products]
+        rebuild_rankings(LIVES, self.now)  # starts the epoch on the empty history
+
+    def scores(self, column):
+        return dict(db.session.query(Product.id, getattr(Product, column)))
+
+    def ranked(self, sort_by, column):
+        """IDs of the products with a score, best first, checking the catalog index against the SQL order."""
+        scores = self.scores(column)
+        expected = sorted((product_id for product_id, score in scores.items() if score), key=lambda i: -scores[i])
+        selection = select_products(sort_by=sort_by)
+        self.assertIsInstance(selection, ProductSelection)
+        self.assertEqual(selection.product_ids.tolist()[:len(expected)], expected)
+        # Products without a score tie, their SQL order is undefined
+        self.assertEqual([product.id for product in filter_products(sort_by=sort_by)][:len(expected)], expected)
+        return expected
+
+    def test_signals_fold_into_the_scores(self):
+        first, second, third, _ = self.ids
+        ranking_recorder.record(first, 'purchase', 2)
+        ranking_recorder.record(second, 'purchase')
+        for _ in range(3):
+            ranking_recorder.record(second, 'view')
+        ranking_recorder.record(third, 'wishlist')
+        ranking_recorder.record(third, 'cart', 2)
+
+        self.assertEqual(fold_rankings(LIVES, self.now), 3)
+        self.assertEqual(ranking_recorder.pending_count(), 0)
+        self.assertEqual(self.scores('sales_score')[first], 2.0)
+        self.assertEqual(self.scores('view_score')[second], 3.0)
+        self.assertEqual(self.scores('trending_score')[third], 6.0)
+        self.assertEqual(self.ranked('best_selling', 'sales_score'), [first, second])
+        self.assertEqual(self.ranked('most_viewed', 'view_score'), [second])
+        self.assertEqual(self.ranked('trending', 'trending_score'), [first, second, third])
+
+    def test_older_signals_weigh_less(self):
+        early, late = self.ids[:2]
+        ranking_recorder.record(early, 'purchase', 3)
+        fold_rankings(LIVES, self.now)
+        ranking_recorder.record(late, 'purchase')
+        fold_rankings(LIVES, self.now + timedelta(days=4))
+
+        # Two trending half-lives later a purchase counts 4 times as much, but not yet a sale (30 days)
+        trending = self.scores('trending_score')
+        self.assertAlmostEqual(trending[late] / trending[early], 4 / 3)
+        self.assertEqual(self.ranked('trending', 'trending_score'), [late, early])
+        self.assertEqual(self.ranked('best_selling', 'sales_score'), [early, late])
+
+    def test_rebase_keeps_the_order(self):
+        for index, product_id in enumerate(self.ids):
+            ranking_recorder.record(product_id, 'view', index + 1)
+        fold_rankings(LIVES, self.now)
+        self.assertEqual(self.ranked('trending', 'trending_score'), self.ids[::-1])
+
+        # The next signal comes after the epoch got too old: a tiny one, the order of the rest is kept
+        later = self.now + timedelta(seconds=REBASE_AFTER * LIVES['trending'] + 1)
+        ranking_recorder.record(self.ids[0], 'wishlist')
+        fold_rankings(LIVES, later)
+        self.assertEqual(db.session.get(RankingEpoch, EPOCH_NAME).epoch, later)
+        self.assertEqual(self.ranked('trending', 'trending_score'), [self.ids[0]] + self.ids[:0:-1])
+        self.assertAlmostEqual(self.scores('view_score')[self.ids[-1]],
+                               4 * 2 ** -((later - self.now).total_seconds() / LIVES['views']))
+
+    def test_failed_folds_keep_the_counts(self):
+        ranking_recorder.record(10 ** 6, 'view')
+        ranking_recorder.record(self.ids[0], 'view')
+        db.session.get(RankingEpoch, EPOCH_NAME).epoch = None  # NOT NULL fails the commit
+        with self.assertRaises(Exception):
+            fold_rankings(LIVES, self.now)
+        self.assertEqual(ranking_recorder.pending_count(), 2)
+        with self.assertRaises(ValueError):
+            ranking_recorder.record(self.ids[0], 'like')
+
+    def test_rebuild_reads_the_history(self):
+        user = self.create_user()
+        purchase = Purchase(user_id=user.id, date=self.now - timedelta(days=30), total_price=2000)
+        self.session.add(purchase)
+        self.session.flush()
+        self.session.add_all([PurchaseItem(purchase_id=purchase.id, product_id=self.ids[1], quantity=2, price=1000),
+                              Wishlist(user_id=user.id, product_id=self.ids[2])])
+        self.session.commit()
+
+        self.assertEqual(rebuild_rankings(LIVES, self.now), 2)
+        self.assertAlmostEqual(self.scores('sales_score')[self.ids[1]], 1.0)  # two sales, one half-life ago
+        self.assertEqual(self.scores('trending_score')[self.ids[2]], 2.0)
+        self.assertEqual(self.ranked('best_selling', 'sales_score'), [self.ids[1]])
+
+    def test_first_fold_counts_the_batch_once(self):
+        db.session.delete(db.session.get(RankingEpoch, EPOCH_NAME))
+        user = self.create_user()
+        purchase = Purchase(user_id=user.id, date=self.now, total_price=3000)
+        self.session.add(purchase)
+        self.session.flush()
+        self.session.add(PurchaseItem(purchase_id=purchase.id, product_id=self.ids[0], quantity=3, price=1000))
+        self.session.commit()
+        ranking_recorder.record(self.ids[0], 'purchase', 3)  # the same purchase, not folded yet
+
+        self.assertEqual(fold_rankings(LIVES, self.now), 1)
+        self.assertEqual(ranking_recorder.pending_count(), 0)
+        self.assertEqual(self.scores('sales_score')[self.ids[0]], 3.0)
+        self.assertEqual(db.session.get(RankingEpoch, EPOCH_NAME).epoch, self.now)
+
+    def test_pages_record_signals(self):
+        self.client.get(f'/products/{self.ids[3]}')
+        self.client.get(f'/products/{self.ids[3]}')
+        self.assertEqual(ranking_recorder.take(), {(self.ids[3], 'view'): 2})
+        self.assertEqual(half_lives({'RANKING_HALF_LIVES': {'views': 1}})['views'], DAY)
+
+        response = self.client.get('/filter?sort_by=most_viewed')
+        self.assertIn(b'value="trending"', response.data)
+
+    def create_user(self):
+        user = User(username='ranker', email='ranker@example.com', password='secret')
+        self.session.add(user)
+        self.session.commit()
+        return user
@@ -0,0 +1,96 @@
+# /modular_store_backend/tests/unit/test_ratings.py
+import unittest
+
+from sqlalchemy import delete
+
+from modular_store_backend.modules.db.models import Product, Review
+from modular_store_backend.modules.filter.sort_options import SortOptions
+from modular_store_backend.modules.reviews.ratings import recalculate_rating_aggregates
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestRatingAggregates(BaseTest):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.product = Product(samplename='Rated', price=1000, stock=5)
+        self.other = Product(samplename='Other', price=1000, stock=5)
+        self.session.add_all([self.product, self.other])
+        self.session.commit()
+
+    def add_review(self, product: Product, rating: int, user_id: int = 1) -> Review:
+        review = Review(user_id=user_id, product_id=product.id, rating=rating, moderated=True)
+        self.session.add(review)
+        self.session.commit()
+        return review
+
+    def assert_aggregates(self, product: Product, count: int, total: int, average: float) -> None:
+        self.session.refresh(product)
+        self.assertEqual(product.review_count, count)
+        self.assertEqual(product.rating_sum, total)
+        self.assertAlmostEqual(product.rating_avg, average)
+
+    def test_new_product_has_no_rating(self) -> None:
+        self.assert_aggregates(self.product, 0, 0, 0.0)
+        self.assertEqual(self.product.avg_rating, 0)
+
+    def test_adding_reviews_updates_aggregates(self) -> None:
+        self.add_review(self.product, 5)
+        self.add_review(self.product, 2, user_id=2)
+
+        self.assert_aggregates(self.product, 2, 7, 3.5)
+        self.assertAlmostEqual(self.product.avg_rating, 3.5)
+        self.assert_aggregates(self.other, 0, 0, 0.0)
+
+    def test_deleting_review_updates_aggregates(self) -> None:
+        self.add_review(self.product, 5)
+        review = self.add_review(self.product, 1, user_id=2)
+
+        self.session.delete(review)
+        self.session.commit()
+        self.assert_aggregates(self.product, 1, 5, 5.0)
+
+        self.session.delete(self.session.query(Review).one())
+        self.session.commit()
+        self.assert_aggregates(self.product, 0, 0, 0.0)
+
+    def test_editing_rating_and_moving_review(self) -> None:
+        review = self.add_review(self.product, 4)
+
+        review.rating = 2
+        self.session.commit()
+        self.assert_aggregates(self.product, 1, 2, 2.0)
+
+        review.product_id = self.other.id
+        self.session.commit()
+        self.assert_aggregates(self.product, 0, 0, 0.0)
+        self.assert_aggregates(self.other, 1, 2, 2.0)
+
+    def test_rollback_discards_aggregate_update(self) -> None:
+        self.session.add(Review(user_id=1, product_id=self.product.id, rating=5))
+        self.session.flush()
+        self.session.rollback()
+        self.assert_aggregates(self.product, 0, 0, 0.0)
+
+    def test_recalculate_repairs_drift(self) -> None:
+        self.add_review(self.product, 4)
+        self.add_review(self.product, 3, user_id=2)
+        # Bulk deletes bypass the ORM events
+        self.session.execute(delete(Review).where(Review.rating == 3))
+        self.session.commit()
+
+        self.assertEqual(recalculate_rating_aggregates(), 1)
+        self.assert_aggregates(self.product, 1, 4, 4.0)
+        self.assertEqual(recalculate_rating_aggregates(), 0)
+
+    def test_sort_by_rating_uses_stored_average(self) -> None:
+        self.add_review(self.other, 5)
+        self.add_review(self.product, 3)
+
+        query = SortOptions.AVG_RATING_DESC.apply(self.session.query(Product))
+        self.assertNotIn('reviews', str(query.statement.compile()).split('ORDER BY')[0])
+        self.assertEqual([product.samplename for product in query], ['Other', 'Rated'])
+
+
+if __name__ == '__main__':
+    unittest.main()
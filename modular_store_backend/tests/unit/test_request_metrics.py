@@ -0,0 +1,96 @@
+# /modular_store_backend/tests/unit/test_request_metrics.py
+import json
+import unittest
+from datetime import datetime, timedelta
+
+from modular_store_backend.modules.db.models import RequestLog, RequestMetricRollup, RollupWatermark
+from modular_store_backend.modules.request_metrics import (
+    update_request_metric_rollups, get_request_metrics, histogram_percentile, histogram_index, LATENCY_BUCKETS,
+    WATERMARK_NAME
+)
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestRequestMetrics(BaseTest):
+    def add_logs(self, timestamp: datetime, execution_times: list[float], status_code: int = 200):
+        for execution_time in execution_times:
+            self.session.add(RequestLog(ip_address='127.0.0.1', endpoint='main.index', method='GET',
+                                        status_code=status_code, execution_time=execution_time,
+                                        timestamp=timestamp))
+        self.session.commit()
+
+    def test_rollup_builds_minute_and_hour_buckets(self):
+        timestamp = datetime(2024, 7, 1, 12, 30, 15)
+        self.add_logs(timestamp, [0.02, 0.04])
+        self.add_logs(timestamp + timedelta(minutes=5), [0.3], status_code=500)
+
+        self.assertEqual(update_request_metric_rollups(), 3)
+
+        minute_buckets = self.session.query(RequestMetricRollup).filter_by(granularity='minute').all()
+        self.assertEqual(len(minute_buckets), 2)
+        hour_bucket = self.session.query(RequestMetricRollup).filter_by(granularity='hour', status_code=200).one()
+        self.assertEqual(hour_bucket.bucket_start, datetime(2024, 7, 1, 12))
+        self.assertEqual(hour_bucket.request_count, 2)
+        self.assertAlmostEqual(hour_bucket.total_execution_time, 0.06)
+        self.assertEqual(sum(json.loads(hour_bucket.latency_histogram)), 2)
+
+    def test_rollup_is_incremental(self):
+        timestamp = datetime(2024, 7, 1, 12, 30)
+        self.add_logs(timestamp, [0.1])
+        update_request_metric_rollups()
+        self.add_logs(timestamp, [0.1, 0.1])
+
+        self.assertEqual(update_request_metric_rollups(), 2)
+        self.assertEqual(update_request_metric_rollups(), 0)
+
+        hour_bucket = self.session.query(RequestMetricRollup).filter_by(granularity='hour').one()
+        self.assertEqual(hour_bucket.request_count, 3)
+        self.assertEqual(self.session.get(RollupWatermark, WATERMARK_NAME).last_id,
+                         self.session.query(RequestLog).count())
+
+    def test_rollup_stops_after_max_batches(self):
+        self.add_logs(datetime(2024, 7, 1, 12, 30), [0.1] * 5)
+
+        self.assertEqual(update_request_metric_rollups(batch_size=2, max_batches=1), 2)
+        self.assertEqual(update_request_metric_rollups(batch_size=2), 3)
+
+    def test_deleted_log_ids_are_not_reused(self):
+        timestamp = datetime(2024, 7, 1, 12, 30)
+        self.add_logs(timestamp, [0.1, 0.1])
+        update_request_metric_rollups()
+        self.session.query(RequestLog).delete()  # retention emptied the table
+        self.session.commit()
+
+        self.add_logs(timestamp, [0.1])
+        self.assertEqual(update_request_metric_rollups(), 1)
+        self.assertEqual(self.session.query(RequestMetricRollup).filter_by(granularity='hour').one().request_count, 3)
+
+    def test_get_request_metrics(self):
+        day = datetime(2024, 7, 1)
+        self.add_logs(day + timedelta(hours=1), [0.01] * 90 + [2.0] * 10)
+        self.add_logs(day + timedelta(hours=2), [0.5], status_code=404)
+        self.add_logs(day + timedelta(days=2), [0.5])
+        update_request_metric_rollups(batch_size=7)
+
+        metrics = get_request_metrics(day, day + timedelta(days=1) - timedelta(microseconds=1))
+
+        self.assertEqual(metrics['total_requests'], 101)
+        self.assertEqual(metrics['status_code_counts'], {200: 100, 404: 1})
+        self.assertAlmostEqual(metrics['average_execution_time'], (0.9 + 20.0 + 0.5) / 101)
+        self.assertLessEqual(metrics['percentiles'][50], 0.01)
+        self.assertGreater(metrics['percentiles'][99], 1.0)
+
+    def test_histogram_percentile(self):
+        histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        histogram[histogram_index(0.03)] = 100
+        self.assertGreater(histogram_percentile(histogram, 50), 0.025)
+        self.assertLessEqual(histogram_percentile(histogram, 50), 0.05)
+
+        overflow = [0] * (len(LATENCY_BUCKETS) + 1)
+        overflow[histogram_index(60.0)] = 1
+        self.assertEqual(histogram_percentile(overflow, 100, max_value=60.0), 60.0)
+        self.assertEqual(histogram_percentile([0] * len(overflow), 50), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
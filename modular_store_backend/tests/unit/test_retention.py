@@ -0,0 +1,173 @@
+# /modular_store_backend/tests/unit/test_retention.py
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.models import Notification, RecentlyViewedProduct, RequestLog, RollupWatermark
+from modular_store_backend.modules.request_metrics import WATERMARK_NAME
+from modular_store_backend.modules.retention import (
+    RetentionPolicy, apply_retention_policies, apply_retention_policy, policies_from_config, run_retention,
+    sqlite_page_stats
+)
+from modular_store_backend.tests.base_test import BaseTest
+
+NOW = datetime(2026, 10, 18, 12, 0, 0)
+
+
+class TestRetention(BaseTest):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for model in (RecentlyViewedProduct, Notification, RequestLog, RollupWatermark):
+            self.session.query(model).delete()
+        self.session.commit()
+        shutil.rmtree(self.directory)
+
+    def add_recently_viewed(self, user_id, days_ago):
+        for index, days in enumerate(days_ago):
+            self.session.add(RecentlyViewedProduct(user_id=user_id, product_id=index + 1,
+                                                   timestamp=NOW - timedelta(days=days)))
+        self.session.commit()
+
+    def remaining_days(self, user_id):
+        return sorted((NOW - row.timestamp).days for row in
+                      self.session.query(RecentlyViewedProduct).filter_by(user_id=user_id))
+
+    def test_max_age(self):
+        self.add_recently_viewed(1, [1, 10, 100, 200])
+
+        report = apply_retention_policy('recently_viewed_products', RetentionPolicy(max_age_days=30), now=NOW)
+
+        self.assertEqual(report.deleted, 2)
+        self.assertEqual(self.remaining_days(1), [1, 10])
+
+    def test_max_rows_per_user_keeps_newest(self):
+        self.add_recently_viewed(1, [5, 1, 3, 2, 4])
+        self.add_recently_viewed(2, [7, 8])
+
+        report = apply_retention_policy('recently_viewed_products', RetentionPolicy(max_rows_per_user=3), now=NOW)
+
+        self.assertEqual(report.deleted, 2)
+        self.assertEqual(self.remaining_days(1), [1, 2, 3])
+        self.assertEqual(self.remaining_days(2), [7, 8])
+
+    def test_ranks_the_rows_once_per_run(self):
+        self.add_recently_viewed(1, range(1, 11))
+        self.add_recently_viewed(2, range(20, 25))
+        statements = []
+
+        def record(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            report = apply_retention_policy('recently_viewed_products',
+                                            RetentionPolicy(max_age_days=23, max_rows_per_user=2), batch_size=2,
+                                            batch_sleep=0, now=NOW)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        self.assertEqual((report.deleted, report.batches), (11, 6))
+        self.assertEqual(self.remaining_days(1), [1, 2])
+        self.assertEqual(self.remaining_days(2), [20, 21])
+        self.assertEqual(sum('row_number()' in statement.lower() for statement in statements), 1)
+
+    def test_deletes_in_batches(self):
+        self.add_recently_viewed(1, range(100, 110))
+
+        report = apply_retention_policy('recently_viewed_products', RetentionPolicy(max_age_days=30), batch_size=3,
+                                        batch_sleep=0, now=NOW)
+
+        self.assertEqual((report.deleted, report.batches), (10, 4))
+        self.assertEqual(self.session.query(RecentlyViewedProduct).count(), 0)
+
+    def test_request_logs_wait_for_the_rollup(self):
+        for _ in range(4):
+            self.session.add(RequestLog(ip_address='127.0.0.1', endpoint='main.index', method='GET', status_code=200,
+                                        execution_time=0.01, timestamp=NOW - timedelta(days=60)))
+        self.session.commit()
+        first_id = self.session.query(RequestLog.id).order_by(RequestLog.id).first()[0]
+        self.session.add(RollupWatermark(name=WATERMARK_NAME, last_id=first_id + 1))  # two logs rolled up
+        self.session.commit()
+
+        report = apply_retention_policy('request_logs', RetentionPolicy(max_age_days=30), now=NOW)
+
+        self.assertEqual(report.deleted, 2)
+        self.assertEqual(self.session.query(RequestLog).count(), 2)
+
+    def test_file_archive(self):
+        self.add_recently_viewed(1, [1, 100, 200])
+
+        report = apply_retention_policy('recently_viewed_products', RetentionPolicy(max_age_days=30, archive='file'),
+                                        archive_dir=self.directory, compression='gzip', now=NOW)
+
+        self.assertTrue(report.archive_path.endswith('.jsonl.gz'))
+        with gzip.open(report.archive_path, 'rt') as archive:
+            rows = [json.loads(line) for line in archive]
+        self.assertEqual(report.archived, 2)
+        self.assertEqual(sorted(row['product_id'] for row in rows), [2, 3])
+        self.assertEqual(rows[0]['user_id'], 1)
+
+    def test_sqlite_archive(self):
+        cold_storage = os.path.join(self.directory, 'cold', 'cold_storage.db')
+        self.add_recently_viewed(1, [1, 100, 200])
+
+        apply_retention_policy('recently_viewed_products', RetentionPolicy(max_age_days=30, archive='sqlite'),
+                               cold_storage_path=cold_storage, now=NOW)
+
+        connection = sqlite3.connect(cold_storage)
+        try:
+            self.assertEqual(connection.execute(
+                "SELECT product_id FROM recently_viewed_products ORDER BY product_id").fetchall(), [(2,), (3,)])
+        finally:
+            connection.close()
+
+    def test_incremental_vacuum_reclaims_pages(self):
+        self.session.add_all([Notification(user_id=1, message='x' * 2000, created_at=NOW - timedelta(days=400))
+                              for _ in range(200)])
+        self.session.commit()
+        self.assertEqual(sqlite_page_stats(db.engine)['auto_vacuum'], 2)
+
+        report = apply_retention_policies({'notifications': RetentionPolicy(max_age_days=365)}, batch_sleep=0,
+                                          now=NOW)
+
+        self.assertEqual(report.deleted, 200)
+        self.assertEqual(report.vacuum, 'incremental')
+        self.assertGreaterEqual(report.freed_pages, 100)  # two messages per 4 KiB page
+        self.assertEqual(report.reclaimed_bytes, report.freed_pages * sqlite_page_stats(db.engine)['page_size'])
+        self.assertEqual(sqlite_page_stats(db.engine)['freelist_count'], 0)
+        self.assertIn('incremental vacuum reclaimed', report.summary())
+
+    def test_policies_from_config(self):
+        policies = policies_from_config({'RETENTION_POLICIES': {'notifications': {'max_rows_per_user': 10}}})
+        self.assertEqual(policies['notifications'].max_rows_per_user, 10)
+
+        with self.assertRaises(ValueError):
+            policies_from_config({'RETENTION_POLICIES': {'users': {'max_age_days': 1}}})
+        with self.assertRaises(ValueError):
+            RetentionPolicy(archive='tape')
+
+    @patch('modular_store_backend.modules.retention.logging.info')
+    def test_run_retention_uses_config(self, mock_logging_info):
+        self.add_recently_viewed(1, range(60))
+        with patch.dict(self.app.config, {'RETENTION_POLICIES': {'recently_viewed_products': {'max_rows_per_user': 50}},
+                                          'RETENTION_BATCH_SLEEP': 0}):
+            report = run_retention(self.app)
+
+        self.assertEqual(report.deleted, 10)
+        mock_logging_info.assert_called_once()
+        self.assertIn('10 rows deleted', mock_logging_info.call_args[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
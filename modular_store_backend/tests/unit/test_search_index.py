@@ -0,0 +1,168 @@
+# /modular_store_backend/tests/unit/test_search_index.py
+import unittest
+
+from modular_store_backend.modules.db.models import Category, Product, Tag
+from modular_store_backend.modules.filter.utils import filter_products, search_snippets, select_products
+from modular_store_backend.modules.search_index import ProductSearchIndex, edit_distance, product_search_index
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestProductSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = ProductSearchIndex()
+        self.index.build([
+            (1, 'Wireless Headphones', 'Noise cancelling over-ear', 'audio', 'Electronics'),
+            (2, 'Desk Lamp', 'Warm light for the office', '', 'Home'),
+            (3, 'Reading Light', 'Clip-on lamp for books', 'gift', 'Home'),
+            (4, 'Café Grinder', 'Burr coffee grinder', '', 'Kitchen'),
+        ])
+
+    def test_exact_prefix_and_diacritics(self):
+        self.assertEqual(self.index.search('headphones'), [1])
+        self.assertEqual(self.index.search('headph'), [1])
+        self.assertEqual(self.index.search('CAFE'), [4])
+
+    def test_typos(self):
+        self.assertEqual(self.index.search('hedphones'), [1])  # deletion
+        self.assertEqual(self.index.search('wirelses'), [1])  # transposition
+        self.assertEqual(self.index.search('grindr'), [4])
+        self.assertEqual(self.index.search('hdaephnoes'), [])  # too far off
+        self.assertEqual(self.index.search('lmp'), [2, 3])
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.index.search('lamp'), [2, 3])
+        self.assertEqual(self.index.search('light'), [3, 2])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.index.search('lamp home'), [2, 3])
+        self.assertEqual(self.index.search('lamp books'), [3])
+        self.assertEqual(self.index.search('lamp kitchen'), [])
+        self.assertEqual(self.index.search('?!'), [])
+
+    def test_updates(self):
+        self.index.update(2, ('Desk Lantern', '', '', 'Home'))
+        self.index.update(5, ('Camping Lamp', '', '', 'Outdoor'))
+        self.index.update(3, None)
+
+        self.assertEqual(self.index.search('lamp'), [5])
+        self.assertEqual(self.index.search('lantern'), [2])
+        self.assertEqual(self.index.search('books'), [])
+        self.assertEqual(self.index.search('camp'), [5])
+        self.assertEqual(len(self.index), 4)
+
+    def test_build_replays_updates_made_during_the_build(self):
+        def documents():
+            yield 1, 'Tent', '', '', ''
+            self.index.update(2, ('Tarp', '', '', ''))
+
+        self.assertEqual(self.index.build(documents()), 2)
+
+        self.assertEqual(self.index.search('tarp'), [2])
+        self.assertEqual(self.index.search('headphones'), [])
+
+    def test_max_results(self):
+        index = ProductSearchIndex(max_results=2)
+        index.build((product_id, 'Mug', '', '', '') for product_id in range(1, 6))
+
+        self.assertEqual(index.search('mug'), [1, 2])
+        self.assertEqual(index.search('mugs'), [1, 2])
+        self.assertEqual(index.search('mug', limit=1), [1])
+        self.assertEqual(index.search('mug', complete=True), [1, 2, 3, 4, 5])
+        self.assertEqual(index.search('mug cup', complete=True), [])
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance('lamp', 'lamp', 1), 0)
+        self.assertEqual(edit_distance('lmap', 'lamp', 1), 1)
+        self.assertEqual(edit_distance('kitten', 'sittin', 2), 2)
+        self.assertEqual(edit_distance('kitten', 'sitting', 2), 3)
+
+
+class TestSearchIndexSync(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.category = Category(name='Outdoor Gear')
+        self.tag = Tag(name='waterproof')
+        self.session.add_all([self.category, self.tag])
+        self.session.commit()
+
+    def add_product(self, name, description='', tags=()):
+        product = Product(samplename=name, description=description, category_id=self.category.id, stock=5,
+                          price=1000)
+        product.tags.extend(tags)
+        self.session.add(product)
+        self.session.commit()
+        return product
+
+    def test_commits_update_the_index(self):
+        product = self.add_product('Trail Backpack', tags=[self.tag])
+        self.assertEqual(product_search_index.search('backpak'), [product.id])
+
+        product.samplename = 'Trail Rucksack'
+        self.session.commit()
+        self.assertEqual(product_search_index.search('backpack'), [])
+        self.assertEqual(product_search_index.search('rucksak'), [product.id])
+
+        self.tag.name = 'windproof'
+        self.category.name = 'Camping'
+        self.session.commit()
+        self.assertEqual(product_search_index.search('windproof camping'), [product.id])
+
+        self.session.delete(self.tag)
+        self.session.commit()
+        self.assertEqual(product_search_index.search('windproof'), [])
+
+        self.session.delete(product)
+        self.session.commit()
+        self.assertEqual(product_search_index.search('rucksack'), [])
+
+    def test_rollback_leaves_the_index_alone(self):
+        product = self.add_product('Tent')
+
+        product.samplename = 'Hammock'
+        self.session.flush()
+        self.session.rollback()
+
+        self.assertEqual(product_search_index.search('tent'), [product.id])
+        self.assertEqual(product_search_index.search('hammock'), [])
+
+    def test_filter_products_and_snippets(self):
+        self.add_product('Desk Lamp', 'Bright lamp')
+        lantern = self.add_product('Lantern', 'A lamp for the tent')
+        self.add_product('Coffee Mug')
+
+        products = filter_products(name_query='lamo').all()
+        self.assertEqual([product.samplename for product in products], ['Desk Lamp', 'Lantern'])
+        self.assertEqual(filter_products(name_query='lamo', sort_by='price_asc').count(), 2)
+        self.assertEqual(filter_products(name_query='xyzzy').all(), [])
+
+        snippets = search_snippets([lantern], 'lamo')
+        self.assertEqual(str(snippets[lantern.id]), 'A <mark>lamp</mark> for the tent')
+
+    def test_filters_and_sorts_apply_to_every_match(self):
+        garden = Category(name='Garden')
+        self.session.add(garden)
+        self.session.commit()
+        for _ in range(3):
+            self.add_product('Lamp', 'Lamp')
+        lower = [self.add_product('Stand', 'Lamp') for _ in range(2)]  # matches ranked below the cut
+        for product, price in zip(lower, (100, 200)):
+            product.category_id, product.price = garden.id, price
+        self.session.commit()
+
+        max_results, product_search_index.max_results = product_search_index.max_results, 2
+        try:
+            lower_ids = [product.id for product in lower]
+            self.assertEqual(select_products(name_query='lamp', category_query=garden.id).product_ids.tolist(),
+                             lower_ids)
+            self.assertEqual([product.id for product in filter_products(name_query='lamp',
+                                                                        category_query=garden.id)], lower_ids)
+            by_price = select_products(name_query='lamp', sort_by='price_asc').product_ids.tolist()
+            self.assertEqual(len(by_price), 5)
+            self.assertEqual(by_price[:2], lower_ids)
+            self.assertEqual(filter_products(name_query='lamp', sort_by='price_asc').count(), 5)
+        finally:
+            product_search_index.max_results = max_results
+
+
+if __name__ == '__main__':
+    unittest.main()
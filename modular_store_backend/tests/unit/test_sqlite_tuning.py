@@ -0,0 +1,62 @@
+# /modular_store_backend/tests/unit/test_sqlite_tuning.py
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, text
+
+from modular_store_backend.modules.db.database import db
+from modular_store_backend.modules.db.sqlite_tuning import apply_sqlite_pragmas, get_sqlite_pragmas, optimize_sqlite
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestSqliteTuning(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.db_dir = tempfile.mkdtemp()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.db_dir, 'tuned.db')}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        for name in os.listdir(self.db_dir):
+            os.remove(os.path.join(self.db_dir, name))
+        os.rmdir(self.db_dir)
+        super().tearDown()
+
+    def pragma(self, engine, name):
+        with engine.connect() as connection:
+            return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+    def test_pragmas_are_applied_on_connect(self):
+        apply_sqlite_pragmas(self.engine, {'busy_timeout': 1234})
+
+        self.assertEqual(self.pragma(self.engine, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(self.engine, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(self.engine, 'temp_store'), 2)  # MEMORY
+        self.assertEqual(self.pragma(self.engine, 'busy_timeout'), 1234)
+
+    def test_none_disables_a_pragma(self):
+        pragmas = get_sqlite_pragmas(self.engine, {'mmap_size': None})
+        self.assertNotIn('mmap_size', pragmas)
+        self.assertEqual(pragmas['journal_mode'], 'WAL')
+
+    def test_in_memory_database_skips_file_pragmas(self):
+        pragmas = get_sqlite_pragmas(db.engine)
+        self.assertNotIn('journal_mode', pragmas)
+        self.assertEqual(self.pragma(db.engine, 'temp_store'), 2)
+
+    def test_optimize_checkpoints_the_wal(self):
+        apply_sqlite_pragmas(self.engine)
+        with self.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY)"))
+            connection.execute(text("INSERT INTO items (id) VALUES (1)"))
+
+        optimize_sqlite(self.engine)
+
+        with self.engine.connect() as connection:
+            busy, log_pages, checkpointed = connection.execute(text("PRAGMA wal_checkpoint(PASSIVE)")).one()
+        self.assertEqual(log_pages, checkpointed)
+
+
+if __name__ == '__main__':
+    unittest.main()
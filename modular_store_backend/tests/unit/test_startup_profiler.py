@@ -0,0 +1,40 @@
+# /modular_store_backend/tests/unit/test_startup_profiler.py
+import unittest
+
+from modular_store_backend.modules.startup_profiler import StartupProfiler, parse_import_times, profile_imports
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestStartupProfiler(BaseTest):
+    def test_create_app_records_stages(self):
+        profiler = self.app.extensions['startup_profile']
+        stages = [name for name, _ in profiler.stages]
+
+        self.assertEqual(stages[:2], ['config', 'db.init_db'])
+        self.assertIn('extensions', stages)
+        self.assertIn('blueprints', stages)
+        self.assertIn('blueprints', profiler.format_report())
+
+    def test_stage_is_recorded_on_error(self):
+        profiler = StartupProfiler()
+        with self.assertRaises(RuntimeError):
+            with profiler.stage('failing'):
+                raise RuntimeError()
+        self.assertEqual(profiler.stages[0][0], 'failing')
+
+    def test_parse_import_times(self):
+        output = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       100 |        100 |   flask.json\n"
+                  "import time:       400 |        500 | flask\n"
+                  "import time:      1000 |       1000 | pandas\n")
+        self.assertEqual(parse_import_times(output), {'flask': 0.0005, 'pandas': 0.001})
+
+    def test_app_import_skips_reporting_dependencies(self):
+        imports = profile_imports()
+        self.assertIn('flask', imports)
+        for package in ('pandas', 'ydata_profiling', 'openpyxl'):
+            self.assertNotIn(package, imports)
+
+
+if __name__ == '__main__':
+    unittest.main()
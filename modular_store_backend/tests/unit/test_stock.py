@@ -0,0 +1,89 @@
+# /modular_store_backend/tests/unit/test_stock.py
+import unittest
+
+from modular_store_backend.benchmarks.stock_concurrency import run_benchmark
+from modular_store_backend.modules.db.models import Product, Purchase, PurchaseItem
+from modular_store_backend.modules.stock import release_stock, reserve_stock
+from modular_store_backend.tests.base_test import BaseTest
+
+
+class TestStock(BaseTest):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.first = Product(samplename='First', price=1000, stock=5)
+        self.second = Product(samplename='Second', price=1000, stock=1)
+        self.session.add_all([self.first, self.second])
+        self.session.commit()
+
+    def test_reserve_decrements_every_line(self) -> None:
+        reservation = reserve_stock([(self.first.id, 2), (self.second.id, 1)])
+        self.session.commit()
+
+        self.assertTrue(reservation.ok)
+        self.assertTrue(reservation.applied)
+        self.assertEqual(self.first.stock, 3)
+        self.assertEqual(self.second.stock, 0)
+
+    def test_failed_line_releases_the_order(self) -> None:
+        reservation = reserve_stock([(self.first.id, 2), (self.second.id, 2)])
+        self.session.commit()
+
+        self.assertFalse(reservation.ok)
+        self.assertFalse(reservation.applied)
+        self.assertEqual([(line.product_id, line.reserved) for line in reservation.lines],
+                         [(self.first.id, True), (self.second.id, False)])
+        self.assertEqual([line.product_id for line in reservation.failed], [self.second.id])
+        self.assertEqual(self.first.stock, 5)
+        self.assertEqual(self.second.stock, 1)
+
+    def test_partial_reservation(self) -> None:
+        reservation = reserve_stock([(self.first.id, 2), (self.second.id, 2)], all_or_nothing=False)
+        self.session.commit()
+
+        self.assertTrue(reservation.applied)
+        self.assertEqual(self.first.stock, 3)
+        self.assertEqual(self.second.stock, 1)
+
+    def test_lines_of_the_same_product_are_guarded_together(self) -> None:
+        reservation = reserve_stock([(self.first.id, 3), (self.first.id, 3)])
+
+        self.assertFalse(reservation.ok)
+        self.assertEqual(len(reservation.lines), 1)
+        self.assertEqual(self.first.stock, 5)
+
+    def test_unknown_product_fails(self) -> None:
+        self.assertFalse(reserve_stock([(999, 1)]).ok)
+
+    def test_release_stock(self) -> None:
+        release_stock([(self.first.id, 2), (self.first.id, 1)])
+        self.session.commit()
+        self.assertEqual(self.first.stock, 8)
+
+    def test_purchase_update_stock(self) -> None:
+        purchase = Purchase(user_id=1, total_price=3000)
+        purchase.items = [PurchaseItem(product_id=self.first.id, quantity=2, price=1000),
+                          PurchaseItem(product_id=self.second.id, quantity=1, price=1000)]
+        self.session.add(purchase)
+        self.session.commit()
+
+        self.assertTrue(Purchase.update_stock(purchase))
+        self.assertEqual((self.first.stock, self.second.stock), (3, 0))
+        self.assertFalse(Purchase.update_stock(purchase))
+        self.assertEqual((self.first.stock, self.second.stock), (3, 0))
+
+        self.assertTrue(Purchase.update_stock(purchase, reverse=True))
+        self.assertEqual((self.first.stock, self.second.stock), (5, 1))
+
+    def test_parallel_checkouts_do_not_oversell(self) -> None:
+        result = run_benchmark('guarded UPDATE', threads=8, products=2, stock=20, duration=0.5)
+
+        self.assertEqual(result['worker failures'], [])
+        self.assertGreater(result['checkouts'], 0)
+        self.assertEqual(result['oversold units'], 0)
+        self.assertEqual(result['lost updates'], 0)
+        self.assertEqual(result['negative stock'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from modular_store_backend.modules.db.wal_archive import (
+    ArchiveLockedError, ArchiveState, archive_lock, archive_wal, close_keepalive_connections, list_generations,
+    read_wal_header, restore_to_time, run_wal_archive, wal_checksum
+)
+
+
+class TestWalArchive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.directory, 'test.db')
+        self.archive_dir = os.path.join(self.directory, 'archive')
+        # An application connection as configured while archiving: WAL mode without automatic checkpoints
+        self.connection = sqlite3.connect(self.db_path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA wal_autocheckpoint=0")
+        self.connection.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT)")
+        self.now = datetime(2026, 10, 18, 12, 0, 0)
+
+    def tearDown(self):
+        self.connection.close()
+        close_keepalive_connections()
+        shutil.rmtree(self.directory)
+
+    def insert(self, rows):
+        self.connection.execute("BEGIN")
+        self.connection.executemany("INSERT INTO products (name) VALUES (?)", [('x' * 200,)] * rows)
+        self.connection.execute("COMMIT")
+
+    def archive(self, minutes, **kwargs):
+        return archive_wal(self.db_path, self.archive_dir, compression='gzip',
+                           now=self.now + timedelta(minutes=minutes), **kwargs)
+
+    def restored_rows(self, minutes=None):
+        until = None if minutes is None else self.now + timedelta(minutes=minutes)
+        path = os.path.join(self.directory, 'restored.db')
+        result = restore_to_time(self.archive_dir, path, until)
+        self.assertTrue(result.verified)
+        connection = sqlite3.connect(path)
+        try:
+            return connection.execute("SELECT count(*) FROM products").fetchone()[0]
+        finally:
+            connection.close()
+
+    def test_wal_checksum_matches_sqlite(self):
+        self.insert(10)
+        header = read_wal_header(f'{self.db_path}-wal')
+
+        with open(f'{self.db_path}-wal', 'rb') as wal:
+            data = wal.read(32)
+        self.assertEqual(wal_checksum(data[:24], (0, 0), header.big_endian), header.checksum)
+        self.assertEqual(header.page_size, 4096)
+
+    def test_restore_to_each_archive_run(self):
+        self.insert(100)
+        first = self.archive(0)
+        self.insert(500)
+        second = self.archive(1)
+        self.insert(300)
+        self.archive(2)
+
+        self.assertTrue(first.new_generation)
+        self.assertFalse(second.new_generation)
+        self.assertEqual(second.commits, 1)
+        self.assertEqual(self.restored_rows(0), 100)
+        self.assertEqual(self.restored_rows(1), 600)
+        self.assertEqual(self.restored_rows(1.5), 600)
+        self.assertEqual(self.restored_rows(), 900)
+        with self.assertRaises(ValueError):
+            self.restored_rows(-1)
+
+    def test_archiver_checkpoint_keeps_the_generation(self):
+        self.archive(0)
+        for minutes in range(1, 6):
+            self.insert(200)
+            result = self.archive(minutes, checkpoint_pages=20)
+            self.assertFalse(result.new_generation)
+
+        self.assertLess(os.path.getsize(f'{self.db_path}-wal'), 100 * 4096)  # restarted instead of growing
+        self.assertEqual(len(list_generations(self.archive_dir)), 1)
+        self.assertEqual(self.restored_rows(3), 600)
+        self.assertEqual(self.restored_rows(), 1000)
+
+    def test_foreign_checkpoint_starts_new_generation(self):
+        self.insert(100)
+        self.archive(0)
+        self.insert(50)  # never archived: the checkpoint below moves it out of the WAL
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.insert(10)
+
+        result = self.archive(1)
+
+        self.assertTrue(result.new_generation)
+        self.assertIn('checkpoint', result.reason)
+        self.assertEqual(len(list_generations(self.archive_dir)), 2)
+        self.assertEqual(self.restored_rows(), 160)
+
+    def test_base_interval_and_retention(self):
+        for minutes in range(4):
+            self.insert(10)
+            self.archive(minutes, base_interval=60, keep_generations=2)
+
+        self.assertEqual([start for start, _ in list_generations(self.archive_dir)],
+                         [self.now + timedelta(minutes=2), self.now + timedelta(minutes=3)])
+        self.assertEqual(ArchiveState.load(self.archive_dir).generation, '20261018_120300_000000')
+
+    def test_archive_under_concurrent_writes(self):
+        self.archive(0)
+        stop = threading.Event()
+
+        def write():
+            connection = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA wal_autocheckpoint=0")
+            while not stop.is_set():
+                connection.execute("INSERT INTO products (name) VALUES ('concurrent')")
+                time.sleep(0.001)
+            connection.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            for minutes in range(1, 20):
+                self.archive(minutes, checkpoint_pages=5)
+        finally:
+            stop.set()
+            writer.join()
+        self.archive(20)
+
+        rows = self.connection.execute("SELECT count(*) FROM products").fetchone()[0]
+        self.assertEqual(self.restored_rows(), rows)
+
+    def test_concurrent_runs_keep_the_archive_consistent(self):
+        self.archive(0)
+        app = MagicMock()
+        app.config = {'DB_PATH': self.db_path, 'WAL_ARCHIVE_DIR': self.archive_dir, 'BACKUP_COMPRESSION': 'gzip',
+                      'WAL_ARCHIVE_CHECKPOINT_PAGES': 5}
+
+        def run():  # the scheduler jobs of two workers
+            connection = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA wal_autocheckpoint=0")
+            for _ in range(10):
+                connection.execute("INSERT INTO products (name) VALUES ('archived')")
+                run_wal_archive(app)
+            connection.close()
+
+        runners = [threading.Thread(target=run) for _ in range(2)]
+        for runner in runners:
+            runner.start()
+        for runner in runners:
+            runner.join()
+        self.archive(1)
+
+        self.assertEqual(len(list_generations(self.archive_dir)), 1)
+        self.assertEqual(self.restored_rows(), 20)
+
+    @patch('modular_store_backend.modules.db.wal_archive.logging.info')
+    def test_runs_are_skipped_while_another_holds_the_lock(self, mock_logging_info):
+        self.archive(0)
+        self.connection.execute("INSERT INTO products (name) VALUES ('locked out')")
+        app = MagicMock()
+        app.config = {'DB_PATH': self.db_path, 'WAL_ARCHIVE_DIR': self.archive_dir, 'BACKUP_COMPRESSION': 'gzip'}
+
+        with archive_lock(self.archive_dir):
+            with self.assertRaises(ArchiveLockedError):
+                self.archive(1)
+            self.assertIsNone(run_wal_archive(app))
+            mock_logging_info.assert_called_once()
+
+        self.assertEqual(self.archive(2).commits, 1)
+        self.assertEqual(self.restored_rows(), 1)
+
+    @patch('modular_store_backend.modules.db.wal_archive.logging.error')
+    def test_run_wal_archive_logs_errors(self, mock_logging_error):
+        app = MagicMock()
+        app.config = {'DB_PATH': os.path.join(self.directory, 'missing', 'test.db'),
+                      'WAL_ARCHIVE_DIR': self.archive_dir, 'BACKUP_COMPRESSION': 'gzip'}
+
+        self.assertIsNone(run_wal_archive(app))
+        mock_logging_error.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()